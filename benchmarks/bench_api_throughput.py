@@ -0,0 +1,82 @@
+"""
+Rendimiento de la API compatible con OpenAI bajo carga concurrente.
+
+Sirve para comparar el modo con hilos y el modo supervisado por procesos:
+
+    RUN_MODE=threads python src/main.py      # en otra terminal
+    python benchmarks/bench_api_throughput.py --label hilos
+
+    RUN_MODE=processes python src/main.py    # en otra terminal
+    python benchmarks/bench_api_throughput.py --label procesos
+"""
+import argparse
+import json
+import os
+import sys
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.config.settings import FASTCHAT_CONFIG
+
+PROMPTS = [
+    "Últimamente me siento ansioso. ¿Podrías ayudarme?",
+    "El estrés me está afectando mucho últimamente.",
+    "Me gustaría aprender algunas técnicas para relajarme.",
+    "Estoy teniendo dificultades en mis relaciones personales.",
+]
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(fraction * len(values)))] if values else 0.0
+
+def send_request(url, model, prompt, max_tokens):
+    payload = json.dumps({
+        "model": model,
+        "messages": [{"role": "user", "content": prompt}],
+        "max_tokens": max_tokens,
+        "temperature": 0.7,
+    }).encode()
+    request = urllib.request.Request(url, data=payload, headers={"Content-Type": "application/json"})
+    start = time.perf_counter()
+    with urllib.request.urlopen(request, timeout=600) as response:
+        body = json.loads(response.read())
+    return time.perf_counter() - start, body.get("usage", {}).get("completion_tokens", 0)
+
+def main():
+    cfg = FASTCHAT_CONFIG["api_server"]
+    parser = argparse.ArgumentParser(description="Benchmark de rendimiento de la API")
+    parser.add_argument("--url", type=str, default=f"http://{cfg['host']}:{cfg['port']}/v1/chat/completions")
+    parser.add_argument("--model", type=str, default=FASTCHAT_CONFIG["model_worker"]["model_names"][0])
+    parser.add_argument("--requests", type=int, default=32, help="Peticiones totales")
+    parser.add_argument("--concurrency", type=int, default=8, help="Peticiones simultáneas")
+    parser.add_argument("--max-tokens", type=int, default=64, help="Tokens por respuesta")
+    parser.add_argument("--label", type=str, default="", help="Etiqueta de la ejecución (ej. hilos/procesos)")
+    args = parser.parse_args()
+
+    latencies, tokens, errors = [], 0, 0
+    start = time.perf_counter()
+    with ThreadPoolExecutor(args.concurrency) as pool:
+        futures = [
+            pool.submit(send_request, args.url, args.model, PROMPTS[i % len(PROMPTS)], args.max_tokens)
+            for i in range(args.requests)
+        ]
+        for future in futures:
+            try:
+                latency, completion_tokens = future.result()
+                latencies.append(latency)
+                tokens += completion_tokens
+            except Exception as e:
+                errors += 1
+                print(f"⚠️ Error en la petición: {e}")
+    elapsed = time.perf_counter() - start
+
+    label = f" [{args.label}]" if args.label else ""
+    print(f"📊 API{label}: {args.requests} peticiones, concurrencia {args.concurrency}")
+    print(f"   Peticiones/s: {len(latencies) / elapsed:.2f}   Tokens/s: {tokens / elapsed:.1f}   Errores: {errors}")
+    print(f"   Latencia p50: {percentile(latencies, 0.5):.2f}s   p95: {percentile(latencies, 0.95):.2f}s   p99: {percentile(latencies, 0.99):.2f}s")
+
+if __name__ == "__main__":
+    main()
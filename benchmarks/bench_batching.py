@@ -0,0 +1,75 @@
+"""
+Compara el batching continuo con la generación de una secuencia cada vez
+(max_batch_size=1, equivalente al trabajador sin batching), ejecutando el
+planificador en el propio proceso con varias peticiones simultáneas.
+
+Con un modelo pequeño se puede probar en CPU:
+
+    python benchmarks/bench_batching.py --model facebook/opt-125m --requests 16 --batch-size 8
+"""
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.fastchat.model_worker import ContinuousBatchingScheduler
+from bench_api_throughput import PROMPTS, percentile
+
+def run(model, tokenizer, batch_size, requests, max_tokens):
+    """Lanza todas las peticiones a la vez y mide tokens/s agregados y TTFT por petición"""
+    scheduler = ContinuousBatchingScheduler(model, tokenizer, "cpu", max_batch_size=batch_size, stream_interval=1)
+
+    def one(index):
+        params = {
+            "prompt": PROMPTS[index % len(PROMPTS)],
+            "temperature": 0.0,
+            "max_new_tokens": max_tokens,
+            "echo": False,
+        }
+        start = time.perf_counter()
+        ttft = None
+        tokens = 0
+        for output in scheduler.generate_stream(params):
+            if ttft is None:
+                ttft = time.perf_counter() - start
+            tokens = output.get("usage", {}).get("completion_tokens", tokens)
+        return ttft, tokens
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=requests) as pool:
+        results = list(pool.map(one, range(requests)))
+    elapsed = time.perf_counter() - start
+    ttfts = [ttft for ttft, _ in results if ttft is not None]
+    tokens = sum(tokens for _, tokens in results)
+    return {
+        "tokens_per_s": tokens / elapsed,
+        "ttft_p50": percentile(ttfts, 0.5),
+        "ttft_p95": percentile(ttfts, 0.95),
+        "elapsed": elapsed,
+        "avg_batch_size": scheduler.metrics()["avg_batch_size"],
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark del batching continuo")
+    parser.add_argument("--model", type=str, default="facebook/opt-125m", help="Modelo de Hugging Face o ruta local")
+    parser.add_argument("--requests", type=int, default=16, help="Peticiones simultáneas")
+    parser.add_argument("--batch-size", type=int, default=8, help="max_batch_size del planificador")
+    parser.add_argument("--max-tokens", type=int, default=64, help="Tokens por respuesta")
+    args = parser.parse_args()
+
+    from transformers import AutoModelForCausalLM, AutoTokenizer
+    print(f"🔄 Cargando {args.model}...")
+    tokenizer = AutoTokenizer.from_pretrained(args.model)
+    model = AutoModelForCausalLM.from_pretrained(args.model).eval()
+
+    print(f"{'modo':<22} {'tokens/s':>10} {'TTFT p50':>10} {'TTFT p95':>10} {'lote medio':>11} {'total':>8}")
+    for label, batch_size in (("sin batching", 1), (f"batching ({args.batch_size})", args.batch_size)):
+        result = run(model, tokenizer, batch_size, args.requests, args.max_tokens)
+        print(f"{label:<22} {result['tokens_per_s']:>10.1f} {result['ttft_p50']:>9.2f}s "
+              f"{result['ttft_p95']:>9.2f}s {result['avg_batch_size']:>11.1f} {result['elapsed']:>7.1f}s")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+"""
+Coste de montar el prompt de cada turno según la longitud de la conversación.
+
+Compara ConversationBuilder (cada turno se tokeniza una vez) con volver a
+tokenizar todo el historial en cada mensaje. Sin --model se usa el contador
+aproximado; con un tokenizador real la diferencia es mayor:
+
+    python benchmarks/bench_conversation.py --turns 10 50 200 1000
+    python benchmarks/bench_conversation.py --model lmsys/vicuna-7b-v1.5
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.utils.prompts import ConversationBuilder, PAST_TURN_TEMPLATE, USER_TURN_TEMPLATE, get_prompt_prefix, token_counter
+from bench_api_throughput import PROMPTS
+
+REPLY = "Entiendo cómo te sientes. ¿Podrías contarme un poco más sobre cuándo empezó?"
+
+def incremental(turns, count_tokens):
+    """Tiempo medio por mensaje con ConversationBuilder"""
+    builder = ConversationBuilder(count_tokens=count_tokens)
+    start = time.perf_counter()
+    for index in range(turns):
+        message = PROMPTS[index % len(PROMPTS)]
+        builder.build(message)
+        builder.add_turn(message, REPLY)
+    return (time.perf_counter() - start) / turns, builder.last_stats
+
+def naive(turns, count_tokens):
+    """Tiempo medio por mensaje tokenizando todo el historial cada vez"""
+    history = []
+    start = time.perf_counter()
+    for index in range(turns):
+        message = PROMPTS[index % len(PROMPTS)]
+        prompt = get_prompt_prefix() + "".join(history) + USER_TURN_TEMPLATE.format(message=message)
+        count_tokens(prompt)
+        history.append(PAST_TURN_TEMPLATE.format(user=message, assistant=REPLY))
+    return (time.perf_counter() - start) / turns
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark del montaje de conversaciones")
+    parser.add_argument("--turns", type=int, nargs="+", default=[10, 50, 200, 1000], help="Longitudes de conversación")
+    parser.add_argument("--model", type=str, default=None, help="Tokenizador de Hugging Face (opcional)")
+    args = parser.parse_args()
+
+    tokenizer = None
+    if args.model:
+        from transformers import AutoTokenizer
+        tokenizer = AutoTokenizer.from_pretrained(args.model)
+    count_tokens = token_counter(tokenizer)
+
+    print(f"{'turnos':>7} {'incremental':>13} {'retokenizar':>13} {'conservados':>12} {'resumen':>8}")
+    for turns in args.turns:
+        per_message, stats = incremental(turns, count_tokens)
+        per_message_naive = naive(turns, count_tokens)
+        print(f"{turns:>7} {per_message * 1e3:>11.3f}ms {per_message_naive * 1e3:>11.3f}ms "
+              f"{stats['kept_turns']:>12} {'sí' if stats['summarized'] else 'no':>8}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+"""
+Velocidad y memoria del perfil de CPU (CPU_PROFILE=true) frente a la
+inferencia en float32 de siempre.
+
+Cada perfil se mide en un proceso nuevo (los hilos de torch y la afinidad
+solo se pueden fijar una vez por proceso): tiempo hasta el primer token
+(TTFT), tokens/s de la decodificación voraz con caché KV y memoria residente.
+
+    python benchmarks/bench_cpu_profile.py --model lmsys/vicuna-7b-v1.5 --tokens 64
+"""
+import argparse
+import multiprocessing
+import os
+import sys
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.config.settings import FASTCHAT_CONFIG
+
+PROMPT = ("A chat between a curious user and an artificial intelligence assistant. "
+          "USER: Últimamente me cuesta dormir y estoy muy nervioso por los exámenes. ¿Qué puedo hacer? ASSISTANT:")
+
+# (nombre, perfil de CPU o None para la ruta float32 de siempre)
+PROFILES = [
+    ("float32", None),
+    ("bfloat16", {"quantization": "none", "bf16": "true"}),
+    ("int8", {"quantization": "int8", "bf16": "false"}),
+]
+
+def measure(model_path, profile, tokens, runs, results):
+    import torch
+    from transformers import AutoModelForCausalLM, AutoTokenizer
+    from src.utils.environment import process_memory
+    from src.utils.safetensors_io import resolve_model_dir
+    from src.fastchat.cpu_profile import configure_threads, profile_dtype, apply_cpu_profile
+
+    if profile is None:
+        torch.set_num_threads(os.cpu_count() or 1)
+        dtype = "float32"
+    else:
+        configure_threads()
+        dtype = profile_dtype(profile)
+    model_dir = resolve_model_dir(model_path) or model_path
+    start = time.perf_counter()
+    model = AutoModelForCausalLM.from_pretrained(model_dir, torch_dtype=getattr(torch, dtype), low_cpu_mem_usage=True)
+    if profile is not None:
+        model = apply_cpu_profile(model, profile)
+    model.eval()
+    load_seconds = time.perf_counter() - start
+    tokenizer = AutoTokenizer.from_pretrained(model_dir, use_fast=False)
+    input_ids = tokenizer(PROMPT, return_tensors="pt").input_ids
+
+    ttfts, rates = [], []
+    with torch.inference_mode():
+        # La primera pasada reserva memoria y prepara los núcleos: no se cuenta
+        model(input_ids[:, :8])
+        for _ in range(runs):
+            start = time.perf_counter()
+            out = model(input_ids, use_cache=True)
+            token = out.logits[:, -1].argmax(-1, keepdim=True)
+            ttfts.append(time.perf_counter() - start)
+            past = out.past_key_values
+            start = time.perf_counter()
+            for _ in range(tokens - 1):
+                out = model(token, past_key_values=past, use_cache=True)
+                past = out.past_key_values
+                token = out.logits[:, -1].argmax(-1, keepdim=True)
+            rates.append((tokens - 1) / (time.perf_counter() - start))
+    results.put({
+        "load_seconds": load_seconds,
+        "ttft": sorted(ttfts)[len(ttfts) // 2],
+        "tokens_per_s": sorted(rates)[len(rates) // 2],
+        "threads": torch.get_num_threads(),
+        "memory": process_memory(),
+    })
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark del perfil de inferencia en CPU")
+    parser.add_argument("--model", type=str, default=FASTCHAT_CONFIG["model_worker"]["model_path"])
+    parser.add_argument("--tokens", type=int, default=64, help="Tokens generados por ejecución")
+    parser.add_argument("--runs", type=int, default=3, help="Ejecuciones por perfil (se informa la mediana)")
+    parser.add_argument("--profiles", type=str, default=",".join(name for name, _ in PROFILES),
+                        help="Perfiles a medir, separados por comas")
+    args = parser.parse_args()
+
+    from src.fastchat.cpu_profile import read_cpuinfo, bf16_supported, physical_core_cpus
+    info = read_cpuinfo()
+    print(f"🖥️ {info['model'] or 'CPU'}: {len(physical_core_cpus(info))} núcleos físicos, "
+          f"{os.cpu_count()} CPUs lógicas, bfloat16 nativo: {'sí' if bf16_supported(info) else 'no'}")
+
+    context = multiprocessing.get_context("spawn")
+    wanted = args.profiles.split(",")
+    baseline = None
+    for name, profile in PROFILES:
+        if name not in wanted:
+            continue
+        results = context.Queue()
+        process = context.Process(target=measure, args=(args.model, profile, args.tokens, args.runs, results))
+        process.start()
+        report = results.get()
+        process.join()
+        baseline = baseline or report
+        print(f"\n📊 {name} ({report['threads']} hilos, carga {report['load_seconds']:.1f}s):")
+        print(f"   TTFT:       {report['ttft'] * 1000:8.0f} ms")
+        print(f"   Tokens/s:   {report['tokens_per_s']:8.2f}  (x{report['tokens_per_s'] / baseline['tokens_per_s']:.2f})")
+        print(f"   Residente:  {report['memory']['rss_mb'] or 0:8.0f} MB")
+
+if __name__ == "__main__":
+    main()
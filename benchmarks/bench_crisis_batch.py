@@ -0,0 +1,47 @@
+"""
+Benchmark de detect_crisis_batch: mensajes por segundo con 1, 4 y N procesos.
+
+Uso:
+    python benchmarks/bench_crisis_batch.py [--messages 50000] [--input conversaciones.jsonl]
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.utils.safety import detect_crisis_batch
+from bench_crisis_matcher import build_messages
+
+def read_jsonl(path, field):
+    """Lee los mensajes de un fichero JSONL"""
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line).get(field, "")
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de revisión de mensajes por lotes")
+    parser.add_argument("--messages", type=int, default=50000, help="Número de mensajes sintéticos")
+    parser.add_argument("--input", type=str, default=None, help="Fichero JSONL con mensajes reales")
+    parser.add_argument("--field", type=str, default="content", help="Campo del JSONL con el mensaje")
+    parser.add_argument("--chunk-size", type=int, default=1000, help="Mensajes por bloque")
+    parser.add_argument("--exact", action="store_true", help="Desactivar la búsqueda tolerante")
+    args = parser.parse_args()
+
+    messages = list(read_jsonl(args.input, args.field)) if args.input else build_messages(args.messages)
+    cpu_count = os.cpu_count() or 1
+    print(f"📊 {len(messages)} mensajes, {cpu_count} CPUs disponibles")
+
+    for workers in sorted({1, 4, cpu_count}):
+        start = time.perf_counter()
+        flagged = sum(crisis for crisis, _ in detect_crisis_batch(
+            messages, workers=workers, chunk_size=args.chunk_size, fuzzy=not args.exact
+        ))
+        elapsed = time.perf_counter() - start
+        print(f"  {workers:>3} procesos: {len(messages) / elapsed:>10.0f} mensajes/s ({flagged} con crisis, {elapsed:.2f}s)")
+
+if __name__ == "__main__":
+    main()
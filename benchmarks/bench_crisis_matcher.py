@@ -0,0 +1,90 @@
+"""
+Micro-benchmark: detección de crisis con comprensión de listas frente al
+autómata Aho-Corasick de src.utils.safety y frente a CrisisMatcher.find_all
+(que elige entre el autómata y la búsqueda simple) para 10, 100, 200 y
+1.000 palabras clave.
+
+Uso:
+    python benchmarks/bench_crisis_matcher.py [--messages 2000] [--repeat 5]
+"""
+import argparse
+import os
+import random
+import sys
+import timeit
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.config.settings import CRISIS_KEYWORDS
+from src.utils.safety import CrisisMatcher
+
+SAMPLE_MESSAGES = [
+    "Últimamente me siento ansioso y no consigo dormir bien por las noches.",
+    "He tenido una semana muy dura en el trabajo, el estrés me supera.",
+    "A veces pienso que no quiero vivir así, todo me parece demasiado.",
+    "Me gustaría aprender algunas técnicas de respiración para relajarme.",
+    "Discutí con mi pareja y desde entonces no dejo de darle vueltas.",
+]
+
+def build_keywords(count, seed=0):
+    """Genera una lista sintética de palabras clave a partir de las configuradas"""
+    rng = random.Random(seed)
+    keywords = list(CRISIS_KEYWORDS)
+    alphabet = "abcdefghijklmnopqrstuvwxyzáéíóúñ "
+    while len(keywords) < count:
+        base = rng.choice(CRISIS_KEYWORDS)
+        suffix = "".join(rng.choice(alphabet) for _ in range(rng.randint(3, 10)))
+        keywords.append(f"{base} {suffix}".strip())
+    return keywords[:count]
+
+def build_messages(count, seed=1):
+    rng = random.Random(seed)
+    return [" ".join(rng.choice(SAMPLE_MESSAGES) for _ in range(rng.randint(1, 4))) for _ in range(count)]
+
+def list_comprehension(keywords, messages):
+    for message in messages:
+        message_lower = message.lower()
+        [word for word in keywords if word in message_lower]
+
+def automaton(matcher, messages):
+    for message in messages:
+        matcher.keywords_in(matcher.scan(message.lower())[0])
+
+def find_all(matcher, messages):
+    for message in messages:
+        matcher.keywords_in(matcher.find_all(message))
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark del detector de crisis")
+    parser.add_argument("--messages", type=int, default=2000, help="Mensajes por ronda")
+    parser.add_argument("--repeat", type=int, default=5, help="Rondas por medición")
+    args = parser.parse_args()
+
+    messages = build_messages(args.messages)
+    print(f"📊 {args.messages} mensajes por ronda, mejor de {args.repeat} rondas")
+    print(f"   find_all usa el autómata a partir de {CrisisMatcher.SCAN_THRESHOLD} palabras clave")
+    print(f"{'palabras':>9} | {'lista (µs/msg)':>15} | {'autómata (µs/msg)':>18} | {'find_all (µs/msg)':>18} | "
+          f"{'compilación (ms)':>16} | {'aceleración':>11}")
+
+    for count in (10, 100, 200, 1000):
+        keywords = build_keywords(count)
+        build_time = min(timeit.repeat(lambda: CrisisMatcher(keywords), number=1, repeat=3))
+        matcher = CrisisMatcher(keywords)
+
+        # Todas las implementaciones deben encontrar lo mismo
+        for message in messages[:100]:
+            expected = {word for word in keywords if word in message.lower()}
+            assert set(matcher.keywords_in(matcher.find_all(message))) == expected
+            assert sorted(matcher.scan(message.lower())[0]) == sorted(matcher._find_each(message.lower()))
+
+        naive = min(timeit.repeat(lambda: list_comprehension(keywords, messages), number=1, repeat=args.repeat))
+        compiled = min(timeit.repeat(lambda: automaton(matcher, messages), number=1, repeat=args.repeat))
+        chosen = min(timeit.repeat(lambda: find_all(matcher, messages), number=1, repeat=args.repeat))
+        naive_us = naive / len(messages) * 1e6
+        compiled_us = compiled / len(messages) * 1e6
+        chosen_us = chosen / len(messages) * 1e6
+        print(f"{count:>9} | {naive_us:>15.2f} | {compiled_us:>18.2f} | {chosen_us:>18.2f} | "
+              f"{build_time * 1e3:>16.2f} | {naive / chosen:>10.2f}x")
+
+if __name__ == "__main__":
+    main()
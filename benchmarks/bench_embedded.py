@@ -0,0 +1,183 @@
+"""
+Sobrecoste por petición y tiempo hasta el primer token del modo embebido
+frente a la topología de tres saltos (API -> controlador -> trabajador).
+
+Todo se ejecuta en este proceso con el mismo trabajador, en tres caminos:
+
+    tres saltos    cliente -> API -> controlador + trabajador por HTTP
+    API embebida   cliente -> API, que genera en el proceso (SERVING_MODE=embedded)
+    en el proceso  llamada directa al trabajador, como la interfaz en modo embebido
+
+Por defecto usa un trabajador sintético que genera un token cada
+--token-delay segundos, de modo que el sobrecoste es exactamente la
+latencia medida menos el tiempo de "modelo". Con --real se carga el modelo
+configurado en MODEL_PATH. Usa los puertos de settings, así que el
+asistente no debe estar en marcha:
+
+    python benchmarks/bench_embedded.py --requests 50 --tokens 32
+    python benchmarks/bench_embedded.py --real --requests 10
+"""
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.config.settings import FASTCHAT_CONFIG, VICUNA_GENERATION_CONFIG
+from src.fastchat.readiness import poll_until_ready, controller_address, request_json
+from src.fastchat.embedded import EmbeddedEngine, install_embedded_backend
+from src.utils.prompts import approximate_token_count, format_prompt_for_vicuna
+from bench_api_throughput import PROMPTS, percentile
+
+class SyntheticWorker:
+    """Trabajador con la interfaz del de FastChat que genera texto fijo a ritmo constante"""
+
+    def __init__(self, model_names, tokens, token_delay, concurrency):
+        from fastchat.model.model_adapter import get_conversation_template
+        self.model_names = model_names
+        self.tokens = tokens
+        self.token_delay = token_delay
+        self.limit_worker_concurrency = concurrency
+        self.semaphore = None
+        self.context_len = FASTCHAT_CONFIG["model_worker"]["max_context_len"]
+        self.conv = get_conversation_template("vicuna")
+        self.tokenizer = None
+
+    def generate_stream_gate(self, params):
+        text = ""
+        prompt_tokens = approximate_token_count(params.get("prompt", ""))
+        for index in range(self.tokens):
+            time.sleep(self.token_delay)
+            text += "palabra "
+            output = {
+                "text": text,
+                "error_code": 0,
+                "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": index + 1,
+                          "total_tokens": prompt_tokens + index + 1},
+                "finish_reason": "length" if index + 1 == self.tokens else None,
+            }
+            yield json.dumps(output).encode() + b"\0"
+
+    def generate_gate(self, params):
+        for chunk in self.generate_stream_gate(params):
+            pass
+        return json.loads(chunk[:-1].decode())
+
+    def count_token(self, params):
+        return {"count": approximate_token_count(params["prompt"]), "error_code": 0}
+
+    def get_conv_template(self):
+        return {"conv": self.conv}
+
+    def get_queue_length(self):
+        return 0
+
+    def get_status(self):
+        return {"model_names": self.model_names, "speed": 1, "queue_length": 0}
+
+def serve_worker(worker, cfg, register):
+    """Sirve el trabajador con la app HTTP de FastChat, como start_worker"""
+    import uvicorn
+    from src.fastchat.model_worker import get_model_worker_class, worker_address, worker_ready
+    module = sys.modules[get_model_worker_class().__module__]
+    # Los endpoints buscan la variable global worker en el módulo donde están definidos
+    for route in module.app.routes:
+        endpoint = getattr(route, "endpoint", None)
+        if endpoint is not None:
+            sys.modules[endpoint.__module__].worker = worker
+    threading.Thread(
+        target=uvicorn.run, args=(module.app,),
+        kwargs={"host": cfg["host"], "port": cfg["port"], "log_level": "warning"}, daemon=True
+    ).start()
+    poll_until_ready("worker", lambda: worker_ready(cfg)).result()
+    if register:
+        status, _ = request_json(f"{controller_address()}/register_worker", {
+            "worker_name": worker_address(cfg), "check_heart_beat": False, "worker_status": worker.get_status(),
+        })
+        if status != 200:
+            raise RuntimeError("el controlador no aceptó el trabajador sintético")
+
+def timed_stream(pieces):
+    """Consume un stream y devuelve (tiempo hasta el primer fragmento, tiempo total)"""
+    start = time.perf_counter()
+    first = None
+    for _ in pieces:
+        if first is None:
+            first = time.perf_counter() - start
+    total = time.perf_counter() - start
+    return (total if first is None else first), total
+
+def run(label, call, args, model_time):
+    with ThreadPoolExecutor(args.concurrency) as pool:
+        results = list(pool.map(lambda i: timed_stream(call(PROMPTS[i % len(PROMPTS)])), range(args.requests)))
+    ttfts = [first for first, _ in results]
+    totals = [total for _, total in results]
+    overhead = [total - model_time for total in totals] if model_time is not None else None
+    line = (f"{label:<15} TTFT p50={percentile(ttfts, 0.5) * 1000:7.1f}ms p95={percentile(ttfts, 0.95) * 1000:7.1f}ms   "
+            f"total p50={percentile(totals, 0.5) * 1000:8.1f}ms")
+    if overhead is not None:
+        line += f"   sobrecoste p50={percentile(overhead, 0.5) * 1000:6.1f}ms p95={percentile(overhead, 0.95) * 1000:6.1f}ms"
+    print(line)
+    return percentile(totals, 0.5)
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark del modo embebido frente a tres saltos HTTP")
+    parser.add_argument("--requests", type=int, default=50, help="Peticiones por camino")
+    parser.add_argument("--concurrency", type=int, default=1, help="Peticiones simultáneas")
+    parser.add_argument("--tokens", type=int, default=32, help="Tokens por respuesta (trabajador sintético)")
+    parser.add_argument("--token-delay", type=float, default=0.01, help="Segundos por token (trabajador sintético)")
+    parser.add_argument("--real", action="store_true", help="Cargar el modelo de MODEL_PATH en lugar del sintético")
+    args = parser.parse_args()
+
+    # Medir solo los saltos: sin caché de respuestas ni agrupación de peticiones
+    FASTCHAT_CONFIG["serving"]["mode"] = "http"
+    FASTCHAT_CONFIG["response_cache"]["enabled"] = False
+    FASTCHAT_CONFIG["single_flight"]["enabled"] = False
+    generation = dict(VICUNA_GENERATION_CONFIG, max_new_tokens=args.tokens)
+
+    from src.fastchat.controller import launch_controller
+    from src.fastchat.api_server import launch_api_server
+    from src.fastchat.model_worker import create_worker, worker_configs
+    from src.fastchat.web_ui import stream_chat_completion
+    from fastchat.serve import openai_api_server
+
+    launch_controller().wait()
+    cfg = worker_configs()[0]
+    if args.real:
+        # El trabajador real se registra solo en el controlador al crearse
+        worker = create_worker(cfg, register=True)
+        model_time = None
+    else:
+        worker = SyntheticWorker(cfg["model_names"], args.tokens, args.token_delay, cfg["limit_worker_concurrency"])
+        model_time = args.tokens * args.token_delay
+    serve_worker(worker, cfg, register=not args.real)
+    launch_api_server().wait()
+    engine = EmbeddedEngine()
+    engine.attach(worker, cfg["model_names"])
+
+    def api_call(prompt):
+        return stream_chat_completion([{"role": "user", "content": prompt}], generation=generation)
+
+    def in_process_call(prompt):
+        return engine.stream_text(format_prompt_for_vicuna(prompt), generation)
+
+    # Calentamiento: conexiones del pool, plantillas de conversación y cachés de FastChat
+    for call in (api_call, in_process_call):
+        timed_stream(call(PROMPTS[0]))
+
+    print(f"📊 {args.requests} peticiones por camino, concurrencia {args.concurrency}, "
+          f"{'modelo real' if args.real else f'{args.tokens} tokens sintéticos a {args.token_delay * 1000:.0f}ms'}")
+    three_hops = run("tres saltos", api_call, args, model_time)
+    install_embedded_backend(openai_api_server, engine)
+    timed_stream(api_call(PROMPTS[0]))
+    embedded_api = run("API embebida", api_call, args, model_time)
+    in_process = run("en el proceso", in_process_call, args, model_time)
+    print(f"   Ahorro por petición (p50): API embebida {(three_hops - embedded_api) * 1000:.1f}ms, "
+          f"en el proceso {(three_hops - in_process) * 1000:.1f}ms")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+"""
+Regresión del tiempo de arranque de la CLI con `python -X importtime`.
+
+Mide el coste de importar los puntos de entrada y el tiempo total de los
+comandos rápidos (--check-model), y falla si se supera el objetivo.
+
+Uso:
+    python benchmarks/bench_import_time.py [--target-ms 300] [--top 10]
+"""
+import argparse
+import os
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Módulos que no deben cargarse en los comandos rápidos
+HEAVY_MODULES = ("torch", "transformers", "gradio", "uvicorn", "fastchat", "huggingface_hub")
+
+def import_profile(statement):
+    """
+    Ejecuta statement en un intérprete nuevo con -X importtime
+
+    Returns:
+        list: (acumulado_us, módulo, profundidad) por cada importación
+    """
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", statement],
+        cwd=ROOT, capture_output=True, text=True
+    )
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1])
+    entries = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        depth = (len(name) - len(name.lstrip())) // 2
+        entries.append((int(cumulative), name.strip(), depth))
+    return entries
+
+def wall_time(args, repeat):
+    """Mejor tiempo de reloj de un comando en un intérprete nuevo"""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.run([sys.executable] + args, cwd=ROOT, capture_output=True)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de tiempo de importación")
+    parser.add_argument("--target-ms", type=float, default=300.0, help="Objetivo para el arranque en frío de la CLI")
+    parser.add_argument("--top", type=int, default=10, help="Importaciones más lentas a mostrar")
+    parser.add_argument("--repeat", type=int, default=3, help="Repeticiones de la medición de reloj")
+    args = parser.parse_args()
+
+    failed = False
+    for entry_point in ("src.main", "run_assistant"):
+        entries = import_profile(f"import {entry_point}")
+        own = [e for e in entries if e[1] == entry_point]
+        total_ms = own[-1][0] / 1000 if own else sum(e[0] for e in entries if e[2] == 0) / 1000
+        heavy = sorted({e[1].split(".")[0] for e in entries} & set(HEAVY_MODULES))
+        print(f"📦 import {entry_point}: {total_ms:.1f} ms")
+        if heavy:
+            print(f"   ❌ Importa dependencias pesadas: {', '.join(heavy)}")
+            failed = True
+        for cumulative, name, _ in sorted(entries, reverse=True)[:args.top]:
+            print(f"   {cumulative / 1000:>8.1f} ms  {name}")
+
+    for command in (["src/main.py", "--check-model"], ["run_assistant.py", "--check-model"]):
+        elapsed_ms = wall_time(command, args.repeat) * 1000
+        status = "✅" if elapsed_ms <= args.target_ms else "❌"
+        failed = failed or elapsed_ms > args.target_ms
+        print(f"{status} {' '.join(command)}: {elapsed_ms:.0f} ms (objetivo {args.target_ms:.0f} ms)")
+
+    sys.exit(1 if failed else 0)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,57 @@
+"""
+Latencia de las llamadas internas abriendo una conexión por petición
+(urllib) frente al cliente compartido con conexiones keep-alive, contra el
+controlador en marcha:
+
+    python src/main.py          # en otra terminal
+    python benchmarks/bench_internal_http.py --requests 500 --concurrency 8
+"""
+import argparse
+import json
+import os
+import sys
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.fastchat.http_client import INTERNAL_CLIENT
+from src.fastchat.readiness import controller_address
+from bench_api_throughput import percentile
+
+def urllib_call(url):
+    request = urllib.request.Request(url, data=b"{}", headers={"Content-Type": "application/json"})
+    with urllib.request.urlopen(request, timeout=5) as response:
+        return response.status
+
+def pooled_call(url):
+    return INTERNAL_CLIENT.request("POST", url, {})[0]
+
+def run(call, url, requests, concurrency):
+    def timed(_):
+        start = time.perf_counter()
+        call(url)
+        return time.perf_counter() - start
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        latencies = list(pool.map(timed, range(requests)))
+    return latencies, time.perf_counter() - start
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark del cliente HTTP interno")
+    parser.add_argument("--url", type=str, default=f"{controller_address()}/list_models")
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=8)
+    args = parser.parse_args()
+
+    print(f"{'cliente':<22} {'p50':>8} {'p99':>8} {'peticiones/s':>13}")
+    for label, call in (("conexión por petición", urllib_call), ("pool keep-alive", pooled_call)):
+        latencies, elapsed = run(call, args.url, args.requests, args.concurrency)
+        print(f"{label:<22} {percentile(latencies, 0.5) * 1000:>6.2f}ms {percentile(latencies, 0.99) * 1000:>6.2f}ms "
+              f"{args.requests / elapsed:>13.1f}")
+    print(json.dumps(INTERNAL_CLIENT.snapshot(), indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+"""
+Tiempo hasta el primer token con y sin la caché KV del preámbulo del sistema.
+
+Las peticiones se envían de una en una (sin batching) con prompts de varias
+categorías, construidos de las dos formas en que llegan al trabajador: en
+modo embebido (format_prompt_for_vicuna) y por el servidor API, que recibe
+el preámbulo como mensaje de sistema y lo escribe con la plantilla de
+FastChat de --template. Para cada forma se muestra la tasa de aciertos:
+
+    python benchmarks/bench_prefix_cache.py --model facebook/opt-125m --requests 20
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.config.settings import MENTAL_HEALTH_CATEGORIES, FASTCHAT_CONFIG
+from src.utils.prompts import ConversationBuilder, format_prompt_for_vicuna, get_prompt_prefixes
+from src.fastchat.model_worker import (
+    ContinuousBatchingScheduler, PrefixCache, fastchat_prompt_prefixes, render_fastchat_prompt
+)
+from bench_api_throughput import PROMPTS, percentile
+
+def embedded_prompt(message, category, template):
+    return format_prompt_for_vicuna(message, category)
+
+def http_prompt(message, category, template):
+    # Los mismos mensajes que envía la interfaz web al servidor API
+    messages = ConversationBuilder.from_history([], category).messages(message)
+    prompt, _ = render_fastchat_prompt(template, messages)
+    return prompt
+
+def measure(scheduler, requests, build_prompt, template):
+    ttfts = []
+    for index in range(requests):
+        category = MENTAL_HEALTH_CATEGORIES[index % len(MENTAL_HEALTH_CATEGORIES)]
+        params = {
+            "prompt": build_prompt(PROMPTS[index % len(PROMPTS)], category, template),
+            "temperature": 0.0,
+            "max_new_tokens": 1,
+            "echo": False,
+        }
+        start = time.perf_counter()
+        for _ in scheduler.generate_stream(params):
+            ttfts.append(time.perf_counter() - start)
+            break
+    return ttfts
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de la caché de prefijos")
+    parser.add_argument("--model", type=str, default="facebook/opt-125m", help="Modelo de Hugging Face o ruta local")
+    parser.add_argument("--requests", type=int, default=20, help="Peticiones por modo")
+    parser.add_argument("--template", type=str, default=FASTCHAT_CONFIG["model_worker"]["model_path"],
+                        help="Modelo cuya plantilla de FastChat usa el servidor API")
+    args = parser.parse_args()
+
+    from transformers import AutoModelForCausalLM, AutoTokenizer
+    print(f"🔄 Cargando {args.model}...")
+    tokenizer = AutoTokenizer.from_pretrained(args.model)
+    model = AutoModelForCausalLM.from_pretrained(args.model).eval()
+
+    paths = [("embebido", embedded_prompt)]
+    if render_fastchat_prompt(args.template, [])[0] is not None:
+        paths.append(("API (http)", http_prompt))
+    else:
+        print("⚠️ FastChat no está instalado: solo se mide el modo embebido")
+
+    # Los mismos prefijos que precalcula el trabajador
+    preambles = get_prompt_prefixes()
+    prefixes = preambles + fastchat_prompt_prefixes(args.template, [preamble.strip() for preamble in preambles])
+    prefix_cache = PrefixCache(model, tokenizer)
+    start = time.perf_counter()
+    tokens = sum(prefix_cache.add(prefix) for prefix in prefixes)
+    print(f"Precálculo: {tokens} tokens en {time.perf_counter() - start:.2f}s")
+
+    print(f"{'modo':<28} {'TTFT medio':>11} {'TTFT p50':>10} {'TTFT p95':>10} {'aciertos':>9}")
+    for path, build_prompt in paths:
+        for label, cache in (("sin caché", None), ("con caché", prefix_cache)):
+            scheduler = ContinuousBatchingScheduler(model, tokenizer, "cpu", max_batch_size=1, prefix_cache=cache)
+            measure(scheduler, 2, build_prompt, args.template)  # Calentamiento
+            before = prefix_cache.metrics()
+            ttfts = measure(scheduler, args.requests, build_prompt, args.template)
+            after = prefix_cache.metrics()
+            hits = after["hits"] - before["hits"]
+            lookups = hits + after["misses"] - before["misses"]
+            hit_rate = f"{hits / lookups:.0%}" if lookups else "-"
+            print(f"{path + ', ' + label:<28} {sum(ttfts) / len(ttfts) * 1000:>9.1f}ms "
+                  f"{percentile(ttfts, 0.5) * 1000:>8.1f}ms {percentile(ttfts, 0.95) * 1000:>8.1f}ms {hit_rate:>9}")
+    print(f"Caché de prefijos: {prefix_cache.metrics()}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+"""
+Prueba de carga del control de admisión con carril de crisis.
+
+Simula generaciones (un sleep por petición) con el sistema saturado: varias
+sesiones normales en bucle, una sesión que envía mensajes sin parar y
+sesiones de crisis que llegan de vez en cuando. Compara la espera en cola
+del carril de crisis con y sin prioridad, y cuántas peticiones consigue
+cada sesión normal:
+
+    python benchmarks/bench_priority.py --duration 20 --slots 2
+"""
+import argparse
+import os
+import random
+import sys
+import threading
+import time
+from collections import Counter
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.fastchat.admission import AdmissionController, AdmissionRejected
+from src.fastchat.priority import PriorityScheduler
+from bench_api_throughput import percentile
+
+def run(args, priority):
+    controller = AdmissionController(
+        min_limit=args.slots, max_limit=args.slots, initial_limit=args.slots,
+        target_token_latency=float("inf"), max_queue=args.max_queue, max_wait=args.max_wait,
+        scheduler=PriorityScheduler(rate=args.session_rate, burst=args.session_burst),
+    )
+    stop = threading.Event()
+    served = Counter()
+    rejected = Counter()
+    crisis_waits = []
+    lock = threading.Lock()
+
+    def generate(session_id, crisis=False):
+        try:
+            with controller.admit(session_id, crisis) as slot:
+                time.sleep(random.uniform(0.5, 1.5) * args.generation_time)
+                slot.tokens = 1
+                with lock:
+                    served[session_id] += 1
+                return slot.waited
+        except AdmissionRejected as e:
+            with lock:
+                rejected[session_id] += 1
+            time.sleep(min(e.retry_after, 1.0))
+            return None
+
+    def normal_user(session_id, think_time):
+        while not stop.is_set():
+            generate(session_id)
+            time.sleep(think_time)
+
+    def crisis_user(index):
+        # Una sesión marcada: sus mensajes no tienen por qué contener palabras clave
+        session_id = f"crisis-{index}"
+        waited = generate(session_id, crisis=priority)
+        if waited is not None:
+            with lock:
+                crisis_waits.append(waited)
+
+    threads = [threading.Thread(target=normal_user, args=(f"user-{i}", 0.2), daemon=True) for i in range(args.users)]
+    threads.append(threading.Thread(target=normal_user, args=("heavy-user", 0.0), daemon=True))
+    for thread in threads:
+        thread.start()
+    start = time.monotonic()
+    index = 0
+    while time.monotonic() - start < args.duration:
+        time.sleep(args.crisis_interval)
+        threading.Thread(target=crisis_user, args=(index,), daemon=True).start()
+        index += 1
+    stop.set()
+    time.sleep(args.generation_time * 2)
+    return controller.snapshot(), crisis_waits, served, rejected
+
+def main():
+    parser = argparse.ArgumentParser(description="Prueba de carga del carril de crisis")
+    parser.add_argument("--duration", type=float, default=20.0, help="Duración de cada prueba (segundos)")
+    parser.add_argument("--slots", type=int, default=2, help="Generaciones simultáneas")
+    parser.add_argument("--users", type=int, default=12, help="Sesiones normales")
+    parser.add_argument("--generation-time", type=float, default=0.5, help="Duración media de una generación (segundos)")
+    parser.add_argument("--crisis-interval", type=float, default=1.0, help="Segundos entre sesiones de crisis")
+    parser.add_argument("--max-queue", type=int, default=32)
+    parser.add_argument("--max-wait", type=float, default=10.0)
+    parser.add_argument("--session-rate", type=float, default=0.5, help="Mensajes por segundo por sesión")
+    parser.add_argument("--session-burst", type=int, default=3)
+    args = parser.parse_args()
+
+    for label, priority in (("sin prioridad", False), ("con carril de crisis", True)):
+        snapshot, crisis_waits, served, rejected = run(args, priority)
+        normal = [count for session, count in served.items() if session.startswith("user-")]
+        print(f"\n{label}:")
+        print(f"  crisis: {len(crisis_waits)} atendidas, espera p50={percentile(crisis_waits, 0.5):.2f}s "
+              f"p99={percentile(crisis_waits, 0.99):.2f}s, rechazadas={sum(n for s, n in rejected.items() if s.startswith('crisis'))}")
+        for lane, stats in snapshot["lanes"].items():
+            print(f"  carril {lane:<7} admitidas={stats['admitted']:<5} espera p50={stats['queue_wait_p50_s']:.2f}s "
+                  f"p99={stats['queue_wait_p99_s']:.2f}s")
+        print(f"  sesiones normales: min={min(normal, default=0)} max={max(normal, default=0)} peticiones; "
+              f"usuario intensivo: {served['heavy-user']} atendidas, {rejected['heavy-user']} rechazadas")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+"""
+Memoria y tiempo de arranque de N trabajadores en el mismo equipo, cargando
+cada uno su propia copia de los pesos o mapeándolos desde los archivos
+safetensors (SHARED_WEIGHTS=true).
+
+Cada proceso carga el modelo, hace una pasada hacia delante (para que todas
+las páginas de pesos estén residentes) y mide su memoria en /proc. La suma
+de PSS es la memoria física que ocupan los N procesos juntos:
+
+    python benchmarks/bench_shared_weights.py --workers 3 --model models/vicuna-7b-v1.5
+"""
+import argparse
+import multiprocessing
+import os
+import sys
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.config.settings import FASTCHAT_CONFIG
+
+def load_and_measure(model_path, shared, threads, ready, release, results):
+    import torch
+    from src.utils.environment import process_memory
+    from src.utils.safetensors_io import load_model_mmap, resolve_model_dir
+
+    torch.set_num_threads(threads)
+    start = time.perf_counter()
+    if shared:
+        model, tokenizer = load_model_mmap(model_path)
+    else:
+        from transformers import AutoModelForCausalLM, AutoTokenizer
+        model_dir = resolve_model_dir(model_path) or model_path
+        # El mismo dtype que el archivo, para comparar solo la forma de cargar
+        model = AutoModelForCausalLM.from_pretrained(model_dir, torch_dtype="auto", low_cpu_mem_usage=True)
+        tokenizer = AutoTokenizer.from_pretrained(model_dir, use_fast=False)
+    load_seconds = time.perf_counter() - start
+    with torch.inference_mode():
+        model(tokenizer("Hola", return_tensors="pt").input_ids)
+    # Medir cuando todos han cargado: las páginas compartidas se reparten entre todos
+    ready.wait()
+    results.put((os.getpid(), load_seconds, process_memory()))
+    release.wait()
+
+def run(args, shared):
+    context = multiprocessing.get_context("spawn")
+    ready = context.Barrier(args.workers + 1)
+    release = context.Event()
+    results = context.Queue()
+    threads = max(1, (os.cpu_count() or 1) // args.workers)
+    processes = [
+        context.Process(target=load_and_measure, args=(args.model, shared, threads, ready, release, results))
+        for _ in range(args.workers)
+    ]
+    start = time.perf_counter()
+    for process in processes:
+        process.start()
+    ready.wait()
+    reports = [results.get() for _ in processes]
+    elapsed = time.perf_counter() - start
+    release.set()
+    for process in processes:
+        process.join()
+    return reports, elapsed
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de pesos compartidos entre trabajadores")
+    parser.add_argument("--model", type=str, default=FASTCHAT_CONFIG["model_worker"]["model_path"])
+    parser.add_argument("--workers", type=int, default=2, help="Procesos trabajadores")
+    args = parser.parse_args()
+
+    for label, shared in (("copias independientes", False), ("pesos compartidos", True)):
+        reports, elapsed = run(args, shared)
+        print(f"\n📊 {label} ({args.workers} trabajadores, todos listos en {elapsed:.1f}s):")
+        for pid, load_seconds, memory in reports:
+            print(f"   pid {pid:<8} carga {load_seconds:6.1f}s  residente {memory['rss_mb'] or 0:8.0f} MB  "
+                  f"compartida {memory['shared_mb'] or 0:8.0f} MB  PSS {memory['pss_mb'] or 0:8.0f} MB")
+        print(f"   Memoria física total (suma de PSS): {sum(m['pss_mb'] or 0 for _, _, m in reports):.0f} MB")
+
+if __name__ == "__main__":
+    main()
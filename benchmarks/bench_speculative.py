@@ -0,0 +1,79 @@
+"""
+Tokens/s de la decodificación especulativa frente a la decodificación
+normal del mismo modelo, en CPU.
+
+La línea base usa el mismo decodificador sin propuestas (un token por
+pasada del modelo principal), así que la diferencia es solo la
+especulación. El borrador tiene que compartir el tokenizador del modelo
+principal, por ejemplo:
+
+    python benchmarks/bench_speculative.py --target facebook/opt-2.7b --draft facebook/opt-350m
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.config.settings import FASTCHAT_CONFIG
+
+PROMPTS = [
+    "A chat between a curious user and an artificial intelligence assistant. "
+    "USER: Últimamente me cuesta dormir y estoy muy nervioso por los exámenes. ¿Qué puedo hacer? ASSISTANT:",
+    "A chat between a curious user and an artificial intelligence assistant. "
+    "USER: What are some simple breathing exercises to calm down before a presentation? ASSISTANT:",
+    "A chat between a curious user and an artificial intelligence assistant. "
+    "USER: How can I support a friend who is going through a hard time? ASSISTANT:",
+]
+
+def run(decoder, tokens, temperature):
+    generated, elapsed = 0, 0.0
+    for prompt in PROMPTS:
+        params = {"prompt": prompt, "max_new_tokens": tokens, "temperature": temperature, "top_p": 1.0, "echo": False}
+        start = time.perf_counter()
+        for output in decoder.generate_stream(params):
+            pass
+        elapsed += time.perf_counter() - start
+        generated += output["usage"]["completion_tokens"]
+    return generated / elapsed
+
+def main():
+    speculative = FASTCHAT_CONFIG["model_worker"]["speculative"]
+    parser = argparse.ArgumentParser(description="Benchmark de la decodificación especulativa")
+    parser.add_argument("--target", type=str, default=FASTCHAT_CONFIG["model_worker"]["model_path"])
+    parser.add_argument("--draft", type=str, default=speculative["draft_model"] or None, required=not speculative["draft_model"],
+                        help="Modelo borrador con el tokenizador del principal (por defecto DRAFT_MODEL)")
+    parser.add_argument("--draft-lengths", type=str, default=f"2,{speculative['draft_length']},8",
+                        help="Tokens por propuesta a comparar, separados por comas")
+    parser.add_argument("--tokens", type=int, default=96, help="Tokens generados por prompt")
+    parser.add_argument("--temperature", type=float, default=0.0)
+    args = parser.parse_args()
+
+    import torch
+    from transformers import AutoModelForCausalLM, AutoTokenizer
+    from src.utils.safetensors_io import resolve_model_dir
+    from src.fastchat.speculative import SpeculativeDecoder, load_draft_model
+
+    target_dir = resolve_model_dir(args.target) or args.target
+    tokenizer = AutoTokenizer.from_pretrained(target_dir, use_fast=False)
+    target = AutoModelForCausalLM.from_pretrained(target_dir, torch_dtype=torch.float32, low_cpu_mem_usage=True).eval()
+    draft = load_draft_model(args.draft, tokenizer, "cpu", torch.float32)
+    if draft is None:
+        sys.exit(1)
+
+    baseline = SpeculativeDecoder(target, None, tokenizer, draft_length=0)
+    # Calentamiento: la primera generación reserva memoria y prepara los núcleos
+    run(SpeculativeDecoder(target, draft, tokenizer, draft_length=2), 8, args.temperature)
+    base_rate = run(baseline, args.tokens, args.temperature)
+    print(f"📊 {args.target} en CPU ({torch.get_num_threads()} hilos), temperatura {args.temperature}")
+    print(f"   Sin borrador:           {base_rate:7.2f} tokens/s")
+    for draft_length in [int(value) for value in args.draft_lengths.split(",")]:
+        decoder = SpeculativeDecoder(target, draft, tokenizer, draft_length=draft_length)
+        rate = run(decoder, args.tokens, args.temperature)
+        metrics = decoder.metrics()
+        print(f"   Borrador, {draft_length} tokens:    {rate:7.2f} tokens/s  (x{rate / base_rate:.2f}, "
+              f"{metrics['acceptance_rate']:.0%} aceptados, {metrics['tokens_per_round']:.2f} tokens por pasada)")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,46 @@
+"""
+Tiempo hasta el primer texto visible en la interfaz con distintas
+frecuencias de actualización, usando el mismo manejador en streaming que
+la interfaz web contra el servidor API en marcha:
+
+    python src/main.py          # en otra terminal
+    python benchmarks/bench_ui_streaming.py --requests 5 --frame-rates 0 5 15 30
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.fastchat.web_ui import stream_reply
+from bench_api_throughput import PROMPTS, percentile
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark del streaming de la interfaz")
+    parser.add_argument("--requests", type=int, default=5, help="Respuestas por frecuencia")
+    parser.add_argument("--frame-rates", type=float, nargs="+", default=[0, 5, 15, 30],
+                        help="Actualizaciones por segundo (0 = una por fragmento)")
+    args = parser.parse_args()
+
+    print(f"{'frecuencia':>11} {'1er texto p50':>14} {'1er texto p95':>14} {'total p50':>10} {'actualizaciones':>16}")
+    for frame_rate in args.frame_rates:
+        first_visible, totals, frames = [], [], []
+        for index in range(args.requests):
+            start = time.perf_counter()
+            first = None
+            count = 0
+            for _ in stream_reply(PROMPTS[index % len(PROMPTS)], [], session_id=f"bench-{frame_rate}-{index}",
+                                  frame_rate=frame_rate):
+                if first is None:
+                    first = time.perf_counter() - start
+                count += 1
+            first_visible.append(first)
+            totals.append(time.perf_counter() - start)
+            frames.append(count)
+        label = "sin agrupar" if not frame_rate else f"{frame_rate:g}/s"
+        print(f"{label:>11} {percentile(first_visible, 0.5):>13.2f}s {percentile(first_visible, 0.95):>13.2f}s "
+              f"{percentile(totals, 0.5):>9.2f}s {sum(frames) / len(frames):>16.1f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,55 @@
+"""
+Carga concurrente sobre el pool de trabajadores, mostrando la cola y los
+tokens/s de cada trabajador mientras dura la prueba.
+
+Se puede probar en una máquina solo con CPU y un modelo pequeño:
+
+    MODEL_PATH=facebook/opt-125m NUM_WORKERS=2 RUN_MODE=processes python src/main.py
+    python benchmarks/bench_worker_pool.py --requests 32 --concurrency 8
+"""
+import argparse
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.config.settings import FASTCHAT_CONFIG
+from src.fastchat.model_worker import print_worker_pool_report
+from bench_api_throughput import PROMPTS, send_request
+
+def main():
+    cfg = FASTCHAT_CONFIG["api_server"]
+    parser = argparse.ArgumentParser(description="Benchmark del pool de trabajadores")
+    parser.add_argument("--url", type=str, default=f"http://{cfg['host']}:{cfg['port']}/v1/chat/completions")
+    parser.add_argument("--model", type=str, default=FASTCHAT_CONFIG["model_worker"]["model_names"][0])
+    parser.add_argument("--requests", type=int, default=32, help="Peticiones totales")
+    parser.add_argument("--concurrency", type=int, default=8, help="Peticiones simultáneas")
+    parser.add_argument("--max-tokens", type=int, default=64, help="Tokens por respuesta")
+    parser.add_argument("--interval", type=float, default=2.0, help="Segundos entre informes del pool")
+    args = parser.parse_args()
+
+    done = threading.Event()
+
+    def monitor():
+        while not done.wait(args.interval):
+            print_worker_pool_report()
+
+    threading.Thread(target=monitor, daemon=True).start()
+    start = time.perf_counter()
+    with ThreadPoolExecutor(args.concurrency) as pool:
+        results = list(pool.map(
+            lambda i: send_request(args.url, args.model, PROMPTS[i % len(PROMPTS)], args.max_tokens),
+            range(args.requests)
+        ))
+    elapsed = time.perf_counter() - start
+    done.set()
+
+    tokens = sum(completion_tokens for _, completion_tokens in results)
+    print(f"📊 {args.requests} peticiones en {elapsed:.1f}s: {args.requests / elapsed:.2f} peticiones/s, {tokens / elapsed:.1f} tokens/s")
+    print_worker_pool_report()
+
+if __name__ == "__main__":
+    main()
@@ -1,9 +1,11 @@
 import os
 import sys
+import argparse
 import subprocess
 import time
 import importlib
 from dotenv import load_dotenv
+from src.utils.environment import DEPENDENCIES, package_version, report_versions
 
 # Cargar variables de entorno
 load_dotenv()
@@ -23,18 +25,16 @@ def check_environment():
     # Verificar Python
     print(f"Python: {sys.version}")
     
-    # Verificar dependencias principales
-    dependencies = ["fastchat", "gradio", "transformers", "torch", "huggingface_hub"]
-    for dep in dependencies:
-        try:
-            module = __import__(dep)
-            version = getattr(module, "__version__", "desconocida")
+    # Verificar dependencias principales (sin importarlas: solo leemos sus metadatos)
+    for dep, package in DEPENDENCIES.items():
+        version = package_version(dep)
+        if version:
             print(f"✅ {dep}: {version}")
-        except ImportError:
+        else:
             print(f"❌ {dep} no está instalado")
             install = input(f"¿Deseas instalar {dep}? (s/n): ")
             if install.lower() == "s":
-                subprocess.run([sys.executable, "-m", "pip", "install", dep])
+                subprocess.run([sys.executable, "-m", "pip", "install", package])
 
 def check_model():
     """Verifica si el modelo está descargado y lo descarga si es necesario"""
@@ -68,6 +68,17 @@ def check_model():
             return check_model()  # Verificar nuevamente después de crear el módulo
         return False
 
+def check_model_only():
+    """Comprueba si el modelo está descargado sin descargarlo ni cargar dependencias pesadas"""
+    from src.utils.download_model import is_model_downloaded
+    
+    model_path = os.getenv("MODEL_PATH", "lmsys/vicuna-7b-v1.5")
+    if is_model_downloaded(model_path):
+        print(f"✅ Modelo encontrado: {model_path}")
+        return True
+    print(f"❌ El modelo {model_path} no está descargado")
+    return False
+
 def create_download_module():
     """Crea el módulo de descarga de modelos si no existe"""
     os.makedirs("src/utils", exist_ok=True)
@@ -75,9 +86,6 @@ def create_download_module():
     download_code = """
 import os
 import argparse
-from huggingface_hub import snapshot_download, login
-import torch
-from transformers import AutoTokenizer, AutoModelForCausalLM
 from dotenv import load_dotenv
 
 # Cargar variables de entorno
@@ -104,6 +112,11 @@ def download_vicuna(model_name=None, output_dir=None, use_auth_token=None):
         print(f"✅ Modelo encontrado localmente en: {model_name}")
         return model_name
     
+    # Importaciones pesadas solo cuando realmente hay que descargar
+    from huggingface_hub import snapshot_download, login
+    import torch
+    from transformers import AutoTokenizer, AutoModelForCausalLM
+    
     print(f"🔄 Descargando modelo {model_name}...")
     
     if output_dir is None:
@@ -223,21 +236,44 @@ def main():
         print("📦 Cargando componentes...")
         controller_module = import_module_safely("src.fastchat.controller")
         model_worker_module = import_module_safely("src.fastchat.model_worker")
+        api_server_module = import_module_safely("src.fastchat.api_server")
         web_ui_module = import_module_safely("src.fastchat.web_ui")
         
-        if not (controller_module and model_worker_module and web_ui_module):
+        if not (controller_module and model_worker_module and api_server_module and web_ui_module):
             print("❌ No se pudieron cargar todos los módulos necesarios.")
             return False
             
         # Inicializar componentes
         print("🚀 Iniciando componentes...")
-        controller_thread = controller_module.launch_controller()
-        time.sleep(2)  # Esperar a que el controlador se inicie
-        
-        worker_thread = model_worker_module.launch_worker()
-        time.sleep(5)  # Esperar a que el worker se inicie
+        from src.config.settings import validate_worker_config
+        try:
+            validate_worker_config()
+        except ValueError as e:
+            print(f"❌ Configuración no válida: {e}")
+            return False
+        from src.fastchat.startup import start_components
+        from src.fastchat.embedded import embedded_mode, launch_embedded_worker
         
-        web_thread = web_ui_module.launch_web_server()
+        # La interfaz web arranca mientras el modelo se carga
+        if embedded_mode():
+            # El modelo se carga en este proceso y la interfaz lo llama directamente
+            launchers = {
+                "worker": launch_embedded_worker,
+                "api": api_server_module.launch_api_server,
+                "web": web_ui_module.launch_web_server
+            }
+        else:
+            # La interfaz responde a través del servidor API local
+            launchers = {
+                "controller": controller_module.launch_controller,
+                "worker": model_worker_module.launch_worker,
+                "api": api_server_module.launch_api_server,
+                "web": web_ui_module.launch_web_server
+            }
+        plan = start_components(launchers)
+        if not plan.wait(["web"]):
+            plan.report()
+            return False
         
         print("✨ ¡Asistente iniciado correctamente!")
         print("💬 Interfaz web disponible en http://localhost:7860")
@@ -245,6 +281,9 @@ def main():
         
         # Mantener el programa en ejecución
         try:
+            if not plan.wait():
+                print("⚠️ Algunos componentes no están disponibles. El asistente podría no funcionar correctamente.")
+            plan.report()
             while True:
                 time.sleep(1)
         except KeyboardInterrupt:
@@ -256,4 +295,19 @@ def main():
         return False
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Asistente de salud mental")
+    parser.add_argument("--check-env", action="store_true", help="Solo verificar las dependencias y salir")
+    parser.add_argument("--check-model", action="store_true", help="Solo verificar si el modelo está descargado y salir")
+    args = parser.parse_args()
+    
+    # Comandos rápidos: no importan gradio, torch ni FastChat
+    if args.check_env or args.check_model:
+        ok = True
+        if args.check_env:
+            # Sin preguntar por stdin: el código de salida indica si falta alguna dependencia
+            ok = report_versions()
+        if args.check_model:
+            ok = check_model_only() and ok
+        sys.exit(0 if ok else 1)
+    
     main()
@@ -17,5 +17,6 @@ setup(
         "fastapi>=0.95.0",
         "uvicorn>=0.22.0",
         "langchain>=0.0.200",
+        "httpx>=0.24.0",
     ],
 )
\ No newline at end of file
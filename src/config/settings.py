@@ -23,6 +23,12 @@ CRISIS_KEYWORDS = [
     "autolesión", "cortarme", "hacerme daño"
 ]
 
+# Búsqueda tolerante a acentos y errores tipográficos en las palabras clave de crisis (desactivada por
+# defecto: sus coincidencias activan el protocolo de crisis, y las erratas rozan palabras corrientes)
+CRISIS_FUZZY_MATCHING = os.getenv("CRISIS_FUZZY_MATCHING", "False").lower() == "true"
+CRISIS_FUZZY_MAX_EDITS = int(os.getenv("CRISIS_FUZZY_MAX_EDITS", "2"))  # Distancia de edición máxima por palabra
+CRISIS_FUZZY_BUDGET_MS = float(os.getenv("CRISIS_FUZZY_BUDGET_MS", "5"))  # Tiempo máximo por mensaje
+
 # Números de emergencia (ejemplo para España)
 EMERGENCY_NUMBERS = {
     "general": "112",
@@ -33,7 +39,9 @@ EMERGENCY_NUMBERS = {
 FASTCHAT_CONFIG = {
     "controller": {
         "host": "localhost",
-        "port": 21001
+        "port": 21001,
+        # "shortest_queue" envía cada petición al trabajador con menos cola; "lottery" reparte al azar
+        "dispatch_method": os.getenv("DISPATCH_METHOD", "shortest_queue")
     },
     "model_worker": {
         "host": "localhost",
@@ -48,18 +56,166 @@ FASTCHAT_CONFIG = {
         "gpus": os.getenv("GPUS", ""),  # GPUs específicas, ej: "0,1" para usar GPU 0 y 1
         "num_gpus": int(os.getenv("NUM_GPUS", "1")),  # Número de GPUs a usar
         "max_gpu_memory": os.getenv("MAX_GPU_MEMORY", None),  # Límite de memoria GPU, ej: "13GiB"
+        "output_safety": os.getenv("OUTPUT_SAFETY", "True").lower() == "true",  # Revisar la salida del modelo mientras se genera
+        # Pool de trabajadores: el trabajador i escucha en port + i (requiere RUN_MODE=processes si hay más de uno)
+        "num_workers": int(os.getenv("NUM_WORKERS", "1")),
+        "threads_per_worker": int(os.getenv("THREADS_PER_WORKER", "0")),  # Hilos de torch por trabajador en CPU (0 = repartir las CPUs)
+        "limit_worker_concurrency": int(os.getenv("LIMIT_WORKER_CONCURRENCY", "5")),  # Peticiones simultáneas por trabajador
+        "max_context_len": int(os.getenv("MAX_CONTEXT_LEN", "2048")),  # Contexto máximo del modelo (prompt + respuesta)
+        # Batching continuo: las peticiones simultáneas comparten cada paso de decodificación
+        "batching": {
+            "enabled": os.getenv("CONTINUOUS_BATCHING", "False").lower() == "true",
+            "max_batch_size": int(os.getenv("MAX_BATCH_SIZE", "8")),  # Secuencias por paso (también limita la concurrencia)
+            "stream_interval": int(os.getenv("STREAM_INTERVAL", "2")),  # Tokens entre actualizaciones enviadas al cliente
+        },
+        # Precalcular la caché KV del preámbulo del sistema (uno por categoría) y reutilizarla en cada petición
+        "prefix_cache": os.getenv("PREFIX_CACHE", "False").lower() == "true",
+        # Mapear los pesos safetensors en memoria (solo CPU): los trabajadores de un mismo equipo
+        # comparten una única copia física de los pesos en lugar de cargar cada uno la suya
+        "shared_weights": os.getenv("SHARED_WEIGHTS", "False").lower() == "true",
+        # Perfil de inferencia en CPU: capas lineales en int8, hilos por núcleo físico y bfloat16 si la CPU lo admite
+        "cpu_profile": {
+            "enabled": os.getenv("CPU_PROFILE", "False").lower() == "true",
+            "quantization": os.getenv("CPU_QUANTIZATION", "int8"),  # "int8" (cuantización dinámica) o "none"
+            "bf16": os.getenv("CPU_BF16", "auto"),  # "auto" (si la CPU tiene avx512_bf16/amx), "true" o "false"; solo sin cuantización
+            "intra_op_threads": int(os.getenv("CPU_THREADS", "0")),  # 0 = un hilo por núcleo físico del trabajador
+            "inter_op_threads": int(os.getenv("CPU_INTEROP_THREADS", "1")),
+            "pin_threads": os.getenv("CPU_PIN_THREADS", "True").lower() == "true",  # Fijar el proceso a los núcleos físicos
+        },
+        # Decodificación especulativa: un modelo pequeño propone tokens y el principal los verifica en una pasada
+        # (el borrador debe usar el mismo tokenizador que el modelo principal; si no, se desactiva).
+        # Sustituye la generación del trabajador, igual que el batching continuo y la caché de
+        # prefijos: activarla junto a CONTINUOUS_BATCHING o PREFIX_CACHE es un error de configuración
+        # (ver validate_worker_config)
+        "speculative": {
+            "enabled": os.getenv("SPECULATIVE_DECODING", "False").lower() == "true",
+            # Obligatorio si se activa: sin valor por defecto porque depende del tokenizador del modelo
+            # principal (para Vicuna, uno con el vocabulario de Llama, p. ej. JackFram/llama-160m)
+            "draft_model": os.getenv("DRAFT_MODEL", ""),
+            "draft_length": int(os.getenv("DRAFT_LENGTH", "4")),  # Tokens propuestos por ronda
+            "log_interval": int(os.getenv("SPECULATIVE_LOG_INTERVAL", "0")),  # Mostrar la tasa de aceptación cada N peticiones (0 = nunca)
+        },
     },
     "api_server": {
         "host": "localhost",
         "port": 8000
     },
+    # Caché de respuestas para primeros turnos idénticos (p. ej. los mensajes iniciales de cada categoría)
+    "response_cache": {
+        "enabled": os.getenv("RESPONSE_CACHE", "False").lower() == "true",
+        "max_entries": int(os.getenv("RESPONSE_CACHE_SIZE", "512")),  # Entradas máximas (se expulsa la menos usada)
+        "ttl": float(os.getenv("RESPONSE_CACHE_TTL", "3600")),  # Segundos que una respuesta sigue siendo válida
+        # Solo peticiones (casi) deterministas. La interfaz web genera con TEMPERATURE (0.7 por defecto),
+        # así que con los valores por defecto sus mensajes no se cachean: para aprovechar la caché desde
+        # la interfaz hay que bajar TEMPERATURE a este valor o menos (no conviene subir este límite:
+        # se repetiría siempre una misma muestra de una generación aleatoria)
+        "max_temperature": float(os.getenv("RESPONSE_CACHE_MAX_TEMPERATURE", "0.3")),
+    },
+    # Peticiones idénticas y deterministas que llegan mientras otra igual se genera comparten su respuesta
+    "single_flight": {
+        "enabled": os.getenv("SINGLE_FLIGHT", "True").lower() == "true",
+        "max_temperature": float(os.getenv("SINGLE_FLIGHT_MAX_TEMPERATURE", "0.3")),
+    },
     "web_server": {
         "host": "0.0.0.0",
         "port": 7860,
-        "share": os.getenv("SHARE_GRADIO", "False").lower() == "true"
+        "share": os.getenv("SHARE_GRADIO", "False").lower() == "true",
+        "frame_rate": float(os.getenv("UI_FRAME_RATE", "15")),  # Actualizaciones por segundo del texto en streaming
+        # Control de admisión: generaciones simultáneas ajustadas según la latencia por token (AIMD)
+        "admission": {
+            "min_concurrency": 1,
+            "max_concurrency": int(os.getenv("MAX_CONCURRENCY", "8")),  # También es la concurrencia de la cola de Gradio
+            "initial_concurrency": int(os.getenv("INITIAL_CONCURRENCY", "2")),
+            "target_token_latency": float(os.getenv("TARGET_TOKEN_LATENCY", "0.2")),  # Segundos por token aceptables, medidos desde el primer token (sin cola ni prefill)
+            "decrease_factor": 0.7,  # Reducción multiplicativa del límite cuando se supera el objetivo
+            "max_queue": int(os.getenv("ADMISSION_MAX_QUEUE", "32")),  # Peticiones en espera antes de rechazar
+            "max_wait": float(os.getenv("ADMISSION_MAX_WAIT", "30")),  # Espera máxima en cola (segundos)
+            # Reparto justo entre sesiones: ráfaga de mensajes permitida y ritmo medio (mensajes por segundo)
+            "session_burst": int(os.getenv("SESSION_BURST", "3")),
+            "session_rate": float(os.getenv("SESSION_RATE", "0.1")),
+            # Las sesiones en las que se detectó una crisis pasan delante durante este tiempo (segundos)
+            "crisis_flag_ttl": float(os.getenv("CRISIS_FLAG_TTL", "3600")),
+            "crisis_extra_slots": 1,  # Plazas por encima del límite reservadas al carril de crisis
+        },
+    },
+    # Modo de servicio: "http" (API -> controlador -> trabajador, cada salto por HTTP) o
+    # "embedded" (el modelo se carga en el mismo proceso que la API y la interfaz, sin
+    # controlador ni trabajador HTTP; solo con RUN_MODE=threads y un trabajador)
+    "serving": {
+        "mode": os.getenv("SERVING_MODE", "http"),
+    },
+    # Modo de ejecución: "threads" (todo en un proceso) o "processes" (un proceso
+    # por componente, vigilados y reiniciados por un supervisor)
+    "supervisor": {
+        "mode": os.getenv("RUN_MODE", "threads"),
+        # CPUs de cada componente, ej: "0", "1-7" o "0,2". Vacío = reparto automático
+        "cpu_affinity": {
+            "controller": os.getenv("CPU_AFFINITY_CONTROLLER", ""),
+            "worker": os.getenv("CPU_AFFINITY_WORKER", ""),
+            "api": os.getenv("CPU_AFFINITY_API", ""),
+            "web": os.getenv("CPU_AFFINITY_WEB", ""),
+        },
+        "restart_initial_delay": 1.0,  # Primera espera antes de reiniciar un componente caído (segundos)
+        "restart_max_delay": 60.0,  # Espera máxima entre reinicios (segundos)
+        "stable_after": 60.0,  # Si un componente vive más que esto, la espera vuelve al mínimo
+        "shutdown_timeout": 10.0,  # Tiempo para terminar ordenadamente antes de forzar la parada
+    },
+    # Cliente HTTP compartido para las llamadas entre componentes (conexiones keep-alive reutilizadas)
+    "http_client": {
+        "max_connections": int(os.getenv("HTTP_MAX_CONNECTIONS", "100")),
+        "max_keepalive_connections": int(os.getenv("HTTP_MAX_KEEPALIVE", "20")),
+        "keepalive_expiry": 30.0,  # Segundos que una conexión libre se mantiene abierta
+        "connect_timeout": 2.0,
+        "retries": 2,  # Reintentos de los fallos de conexión (la petición no llegó a enviarse)
+        "retry_backoff": 0.1,  # Primera espera entre reintentos (se duplica en cada uno)
+        # Tiempo límite de lectura por salto (segundos); el de la API cubre una generación entera
+        "timeouts": {
+            "controller": 5.0,
+            "worker": 10.0,
+            "api": 300.0,
+            "web": 5.0,
+            "other": 30.0,
+        },
+    },
+    # Comprobación de disponibilidad de los componentes durante el arranque
+    "startup": {
+        "initial_delay": 0.1,  # Primera espera entre comprobaciones (segundos)
+        "max_delay": 2.0,  # Espera máxima entre comprobaciones (segundos)
+        "timeouts": {
+            "controller": float(os.getenv("CONTROLLER_STARTUP_TIMEOUT", "30")),
+            "worker": float(os.getenv("WORKER_STARTUP_TIMEOUT", "900")),  # Cargar el modelo en CPU puede tardar minutos
+            "api": float(os.getenv("API_STARTUP_TIMEOUT", "30")),
+            "web": float(os.getenv("WEB_STARTUP_TIMEOUT", "60")),
+        }
     }
 }
 
+def validate_worker_config(cfg=None):
+    """
+    Comprueba que las opciones del trabajador se pueden usar juntas
+
+    La decodificación especulativa necesita un modelo borrador (DRAFT_MODEL) y
+    genera una secuencia cada vez con su propia caché KV, así que no puede
+    aprovechar el lote del batching continuo ni la caché de prefijos. Se llama antes de arrancar los componentes y al crear
+    el trabajador, no al importar este módulo: un error aquí no debe impedir
+    usar el resto de la configuración (p. ej. la detección de crisis).
+    
+    Args:
+        cfg (dict): Configuración del trabajador (por defecto FASTCHAT_CONFIG["model_worker"])
+    
+    Raises:
+        ValueError: Si la combinación de opciones no es válida
+    """
+    cfg = FASTCHAT_CONFIG["model_worker"] if cfg is None else cfg
+    if not cfg.get("speculative", {}).get("enabled"):
+        return
+    if not cfg["speculative"].get("draft_model"):
+        raise ValueError("SPECULATIVE_DECODING=true necesita DRAFT_MODEL: un modelo pequeño con el mismo tokenizador "
+                         "que el modelo principal")
+    if cfg.get("prefix_cache") or cfg.get("batching", {}).get("enabled"):
+        raise ValueError("SPECULATIVE_DECODING=true no se puede combinar con PREFIX_CACHE ni con CONTINUOUS_BATCHING; "
+                         "desactiva una de las opciones")
+
 # Configuración específica de generación para Vicuna
 VICUNA_GENERATION_CONFIG = {
     "temperature": float(os.getenv("TEMPERATURE", "0.7")),
@@ -0,0 +1,254 @@
+import math
+import threading
+import time
+from collections import deque
+from src.config.settings import FASTCHAT_CONFIG
+from src.fastchat.priority import PriorityScheduler, CRISIS_LANE, NORMAL_LANE, LANES
+
+class AdmissionRejected(Exception):
+    """El sistema está saturado: la petición no se admite ahora"""
+
+    def __init__(self, retry_after, position):
+        super().__init__(f"ocupado, reintentar en {retry_after} s (posición estimada {position})")
+        self.retry_after = retry_after
+        self.position = position
+
+class AdmissionSlot:
+    """
+    Plaza de generación concedida; el manejador anota en tokens los tokens
+    generados y en first_token_at (time.monotonic) cuándo llegó el primero
+    """
+
+    def __init__(self, waited, lane=NORMAL_LANE, started_at=None):
+        self.waited = waited
+        self.lane = lane
+        self.started_at = time.monotonic() if started_at is None else started_at
+        self.first_token_at = None
+        self.tokens = 0
+
+    def token_latency(self, now=None):
+        """
+        Segundos por token desde el primero, sin la espera ni el prefill
+
+        Returns:
+            float: Latencia por token, o None si no hay al menos dos tokens
+        """
+        if self.first_token_at is None or self.tokens < 2:
+            return None
+        now = time.monotonic() if now is None else now
+        return (now - self.first_token_at) / (self.tokens - 1)
+
+class AdmissionController:
+    """
+    Control de admisión con concurrencia adaptativa (AIMD).
+
+    El límite de generaciones simultáneas sube de forma aditiva (una plaza
+    por cada "límite" generaciones rápidas) mientras la latencia por token
+    se mantiene por debajo del objetivo, y se multiplica por decrease_factor
+    cuando la supera. Las peticiones que no caben esperan en una cola
+    acotada, ordenada por un PriorityScheduler (carril de crisis primero y
+    turnos por sesión para el resto); si la espera estimada supera max_wait
+    se rechazan con un tiempo de reintento y su posición estimada, de modo
+    que la latencia de cola no crece sin límite. El límite de ritmo por
+    sesión solo se aplica cuando hay otras peticiones esperando o no quedan
+    plazas: con el servidor libre, ninguna petición espera. El carril de crisis nunca
+    se rechaza y dispone de crisis_extra_slots plazas por encima del límite.
+
+    clock (por defecto time.monotonic) permite controlar el tiempo en las
+    pruebas; la espera en cola sigue usando el reloj real.
+    """
+
+    def __init__(self, min_limit=1, max_limit=8, initial_limit=2, target_token_latency=0.2,
+                 decrease_factor=0.7, max_queue=32, max_wait=30.0, scheduler=None, crisis_extra_slots=1,
+                 clock=None):
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.target_token_latency = target_token_latency
+        self.decrease_factor = decrease_factor
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+        self.crisis_extra_slots = crisis_extra_slots
+        self.clock = clock or time.monotonic
+        self.scheduler = scheduler or PriorityScheduler()
+        self._limit = float(min(max(initial_limit, min_limit), max_limit))
+        self._condition = threading.Condition()
+        self._active = 0
+        self._last_decrease = 0.0
+        self.admitted = 0
+        self.rejected = 0
+        self.token_latency = None  # Media móvil exponencial (s/token)
+        self.generation_time = None  # Media móvil exponencial (s por generación)
+        self._waits = {lane: deque(maxlen=1000) for lane in LANES}
+
+    @property
+    def limit(self):
+        return int(self._limit)
+
+    def _capacity(self, ticket):
+        return self.limit + (self.crisis_extra_slots if ticket.lane == CRISIS_LANE else 0)
+
+    def estimate_wait(self, position):
+        """Segundos estimados hasta que la petición en la posición indicada obtenga plaza"""
+        if position <= 0:
+            return 0.0
+        if self.generation_time is None:
+            # Sin generaciones medidas todavía no hay estimación
+            return None
+        return math.ceil(position / max(1, self.limit)) * self.generation_time
+
+    def _rejection(self, ticket, position, now):
+        self.rejected += 1
+        estimate = self.estimate_wait(position)
+        retry_after = max(self.max_wait if estimate is None else estimate, self.scheduler.time_until_ready(ticket, now))
+        return AdmissionRejected(max(1, math.ceil(retry_after)), position)
+
+    def _admit(self, ticket, waited, now):
+        self._active += 1
+        self.admitted += 1
+        self._waits[ticket.lane].append(waited)
+        return AdmissionSlot(waited, ticket.lane, now)
+
+    def flag_session(self, session_id):
+        """Da prioridad de crisis a las próximas peticiones de una sesión"""
+        with self._condition:
+            self.scheduler.flag_session(session_id, self.clock())
+
+    def acquire(self, session_id=None, crisis=False):
+        """
+        Espera una plaza de generación
+
+        Args:
+            session_id (str): Sesión del usuario (para el reparto justo y el límite de ritmo)
+            crisis (bool): La petición viene de una sesión marcada por el módulo de seguridad
+
+        Returns:
+            AdmissionSlot: Plaza concedida
+
+        Raises:
+            AdmissionRejected: Si la cola está llena o la espera superaría max_wait
+        """
+        with self._condition:
+            now = self.clock()
+            ticket = self.scheduler.make_ticket(session_id, crisis, now)
+            if not len(self.scheduler) and self._active < self._capacity(ticket):
+                # Sin competencia el límite de ritmo no se aplica: solo se descuenta del cubo de la
+                # sesión para que cuente si el trabajador se llena
+                self.scheduler.consume(ticket, now)
+                return self._admit(ticket, 0.0, now)
+            position = self.scheduler.push(ticket)
+            urgent = ticket.lane == CRISIS_LANE
+            if not urgent:
+                estimate = self.estimate_wait(position)
+                wait = max(estimate or 0.0, self.scheduler.time_until_ready(ticket, now))
+                if position > self.max_queue or wait > self.max_wait:
+                    self.scheduler.remove(ticket)
+                    raise self._rejection(ticket, position, now)
+            deadline = now + self.max_wait
+            while True:
+                now = self.clock()
+                # Con plazas libres tampoco se deja esperar a una sesión por su límite de ritmo
+                if self.scheduler.peek(now, idle=self._active < self.limit) is ticket and self._active < self._capacity(ticket):
+                    break
+                remaining = deadline - now
+                if remaining <= 0 and not urgent:
+                    position = len(self.scheduler)
+                    self.scheduler.remove(ticket)
+                    self._condition.notify_all()
+                    raise self._rejection(ticket, position, now)
+                # Los cubos de tokens se rellenan con el tiempo: revisar la cola periódicamente
+                self._condition.wait(0.5 if urgent else min(remaining, 0.5))
+            self.scheduler.pop(ticket, now)
+            # Puede que haya sitio también para el siguiente de la cola
+            self._condition.notify_all()
+            return self._admit(ticket, now - ticket.enqueued_at, now)
+
+    def release(self, slot):
+        """Libera la plaza y ajusta el límite según la latencia por token observada"""
+        now = self.clock()
+        elapsed = now - slot.started_at
+        latency = slot.token_latency(now)
+        with self._condition:
+            self._active -= 1
+            if slot.tokens > 0:
+                self.generation_time = elapsed if self.generation_time is None else 0.8 * self.generation_time + 0.2 * elapsed
+            if latency is not None:
+                self.token_latency = latency if self.token_latency is None else 0.8 * self.token_latency + 0.2 * latency
+                if latency > self.target_token_latency:
+                    # Una sola reducción por "ronda": ignorar generaciones que empezaron antes de la última
+                    if slot.started_at >= self._last_decrease:
+                        self._limit = max(self.min_limit, self._limit * self.decrease_factor)
+                        self._last_decrease = now
+                else:
+                    self._limit = min(self.max_limit, self._limit + 1.0 / self._limit)
+            self._condition.notify_all()
+
+    def admit(self, session_id=None, crisis=False):
+        """Gestor de contexto: with controller.admit(session_id) as slot: ...; slot.tokens = n y slot.first_token_at"""
+        return _Admission(self, session_id, crisis)
+
+    def queue_position(self):
+        """Posición que tendría una petición nueva normal (0 si entraría sin esperar)"""
+        with self._condition:
+            if not len(self.scheduler) and self._active < self.limit:
+                return 0
+            return len(self.scheduler) + 1
+
+    def snapshot(self):
+        """Devuelve las métricas actuales como diccionario, con la espera en cola por carril"""
+        with self._condition:
+            lanes = {}
+            for lane, waits in self._waits.items():
+                waits = sorted(waits)
+                lanes[lane] = {
+                    "admitted": len(waits),
+                    "queue_wait_p50_s": waits[len(waits) // 2] if waits else 0.0,
+                    "queue_wait_p99_s": waits[min(len(waits) - 1, int(len(waits) * 0.99))] if waits else 0.0,
+                }
+            return {
+                "limit": self.limit,
+                "active": self._active,
+                "waiting": len(self.scheduler),
+                "admitted": self.admitted,
+                "rejected": self.rejected,
+                "token_latency_s": self.token_latency,
+                "lanes": lanes,
+            }
+
+class _Admission:
+    def __init__(self, controller, session_id=None, crisis=False):
+        self.controller = controller
+        self.session_id = session_id
+        self.crisis = crisis
+        self.slot = None
+
+    def __enter__(self):
+        self.slot = self.controller.acquire(self.session_id, self.crisis)
+        return self.slot
+
+    def __exit__(self, *exc_info):
+        self.controller.release(self.slot)
+        return False
+
+def busy_message(error):
+    """Mensaje para el usuario cuando su petición no se admite"""
+    return (f"⏳ El asistente está atendiendo a muchas personas ahora mismo. "
+            f"Vuelve a intentarlo en {error.retry_after} s (posición estimada en la cola: {error.position}).")
+
+def create_admission_controller():
+    """Crea el controlador de admisión de la interfaz web con la configuración de settings"""
+    cfg = FASTCHAT_CONFIG["web_server"]["admission"]
+    return AdmissionController(
+        min_limit=cfg["min_concurrency"],
+        max_limit=cfg["max_concurrency"],
+        initial_limit=cfg["initial_concurrency"],
+        target_token_latency=cfg["target_token_latency"],
+        decrease_factor=cfg["decrease_factor"],
+        max_queue=cfg["max_queue"],
+        max_wait=cfg["max_wait"],
+        scheduler=PriorityScheduler(
+            rate=cfg["session_rate"],
+            burst=cfg["session_burst"],
+            flag_ttl=cfg["crisis_flag_ttl"],
+        ),
+        crisis_extra_slots=cfg["crisis_extra_slots"],
+    )
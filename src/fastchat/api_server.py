@@ -1,11 +1,32 @@
-import threading
-import uvicorn
-from fastchat.serve.openai_api_server import app as openai_api_app
 from src.config.settings import FASTCHAT_CONFIG
+from src.fastchat.safety_middleware import install_safety_middleware
+from src.fastchat.response_cache import install_response_cache
+from src.fastchat.single_flight import install_single_flight
+from src.fastchat.readiness import launch_component, api_ready
+from src.fastchat.http_client import INTERNAL_CLIENT
+from src.fastchat.embedded import embedded_mode, install_embedded_backend
 
 def start_api_server():
     """Inicia el servidor API compatible con OpenAI"""
+    # Importaciones pesadas solo cuando realmente se arranca el servidor
+    import uvicorn
+    from fastchat.serve import openai_api_server
+    openai_api_app = openai_api_server.app
+    
     cfg = FASTCHAT_CONFIG["api_server"]
+    if embedded_mode():
+        # Generar con el modelo cargado en este proceso, sin controlador ni trabajador HTTP
+        install_embedded_backend(openai_api_server)
+    if FASTCHAT_CONFIG["response_cache"]["enabled"]:
+        install_response_cache(openai_api_app)
+    if FASTCHAT_CONFIG["single_flight"]["enabled"]:
+        # Por fuera de la caché: las peticiones repetidas que llegan a la vez esperan a la primera
+        install_single_flight(openai_api_app)
+    # Responder a los mensajes de crisis sin pasar por el modelo (se añade el último
+    # para que sea el middleware más externo y actúe antes que la caché)
+    install_safety_middleware(openai_api_app)
+    # Métricas del cliente HTTP interno de este proceso
+    openai_api_app.add_api_route("/v1/internal_http/stats", INTERNAL_CLIENT.snapshot, methods=["GET"])
     uvicorn.run(
         openai_api_app,
         host=cfg["host"],
@@ -14,9 +35,6 @@ def start_api_server():
 
 def launch_api_server():
     """Lanza el servidor API como un proceso daemon"""
-    api_thread = threading.Thread(target=start_api_server)
-    api_thread.daemon = True
-    api_thread.start()
     cfg = FASTCHAT_CONFIG["api_server"]
-    print(f"✅ Servidor API iniciado en {cfg['host']}:{cfg['port']}")
-    return api_thread
\ No newline at end of file
+    print(f"🔄 Servidor API iniciándose en {cfg['host']}:{cfg['port']}")
+    return launch_component("api", start_api_server, api_ready)
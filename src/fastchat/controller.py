@@ -1,7 +1,7 @@
-import threading
-import time
 import importlib
 import sys
+from src.config.settings import FASTCHAT_CONFIG
+from src.fastchat.readiness import launch_component, controller_ready
 
 def get_controller_class():
     """Obtiene la clase Controller de fastchat de manera dinámica"""
@@ -31,12 +31,19 @@ def start_controller():
         # Intentar obtener la clase Controller
         Controller = get_controller_class()
         
-        # Iniciar el controlador
-        controller = Controller(
-            host="localhost",
-            port=21001
-        )
-        controller.start()
+        # Iniciar el controlador; con varios trabajadores, "shortest_queue" envía
+        # cada petición al que tenga menos cola en lugar de repartirlas al azar
+        cfg = FASTCHAT_CONFIG["controller"]
+        controller = Controller(cfg.get("dispatch_method", "shortest_queue"))
+        
+        module = sys.modules[Controller.__module__]
+        if hasattr(module, "app"):
+            # FastChat sirve el controlador con la app FastAPI de su módulo
+            import uvicorn
+            module.controller = controller
+            uvicorn.run(module.app, host=cfg["host"], port=cfg["port"])
+        else:
+            controller.start()
         return controller
     except Exception as e:
         print(f"Error al iniciar el controlador: {e}")
@@ -44,10 +51,7 @@ def start_controller():
 
 def launch_controller():
     """Lanza el controlador como un proceso daemon"""
-    controller_thread = threading.Thread(target=start_controller)
-    controller_thread.daemon = True
-    controller_thread.start()
-    # Esperar a que el controlador se inicie
-    time.sleep(2)
-    print(f"✅ Controlador iniciado en localhost:21001")
-    return controller_thread
+    cfg = FASTCHAT_CONFIG["controller"]
+    print(f"🔄 Controlador iniciándose en {cfg['host']}:{cfg['port']}")
+    # El controlador está listo cuando responde a /list_models
+    return launch_component("controller", start_controller, controller_ready)
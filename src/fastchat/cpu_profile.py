@@ -0,0 +1,156 @@
+import os
+import threading
+from src.config.settings import FASTCHAT_CONFIG
+
+# Extensiones con instrucciones bfloat16 nativas (sin ellas bf16 se emula y es más lento que fp32)
+BF16_FLAGS = ("avx512_bf16", "amx_bf16")
+
+def read_cpuinfo(path="/proc/cpuinfo"):
+    """
+    Lee las características de la CPU de /proc/cpuinfo
+
+    Args:
+        path (str): Ruta del archivo (por defecto, el de Linux)
+
+    Returns:
+        dict: flags (set), model (str) y cores: CPU lógica -> (socket, núcleo físico)
+    """
+    info = {"flags": set(), "model": "", "cores": {}}
+    try:
+        with open(path) as f:
+            blocks = f.read().split("\n\n")
+    except OSError:
+        return info
+    for block in blocks:
+        fields = {}
+        for line in block.splitlines():
+            key, _, value = line.partition(":")
+            fields[key.strip()] = value.strip()
+        if "processor" not in fields:
+            continue
+        cpu = int(fields["processor"])
+        # Sin topología (algunas máquinas virtuales o ARM) cada CPU lógica cuenta como un núcleo
+        info["cores"][cpu] = (fields.get("physical id", "0"), fields.get("core id", str(cpu)))
+        if not info["flags"]:
+            info["flags"] = set((fields.get("flags") or fields.get("Features") or "").split())
+            info["model"] = fields.get("model name", "")
+    return info
+
+def bf16_supported(info=None):
+    """Indica si la CPU tiene instrucciones bfloat16 nativas"""
+    info = info or read_cpuinfo()
+    return any(flag in info["flags"] for flag in BF16_FLAGS)
+
+def physical_core_cpus(info=None, allowed=None):
+    """
+    Una CPU lógica por núcleo físico (sin los hermanos de hyperthreading)
+
+    Args:
+        info (dict): Resultado de read_cpuinfo
+        allowed (set): CPUs que el proceso puede usar (por defecto, su afinidad actual)
+
+    Returns:
+        list: CPUs lógicas elegidas, en orden
+    """
+    info = info or read_cpuinfo()
+    if allowed is None:
+        allowed = os.sched_getaffinity(0) if hasattr(os, "sched_getaffinity") else set(range(os.cpu_count() or 1))
+    chosen, seen = [], set()
+    for cpu in sorted(allowed):
+        core = info["cores"].get(cpu, ("0", str(cpu)))
+        if core not in seen:
+            seen.add(core)
+            chosen.append(cpu)
+    return chosen
+
+def configure_threads(intra_op=0, inter_op=1, pin=True, limit=0, info=None):
+    """
+    Ajusta los hilos de torch a los núcleos físicos y, si se puede, fija la afinidad
+
+    Los hilos de hyperthreading no aceleran las multiplicaciones de matrices
+    y compiten por las mismas unidades, así que se usa un hilo por núcleo
+    físico. La afinidad solo se fija desde el hilo principal (trabajador en
+    su propio proceso, RUN_MODE=processes): en Linux afecta al hilo que la
+    cambia y a los que crea después, y en modo hilos limitaría también a la
+    API y a la interfaz.
+
+    Args:
+        intra_op (int): Hilos por operación (0 = uno por núcleo físico disponible)
+        inter_op (int): Operaciones independientes en paralelo
+        pin (bool): Fijar el proceso a una CPU lógica por núcleo físico
+        limit (int): Máximo de hilos cuando intra_op es 0 (la parte de las CPUs del trabajador)
+        info (dict): Resultado de read_cpuinfo
+
+    Returns:
+        dict: Hilos y CPUs aplicados
+    """
+    import torch
+    cores = physical_core_cpus(info)
+    intra_op = intra_op or min(len(cores), limit or len(cores))
+    torch.set_num_threads(intra_op)
+    try:
+        torch.set_num_interop_threads(inter_op)
+    except RuntimeError:
+        # Solo se puede cambiar antes del primer trabajo en paralelo de torch
+        inter_op = torch.get_num_interop_threads()
+    pinned = None
+    if pin and hasattr(os, "sched_setaffinity") and threading.current_thread() is threading.main_thread():
+        pinned = cores[:intra_op]
+        os.sched_setaffinity(0, pinned)
+    return {"intra_op_threads": intra_op, "inter_op_threads": inter_op, "pinned_cpus": pinned}
+
+def quantize_linear_int8(model):
+    """
+    Cuantización dinámica int8 de las capas lineales (pesos en int8, activaciones
+    cuantizadas al vuelo). La capa de salida (lm_head) se deja en coma flotante
+    porque es la más sensible y solo se usa una vez por token.
+
+    Args:
+        model: Modelo de transformers en float32
+
+    Returns:
+        El mismo modelo, con las capas lineales cuantizadas
+    """
+    import torch
+    from torch.ao.quantization import quantize_dynamic, default_dynamic_qconfig
+    spec = {
+        name: default_dynamic_qconfig
+        for name, module in model.named_modules()
+        if isinstance(module, torch.nn.Linear) and not name.endswith("lm_head")
+    }
+    return quantize_dynamic(model, qconfig_spec=spec, dtype=torch.qint8, inplace=True)
+
+def profile_dtype(cfg=None, info=None):
+    """
+    dtype con el que cargar el modelo según el perfil: bfloat16 si la CPU lo
+    admite y no se cuantiza (la cuantización dinámica parte de float32)
+
+    Returns:
+        str: "bfloat16" o "float32"
+    """
+    cfg = cfg or FASTCHAT_CONFIG["model_worker"]["cpu_profile"]
+    if cfg.get("quantization", "none") != "none":
+        return "float32"
+    bf16 = str(cfg.get("bf16", "auto")).lower()
+    if bf16 == "auto":
+        return "bfloat16" if bf16_supported(info) else "float32"
+    return "bfloat16" if bf16 == "true" else "float32"
+
+def apply_cpu_profile(model, cfg=None):
+    """
+    Aplica la cuantización del perfil de CPU a un modelo ya cargado
+
+    Args:
+        model: Modelo de transformers
+        cfg (dict): Perfil (por defecto FASTCHAT_CONFIG["model_worker"]["cpu_profile"])
+
+    Returns:
+        El modelo listo para servir
+    """
+    cfg = cfg or FASTCHAT_CONFIG["model_worker"]["cpu_profile"]
+    quantization = cfg.get("quantization", "none")
+    if quantization == "int8":
+        model = quantize_linear_int8(model)
+    elif quantization != "none":
+        print(f"⚠️ Cuantización desconocida '{quantization}'; se usa el modelo sin cuantizar")
+    return model
@@ -0,0 +1,243 @@
+import asyncio
+import json
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from src.config.settings import FASTCHAT_CONFIG
+from src.fastchat.readiness import launch_component
+
+# Dirección ficticia del trabajador embebido (la API de FastChat la pasa de vuelta en cada llamada)
+EMBEDDED_ADDRESS = "embedded://worker"
+
+def embedded_mode():
+    """Indica si el modelo se sirve dentro del proceso, sin controlador ni trabajador HTTP"""
+    return FASTCHAT_CONFIG["serving"]["mode"] == "embedded"
+
+class EmbeddedEngine:
+    """
+    Trabajador del modelo cargado en el propio proceso.
+
+    La interfaz web y el servidor API llaman directamente a
+    generate_stream_gate del trabajador, que se ejecuta en un pool de hilos
+    acotado por la concurrencia del trabajador; cada fragmento llega al
+    consumidor a través de una cola (asyncio.Queue para la API, queue.Queue
+    para los hilos de Gradio). Se evitan los saltos al controlador y al
+    trabajador HTTP y su serialización.
+    """
+
+    def __init__(self):
+        self.worker = None
+        self.model_names = list(FASTCHAT_CONFIG["model_worker"]["model_names"])
+        self.loaded = threading.Event()
+        self._executor = None
+
+    def load(self, cfg=None):
+        """
+        Carga el modelo con las mismas envolturas que el trabajador HTTP
+
+        Args:
+            cfg (dict): Configuración del trabajador (por defecto, la del primero del pool)
+
+        Returns:
+            El trabajador cargado, o None si falla
+        """
+        from src.fastchat.model_worker import create_worker, worker_configs
+        cfg = cfg or worker_configs()[0]
+        try:
+            self.attach(create_worker(cfg, register=False), cfg.get("model_names"))
+            return self.worker
+        except Exception as e:
+            print(f"Error al cargar el modelo embebido: {e}")
+            return None
+
+    def attach(self, worker, model_names=None):
+        """Usa un trabajador ya creado (por ejemplo, en los benchmarks)"""
+        concurrency = getattr(worker, "limit_worker_concurrency", FASTCHAT_CONFIG["model_worker"]["limit_worker_concurrency"])
+        self._executor = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="embedded-generate")
+        self.model_names = list(model_names or getattr(worker, "model_names", self.model_names))
+        self.worker = worker
+        self.loaded.set()
+
+    def ready(self):
+        return self.loaded.is_set()
+
+    def _produce(self, params, emit, cancelled):
+        """Ejecuta la generación en un hilo del pool y entrega cada fragmento con emit"""
+        if cancelled.is_set():
+            # El consumidor se fue mientras la petición esperaba hilo
+            return
+        stream = self.worker.generate_stream_gate(params)
+        try:
+            for chunk in stream:
+                if cancelled.is_set():
+                    return
+                # FastChat envía JSON terminado en b"\0" con el texto acumulado
+                emit(("chunk", json.loads(chunk[:-1].decode())))
+            emit(("end", None))
+        except Exception as e:
+            emit(("error", e))
+        finally:
+            # Cerrar el generador de origen detiene la generación en curso
+            stream.close()
+
+    async def agenerate_stream(self, params):
+        """
+        Genera en streaming desde un bucle de eventos
+
+        Args:
+            params (dict): Parámetros de generación de FastChat (prompt, temperature, ...)
+
+        Yields:
+            dict: Salidas de FastChat (text acumulado, usage, finish_reason, error_code)
+        """
+        loop = asyncio.get_running_loop()
+        chunks = asyncio.Queue()
+        cancelled = threading.Event()
+
+        def emit(item):
+            try:
+                loop.call_soon_threadsafe(chunks.put_nowait, item)
+            except RuntimeError:
+                # El bucle ya se cerró: nadie espera esta respuesta
+                cancelled.set()
+
+        self._executor.submit(self._produce, params, emit, cancelled)
+        try:
+            while True:
+                kind, value = await chunks.get()
+                if kind == "chunk":
+                    yield value
+                elif kind == "error":
+                    raise value
+                else:
+                    return
+        finally:
+            cancelled.set()
+
+    def generate_stream(self, params):
+        """Versión síncrona de agenerate_stream, para hilos que no tienen bucle de eventos"""
+        chunks = queue.Queue()
+        cancelled = threading.Event()
+        self._executor.submit(self._produce, params, chunks.put, cancelled)
+        try:
+            while True:
+                kind, value = chunks.get()
+                if kind == "chunk":
+                    yield value
+                elif kind == "error":
+                    raise value
+                else:
+                    return
+        finally:
+            cancelled.set()
+
+    def stream_text(self, prompt, generation, usage=None):
+        """
+        Genera la respuesta a un prompt ya construido
+
+        Args:
+            prompt (str): Prompt completo de Vicuna
+            generation (dict): temperature, top_p, max_new_tokens y repetition_penalty
+            usage (dict): Si se indica, se actualiza con el recuento de tokens del trabajador
+
+        Yields:
+            str: Fragmentos de texto nuevos según llegan
+        """
+        params = {
+            "model": self.model_names[0],
+            "prompt": prompt,
+            "temperature": generation["temperature"],
+            "top_p": generation["top_p"],
+            "max_new_tokens": generation["max_new_tokens"],
+            "repetition_penalty": generation.get("repetition_penalty", 1.0),
+            "echo": False,
+        }
+        emitted = 0
+        for output in self.generate_stream(params):
+            if output.get("error_code", 0) != 0:
+                raise RuntimeError(output.get("text", "error en la generación"))
+            if usage is not None and output.get("usage"):
+                usage.update(output["usage"])
+            text = output.get("text", "")
+            if len(text) > emitted:
+                yield text[emitted:]
+                emitted = len(text)
+
+    def handle(self, endpoint, payload):
+        """
+        Responde en el proceso a los endpoints del controlador y del trabajador
+        que usa el servidor API de FastChat
+
+        Args:
+            endpoint (str): Último segmento de la URL (p. ej. "count_token")
+            payload (dict): Cuerpo de la petición
+
+        Returns:
+            dict: Lo mismo que devolvería el endpoint HTTP
+        """
+        payload = payload or {}
+        if endpoint == "list_models":
+            # Hasta que el modelo está cargado no se anuncia, como con el controlador
+            return {"models": self.model_names if self.ready() else []}
+        if endpoint == "refresh_all_workers":
+            return {}
+        if endpoint == "get_worker_address":
+            known = self.ready() and payload.get("model") in self.model_names
+            return {"address": EMBEDDED_ADDRESS if known else ""}
+        if endpoint == "model_details":
+            return {"context_length": self.worker.context_len}
+        if endpoint == "count_token":
+            return self.worker.count_token(payload)
+        if endpoint == "worker_get_conv_template":
+            return self.worker.get_conv_template()
+        if endpoint == "worker_get_status":
+            return self.worker.get_status()
+        raise ValueError(f"endpoint no disponible en modo embebido: {endpoint}")
+
+# Trabajador embebido del proceso (se carga con launch_embedded_worker)
+ENGINE = EmbeddedEngine()
+
+def install_embedded_backend(api_module, engine=None):
+    """
+    Hace que el servidor API de FastChat genere con el trabajador embebido
+
+    Sustituye las funciones del módulo que hablan con el controlador y con
+    el trabajador por llamadas en el proceso. Los endpoints de la API las
+    buscan en el módulo en cada petición, así que basta con reasignarlas.
+
+    Args:
+        api_module: Módulo fastchat.serve.openai_api_server
+        engine (EmbeddedEngine): Trabajador embebido (por defecto ENGINE)
+    """
+    engine = engine or ENGINE
+    if not hasattr(api_module, "fetch_remote") or not hasattr(api_module, "generate_completion_stream"):
+        raise RuntimeError("esta versión de FastChat no admite el modo embebido (falta fetch_remote)")
+    from fastapi.encoders import jsonable_encoder
+
+    async def fetch_remote(url, pload=None, name=None):
+        # Mismo contrato que el original: JSON en bytes, o el campo name del JSON ("" = todo)
+        result = jsonable_encoder(engine.handle(url.rstrip("/").rsplit("/", 1)[-1], pload))
+        if name is None:
+            return json.dumps(result).encode()
+        return result[name] if name != "" else result
+
+    async def generate_completion_stream(payload, worker_addr):
+        async for output in engine.agenerate_stream(payload):
+            yield output
+
+    async def generate_completion(payload, worker_addr):
+        output = None
+        async for output in engine.agenerate_stream(payload):
+            pass
+        return output
+
+    api_module.fetch_remote = fetch_remote
+    api_module.generate_completion_stream = generate_completion_stream
+    api_module.generate_completion = generate_completion
+    return api_module
+
+def launch_embedded_worker():
+    """Carga el modelo en este proceso, en segundo plano"""
+    print(f"🔄 Cargando el modelo en el proceso (modo embebido): {FASTCHAT_CONFIG['model_worker']['model_path']}")
+    # Listo en cuanto el modelo está cargado: no hay registro en el controlador
+    return launch_component("worker", ENGINE.load, ENGINE.ready)
@@ -0,0 +1,230 @@
+import asyncio
+import queue
+import threading
+import time
+from collections import deque
+from urllib.parse import urlsplit
+from src.config.settings import FASTCHAT_CONFIG
+
+class HopStats:
+    """Métricas de un salto interno (controlador, trabajador, API o web)"""
+
+    def __init__(self, window=1000):
+        self.requests = 0
+        self.errors = 0
+        self.retries = 0
+        self.in_flight = 0
+        self.latencies = deque(maxlen=window)
+
+    def snapshot(self):
+        latencies = sorted(self.latencies)
+        return {
+            "requests": self.requests,
+            "errors": self.errors,
+            "retries": self.retries,
+            "in_flight": self.in_flight,
+            "latency_p50_ms": latencies[len(latencies) // 2] * 1000 if latencies else 0.0,
+            "latency_p95_ms": latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))] * 1000 if latencies else 0.0,
+        }
+
+def hop_for(url):
+    """Identifica el salto interno de una URL por su puerto"""
+    port = urlsplit(url).port
+    if port == FASTCHAT_CONFIG["controller"]["port"]:
+        return "controller"
+    if port == FASTCHAT_CONFIG["api_server"]["port"]:
+        return "api"
+    if port == FASTCHAT_CONFIG["web_server"]["port"]:
+        return "web"
+    worker_port = FASTCHAT_CONFIG["model_worker"]["port"]
+    if port is not None and worker_port <= port < worker_port + max(1, FASTCHAT_CONFIG["model_worker"]["num_workers"]):
+        return "worker"
+    return "other"
+
+class InternalHTTPClient:
+    """
+    Cliente HTTP asíncrono compartido para las llamadas entre componentes.
+
+    Mantiene un pool de conexiones keep-alive (httpx.AsyncClient) en un bucle
+    de eventos propio, en un hilo daemon, de modo que los hilos síncronos de
+    la interfaz, las comprobaciones de disponibilidad y el supervisor
+    reutilizan las mismas conexiones en lugar de abrir una por petición.
+    Cada salto tiene su propio tiempo límite y los fallos de conexión se
+    reintentan con espera exponencial.
+    """
+
+    def __init__(self, cfg=None):
+        self.cfg = cfg or FASTCHAT_CONFIG["http_client"]
+        self.stats = {}
+        self._lock = threading.Lock()
+        self._loop = None
+        self._client = None
+        self._started = threading.Event()
+
+    def _start(self):
+        with self._lock:
+            if self._loop is not None:
+                return
+            self._loop = asyncio.new_event_loop()
+            threading.Thread(target=self._run_loop, name="internal-http", daemon=True).start()
+        self._started.wait()
+
+    def _run_loop(self):
+        # Importación diferida: httpx solo hace falta cuando se usa el cliente
+        import httpx
+        asyncio.set_event_loop(self._loop)
+        self._client = httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=self.cfg["max_connections"],
+                max_keepalive_connections=self.cfg["max_keepalive_connections"],
+                keepalive_expiry=self.cfg["keepalive_expiry"],
+            ),
+            timeout=httpx.Timeout(self.cfg["timeouts"]["other"], connect=self.cfg["connect_timeout"]),
+        )
+        self._started.set()
+        self._loop.run_forever()
+
+    def _hop_stats(self, hop):
+        with self._lock:
+            return self.stats.setdefault(hop, HopStats())
+
+    def _timeout(self, hop, timeout):
+        import httpx
+        read = timeout if timeout is not None else self.cfg["timeouts"].get(hop, self.cfg["timeouts"]["other"])
+        return httpx.Timeout(read, connect=min(read, self.cfg["connect_timeout"]))
+
+    async def _with_retries(self, hop, attempt, idempotent=False):
+        """
+        Ejecuta attempt() reintentando solo los fallos de conexión (la petición no llegó a enviarse)
+
+        RemoteProtocolError (el servidor cerró una conexión keep-alive reutilizada)
+        solo se reintenta en peticiones idempotentes: la petición pudo llegar, y
+        repetir un POST de generación empezaría una segunda generación.
+        """
+        import httpx
+        stats = self._hop_stats(hop)
+        delay = self.cfg["retry_backoff"]
+        retryable = (httpx.ConnectError, httpx.ConnectTimeout)
+        if idempotent:
+            retryable += (httpx.RemoteProtocolError,)
+        for retry in range(self.cfg["retries"] + 1):
+            try:
+                return await attempt()
+            except retryable:
+                if retry == self.cfg["retries"]:
+                    raise
+                stats.retries += 1
+                await asyncio.sleep(delay)
+                delay *= 2
+
+    async def arequest(self, method, url, payload=None, timeout=None, hop=None, idempotent=None):
+        """
+        Petición asíncrona; devuelve (status, cuerpo en bytes)
+
+        Args:
+            method (str): Método HTTP
+            url (str): URL completa
+            payload (dict): Cuerpo JSON (opcional)
+            timeout (float): Tiempo límite (por defecto, el del salto)
+            hop (str): Nombre del salto para las métricas (por defecto, según el puerto)
+            idempotent (bool): Se puede repetir sin efectos (por defecto, solo GET)
+        """
+        hop = hop or hop_for(url)
+        if idempotent is None:
+            idempotent = method.upper() in ("GET", "HEAD")
+        stats = self._hop_stats(hop)
+        stats.requests += 1
+        stats.in_flight += 1
+        start = time.perf_counter()
+        try:
+            response = await self._with_retries(
+                hop, lambda: self._client.request(method, url, json=payload, timeout=self._timeout(hop, timeout)),
+                idempotent
+            )
+            stats.latencies.append(time.perf_counter() - start)
+            return response.status_code, response.content
+        except Exception:
+            stats.errors += 1
+            raise
+        finally:
+            stats.in_flight -= 1
+
+    def request(self, method, url, payload=None, timeout=None, hop=None, idempotent=None):
+        """Versión síncrona de arequest, para hilos que no tienen bucle de eventos"""
+        self._start()
+        future = asyncio.run_coroutine_threadsafe(self.arequest(method, url, payload, timeout, hop, idempotent), self._loop)
+        return future.result()
+
+    def stream_lines(self, url, payload, timeout=None, hop=None):
+        """
+        Hace un POST y devuelve las líneas de la respuesta según llegan (p. ej. eventos SSE)
+
+        Si el consumidor deja de leer, la petición se cancela y la conexión
+        vuelve al pool.
+
+        Yields:
+            str: Cada línea de la respuesta
+        """
+        self._start()
+        hop = hop or hop_for(url)
+        stats = self._hop_stats(hop)
+        lines = queue.Queue()
+
+        async def produce():
+            stats.requests += 1
+            stats.in_flight += 1
+            start = time.perf_counter()
+            try:
+                async def open_stream():
+                    request = self._client.build_request("POST", url, json=payload, timeout=self._timeout(hop, timeout))
+                    return await self._client.send(request, stream=True)
+
+                # El POST de generación no es idempotente: solo se reintenta si no llegó a conectar
+                response = await self._with_retries(hop, open_stream, idempotent=False)
+                try:
+                    # La latencia del salto es el tiempo hasta las cabeceras
+                    stats.latencies.append(time.perf_counter() - start)
+                    if response.status_code != 200:
+                        body = await response.aread()
+                        raise RuntimeError(f"HTTP {response.status_code}: {body[:200].decode('utf-8', 'replace')}")
+                    async for line in response.aiter_lines():
+                        lines.put(("line", line))
+                finally:
+                    await response.aclose()
+                lines.put(("end", None))
+            except BaseException as e:
+                if not isinstance(e, asyncio.CancelledError):
+                    stats.errors += 1
+                lines.put(("error", e))
+                if isinstance(e, asyncio.CancelledError):
+                    raise
+            finally:
+                stats.in_flight -= 1
+
+        future = asyncio.run_coroutine_threadsafe(produce(), self._loop)
+        try:
+            while True:
+                kind, value = lines.get()
+                if kind == "line":
+                    yield value
+                elif kind == "error":
+                    raise value
+                else:
+                    return
+        finally:
+            future.cancel()
+
+    def snapshot(self):
+        """Métricas por salto y estado del pool de conexiones"""
+        with self._lock:
+            hops = {hop: stats.snapshot() for hop, stats in self.stats.items()}
+        pool = {"max_connections": self.cfg["max_connections"]}
+        # httpx no publica el estado del pool; httpcore sí lo tiene en su transporte
+        connections = getattr(getattr(getattr(self._client, "_transport", None), "_pool", None), "connections", None)
+        if connections is not None:
+            pool["open"] = len(connections)
+            pool["idle"] = sum(1 for connection in connections if connection.is_idle())
+        return {"pool": pool, "hops": hops}
+
+# Cliente compartido por todo el proceso (se arranca con la primera petición)
+INTERNAL_CLIENT = InternalHTTPClient()
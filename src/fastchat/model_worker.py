@@ -1,8 +1,18 @@
-import threading
-import time
 import os
+import sys
+import json
+import time
+import queue
+import inspect
+import threading
 import importlib
-from src.config.settings import FASTCHAT_CONFIG
+from collections import deque
+from src.config.settings import FASTCHAT_CONFIG, validate_worker_config
+from src.utils.safety import StreamingCrisisDetector, get_crisis_response
+from src.utils.prompts import get_prompt_prefixes
+from src.utils.environment import process_memory
+from src.fastchat.cpu_profile import configure_threads, profile_dtype, apply_cpu_profile
+from src.fastchat.readiness import launch_component, worker_registered, request_json
 
 def get_model_worker_class():
     """Obtiene la clase ModelWorker de fastchat de manera dinámica"""
@@ -26,22 +36,744 @@ def get_model_worker_class():
     
     raise ImportError("No se pudo encontrar la clase ModelWorker en el paquete FastChat. Verifica tu instalación.")
 
-def start_worker():
-    """Inicia el trabajador del modelo de FastChat para Vicuna"""
-    # Obtener configuración desde settings
-    cfg = FASTCHAT_CONFIG["model_worker"]
+def guard_generate_stream(worker):
+    """
+    Envuelve generate_stream_gate del trabajador para revisar la salida del
+    modelo mientras se genera. Si aparece una palabra clave de crisis se
+    detiene la generación y se sustituye el resto por el protocolo de crisis.
+
+    Args:
+        worker: Instancia de ModelWorker de FastChat
+
+    Returns:
+        El mismo trabajador, ya protegido
+    """
+    original_stream = worker.generate_stream_gate
+
+    def guarded_stream(params):
+        detector = StreamingCrisisDetector()
+        scanned = ""
+        emitted = ""
+        stream = original_stream(params)
+        try:
+            for chunk in stream:
+                # FastChat envía JSON terminado en b"\0" con el texto acumulado
+                ret = json.loads(chunk[:-1].decode())
+                text = ret.get("text", "")
+                if ret.get("error_code", 0) != 0:
+                    yield chunk
+                    continue
+                if not text.startswith(scanned):
+                    # La detokenización puede reescribir caracteres ya enviados: revisar de nuevo
+                    # desde un poco antes del primer cambio por si una palabra clave lo cruza
+                    changed = len(os.path.commonprefix([scanned, text]))
+                    detector.rewind(changed - detector.overlap)
+                    scanned = text[:detector.position]
+                if len(text) > len(scanned):
+                    detector.feed(text[len(scanned):])
+                    scanned = text
+                if detector.triggered:
+                    # Mantener el texto ya enviado para que los deltas sigan siendo coherentes
+                    ret["text"] = emitted + "\n\n" + get_crisis_response(detector.keywords_found)
+                    ret["finish_reason"] = "stop"
+                    yield json.dumps(ret).encode() + b"\0"
+                    return
+                if not ret.get("finish_reason"):
+                    # Retener solo el posible comienzo de una palabra clave
+                    ret["text"] = text[:detector.safe_length]
+                emitted = ret["text"]
+                yield json.dumps(ret).encode() + b"\0"
+        finally:
+            # Cerrar el generador de origen detiene la generación en curso
+            stream.close()
+
+    worker.generate_stream_gate = guarded_stream
+    return worker
+
+class WorkerStats:
+    """Métricas de generación de un trabajador: peticiones, tokens y tokens/s recientes"""
+
+    def __init__(self, worker_id, window=60.0):
+        self.worker_id = worker_id
+        self.window = window
+        self._lock = threading.Lock()
+        self._recent = deque()  # (instante, tokens) de las peticiones terminadas
+        self.requests = 0
+        self.active = 0
+        self.tokens = 0
+        self.generation_time = 0.0
+        self.scheduler = None  # ContinuousBatchingScheduler, si el batching está activado
+        self.load_seconds = None  # Tiempo de carga del modelo
+        self.shared_weights = False  # Pesos mapeados desde los archivos safetensors
+        self.speculative = None  # SpeculativeDecoder, si la decodificación especulativa está activada
+
+    def start_request(self):
+        with self._lock:
+            self.requests += 1
+            self.active += 1
+
+    def finish_request(self, tokens, elapsed):
+        now = time.monotonic()
+        with self._lock:
+            self.active -= 1
+            self.tokens += tokens
+            self.generation_time += elapsed
+            self._recent.append((now, tokens))
+            while self._recent and self._recent[0][0] < now - self.window:
+                self._recent.popleft()
+
+    def snapshot(self):
+        now = time.monotonic()
+        with self._lock:
+            recent_tokens = sum(tokens for at, tokens in self._recent if at >= now - self.window)
+            snapshot = {
+                "worker_id": self.worker_id,
+                "requests": self.requests,
+                "active": self.active,
+                "tokens": self.tokens,
+                "tokens_per_s": recent_tokens / self.window,
+                "stream_tokens_per_s": self.tokens / self.generation_time if self.generation_time else 0.0,
+                "load_seconds": self.load_seconds,
+                "shared_weights": self.shared_weights,
+                "memory": process_memory(),
+            }
+        if self.scheduler is not None:
+            snapshot["batching"] = self.scheduler.metrics()
+        if self.speculative is not None:
+            snapshot["speculative"] = self.speculative.metrics()
+        return snapshot
+
+# Métricas de los trabajadores de este proceso, por worker_id
+WORKER_STATS = {}
+
+def track_worker_stats(worker, worker_id):
+    """
+    Envuelve generate_stream_gate para contar tokens generados por el trabajador
+
+    Args:
+        worker: Instancia de ModelWorker de FastChat
+        worker_id (str): Identificador del trabajador
+
+    Returns:
+        WorkerStats: Métricas del trabajador
+    """
+    stats = WORKER_STATS.setdefault(worker_id, WorkerStats(worker_id))
+    original_stream = worker.generate_stream_gate
+
+    def tracked_stream(params):
+        stats.start_request()
+        start = time.perf_counter()
+        completion_tokens = 0
+        try:
+            for chunk in original_stream(params):
+                usage = json.loads(chunk[:-1].decode()).get("usage") or {}
+                completion_tokens = usage.get("completion_tokens", completion_tokens)
+                yield chunk
+        finally:
+            stats.finish_request(completion_tokens, time.perf_counter() - start)
+
+    worker.generate_stream_gate = tracked_stream
+    return stats
+
+def _to_legacy_cache(past):
+    """Convierte la caché KV del modelo en una tupla ((k, v), ...) por capa"""
+    if hasattr(past, "to_legacy_cache"):
+        return past.to_legacy_cache()
+    return tuple(tuple(layer) for layer in past)
+
+def _from_legacy_cache(past):
+    """Prepara una caché en forma de tupla para pasarla al modelo"""
+    try:
+        from transformers import DynamicCache
+    except ImportError:
+        return past
+    return DynamicCache.from_legacy_cache(past)
+
+class PrefixCache:
+    """
+    Estados KV precalculados de los prefijos fijos del prompt (el preámbulo
+    del sistema de cada categoría). Una petición cuyo prompt empieza por los
+    mismos tokens que un prefijo solo necesita el prefill del resto.
+    """
+
+    def __init__(self, model, tokenizer, device="cpu"):
+        self.model = model
+        self.tokenizer = tokenizer
+        self.device = device
+        self._entries = []  # (token_ids, caché KV), del prefijo más largo al más corto
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.saved_tokens = 0
+
+    def add(self, text):
+        """
+        Tokeniza un prefijo y calcula su caché KV
+
+        Args:
+            text (str): Texto del prefijo
+
+        Returns:
+            int: Número de tokens del prefijo (0 si no se ha añadido)
+        """
+        import torch
+        token_ids = self.tokenizer(text).input_ids
+        if len(token_ids) < 2 or any(ids == token_ids for ids, _ in self._entries):
+            return 0
+        with torch.inference_mode():
+            out = self.model(input_ids=torch.tensor([token_ids], device=self.device), use_cache=True)
+        with self._lock:
+            self._entries.append((token_ids, _to_legacy_cache(out.past_key_values)))
+            self._entries.sort(key=lambda entry: len(entry[0]), reverse=True)
+        return len(token_ids)
+
+    def lookup(self, input_ids):
+        """
+        Busca el prefijo más largo cuyos tokens coinciden con el principio del prompt
+
+        La comparación es por token: si la tokenización del prompt completo no
+        reproduce exactamente la del prefijo, no se reutiliza la caché.
+
+        Args:
+            input_ids (list): Tokens del prompt
+
+        Returns:
+            tuple: (tokens reutilizados, caché KV) o (0, None)
+        """
+        with self._lock:
+            for token_ids, past in self._entries:
+                length = len(token_ids)
+                # Siempre queda al menos un token para obtener los logits del siguiente
+                if length < len(input_ids) and input_ids[:length] == token_ids:
+                    self.hits += 1
+                    self.saved_tokens += length
+                    return length, past
+            self.misses += 1
+            return 0, None
+
+    def metrics(self):
+        with self._lock:
+            memory = sum(
+                tensor.numel() * tensor.element_size()
+                for _, past in self._entries for layer in past for tensor in layer
+            )
+            return {
+                "prefixes": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "saved_prefill_tokens": self.saved_tokens,
+                "memory_mb": memory / 2**20,
+            }
+
+def render_fastchat_prompt(model_path, messages):
+    """
+    Prompt que el servidor API de FastChat construye para unos mensajes de chat
+
+    Args:
+        model_path (str): Modelo (determina la plantilla de conversación)
+        messages (list): Mensajes system/user/assistant en formato OpenAI
+
+    Returns:
+        tuple: (prompt, conversación de FastChat), o (None, None) sin FastChat
+    """
+    try:
+        from fastchat.model.model_adapter import get_conversation_template
+        conv = get_conversation_template(model_path)
+    except Exception:
+        return None, None
+    for message in messages:
+        if message["role"] == "system":
+            if hasattr(conv, "set_system_message"):
+                conv.set_system_message(message["content"])
+            else:
+                conv.system = message["content"]
+        else:
+            conv.append_message(conv.roles[0] if message["role"] == "user" else conv.roles[1], message["content"])
+    conv.append_message(conv.roles[1], None)
+    return conv.get_prompt(), conv
+
+def fastchat_prompt_prefixes(model_path, system_messages):
+    """
+    Parte fija de los prompts que llegan por el servidor API: cada mensaje de
+    sistema tal como lo escribe la plantilla de FastChat (p. ej. "<sistema> USER: ..."
+    en Vicuna), más el mensaje de sistema por defecto de la plantilla
+
+    El prefijo se corta antes del separador que precede al primer turno para
+    que sus tokens coincidan con los del prompt completo.
+
+    Args:
+        model_path (str): Modelo (determina la plantilla de conversación)
+        system_messages (list): Mensajes de sistema que envía la aplicación
+
+    Returns:
+        list: Prefijos a precalcular (vacía sin FastChat)
+    """
+    prefixes = []
+    for system in [None] + list(system_messages):
+        messages = [{"role": "system", "content": system}] if system is not None else []
+        prompt, conv = render_fastchat_prompt(model_path, messages + [{"role": "user", "content": "x"}])
+        if prompt is None:
+            return []
+        position = prompt.find(conv.roles[0])
+        prefix = prompt[:position].rstrip() if position > 0 else ""
+        if prefix and prefix not in prefixes:
+            prefixes.append(prefix)
+    return prefixes
+
+class GenerationRequest:
+    """Una secuencia dentro del planificador de batching continuo"""
+
+    def __init__(self, params, prompt, input_ids):
+        self.params = params
+        self.prompt = prompt
+        self.input_ids = input_ids
+        self.output_ids = []
+        self.outputs = queue.Queue()
+        self.past = None  # Caché KV propia mientras la secuencia no está en el lote
+        self.temperature = float(params.get("temperature", 1.0))
+        self.top_p = float(params.get("top_p", 1.0))
+        self.repetition_penalty = float(params.get("repetition_penalty", 1.0))
+        self.max_new_tokens = int(params.get("max_new_tokens", 256))
+        stop = params.get("stop")
+        self.stop_strings = [stop] if isinstance(stop, str) else list(stop or [])
+        self.stop_token_ids = set(params.get("stop_token_ids") or [])
+        self.echo = params.get("echo", True)
+        self.submitted_at = time.perf_counter()
+        self.first_token_at = None
+        self.finished = False
+        self.cancelled = False
+
+    @property
+    def done(self):
+        return self.finished or self.cancelled
+
+class ContinuousBatchingScheduler:
+    """
+    Planificador de batching continuo para un modelo causal de transformers.
+
+    Un único hilo ejecuta el modelo. En cada paso de decodificación todas las
+    secuencias activas avanzan un token en la misma pasada; las peticiones
+    nuevas se incorporan al lote entre dos pasos (tras su propio prefill) y
+    las que terminan salen sin esperar al resto. Las cachés KV se mantienen
+    rellenadas por la izquierda en un único tensor por capa y solo se
+    recomponen cuando cambia la composición del lote. Con una PrefixCache, el
+    prefill parte del estado precalculado del preámbulo.
+    """
+
+    def __init__(self, model, tokenizer, device="cpu", max_batch_size=8, context_len=2048, stream_interval=2,
+                 prefix_cache=None):
+        self.model = model
+        self.tokenizer = tokenizer
+        self.device = device
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.context_len = context_len
+        self.stream_interval = max(1, int(stream_interval))
+        self.prefix_cache = prefix_cache
+        self._waiting = queue.Queue()
+        self._active = []
+        self._past = None
+        self._mask = None
+        self._thread = None
+        self._thread_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._accepts_position_ids = "position_ids" in inspect.signature(model.forward).parameters
+        self.requests = 0
+        self.tokens = 0
+        self.steps = 0
+        self.batched_tokens = 0
+        self.busy_time = 0.0
+        self.ttfts = deque(maxlen=1000)
+
+    def generate_stream(self, params):
+        """
+        Encola una petición y devuelve sus salidas con el formato de FastChat
+
+        Args:
+            params (dict): Parámetros de generación de FastChat (prompt, temperature, ...)
+
+        Returns:
+            generator: Diccionarios con "text" acumulado, "usage" y "finish_reason"
+        """
+        prompt = params["prompt"]
+        max_new_tokens = int(params.get("max_new_tokens", 256))
+        input_ids = self.tokenizer(prompt).input_ids
+        # Igual que FastChat: recortar el prompt por la izquierda para que quepa la respuesta
+        max_src_len = max(1, self.context_len - max_new_tokens - 1)
+        request = GenerationRequest(params, prompt, input_ids[-max_src_len:])
+        self._ensure_thread()
+        self._waiting.put(request)
+        try:
+            while True:
+                output = request.outputs.get()
+                if output is None:
+                    return
+                yield output
+        finally:
+            # Si el cliente se desconecta, la secuencia sale del lote en el siguiente paso
+            request.cancelled = True
+
+    def _ensure_thread(self):
+        with self._thread_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._loop, name="continuous-batching", daemon=True)
+                self._thread.start()
+
+    def _loop(self):
+        import torch
+        with torch.inference_mode():
+            while True:
+                # Sin secuencias activas se bloquea hasta que llegue una petición
+                new = self._take_waiting(block=not self._active)
+                start = time.perf_counter()
+                try:
+                    if new:
+                        self._admit(new)
+                    if self._active:
+                        self._decode_step()
+                except Exception as e:
+                    self._fail(self._active + new, e)
+                with self._stats_lock:
+                    self.busy_time += time.perf_counter() - start
+
+    def _take_waiting(self, block):
+        new = []
+        if block:
+            new.append(self._waiting.get())
+        while len(self._active) + len(new) < self.max_batch_size:
+            try:
+                new.append(self._waiting.get_nowait())
+            except queue.Empty:
+                break
+        return [request for request in new if not request.cancelled]
+
+    def _admit(self, new):
+        """Prefill de las peticiones nuevas y reconstrucción del lote con ellas"""
+        import torch
+        joining = []
+        for request in new:
+            prefix_length, prefix_past = 0, None
+            if self.prefix_cache is not None:
+                prefix_length, prefix_past = self.prefix_cache.lookup(request.input_ids)
+            kwargs = {
+                "input_ids": torch.tensor([request.input_ids[prefix_length:]], device=self.device),
+                "use_cache": True,
+            }
+            if prefix_past is not None:
+                # La caché compartida no se modifica: el modelo concatena en tensores nuevos
+                kwargs["past_key_values"] = _from_legacy_cache(prefix_past)
+            out = self.model(**kwargs)
+            request.past = _to_legacy_cache(out.past_key_values)
+            self._append_token(request, out.logits[0, -1])
+            if not request.done:
+                joining.append(request)
+        if joining:
+            self._split_batch()
+            self._build_batch([request for request in self._active if not request.done] + joining)
+
+    def _decode_step(self):
+        """Avanza un token todas las secuencias activas en una sola pasada del modelo"""
+        import torch
+        batch_size = len(self._active)
+        input_ids = torch.tensor([[request.output_ids[-1]] for request in self._active], device=self.device)
+        mask = torch.cat([self._mask, self._mask.new_ones(batch_size, 1)], dim=1)
+        kwargs = {
+            "input_ids": input_ids,
+            "attention_mask": mask,
+            "past_key_values": _from_legacy_cache(self._past),
+            "use_cache": True,
+        }
+        if self._accepts_position_ids:
+            # Posición real de cada secuencia, sin contar el relleno
+            kwargs["position_ids"] = mask.sum(dim=1, keepdim=True) - 1
+        out = self.model(**kwargs)
+        self._past = _to_legacy_cache(out.past_key_values)
+        self._mask = mask
+        with self._stats_lock:
+            self.steps += 1
+            self.batched_tokens += batch_size
+        for index, request in enumerate(self._active):
+            if not request.done:
+                self._append_token(request, out.logits[index, -1])
+        if any(request.done for request in self._active):
+            self._split_batch()
+            self._build_batch([request for request in self._active if not request.done])
+
+    def _split_batch(self):
+        """Devuelve a cada secuencia activa su parte de la caché, sin relleno"""
+        if self._past is None:
+            return
+        lengths = self._mask.sum(dim=1).tolist()
+        for index, request in enumerate(self._active):
+            length = int(lengths[index])
+            request.past = tuple(
+                (key[index:index + 1, :, -length:, :], value[index:index + 1, :, -length:, :])
+                for key, value in self._past
+            )
+        self._past = None
+        self._mask = None
+
+    def _build_batch(self, requests):
+        """Apila las cachés de las secuencias rellenando por la izquierda hasta la más larga"""
+        import torch
+        self._active = requests
+        if not requests:
+            return
+        lengths = [request.past[0][0].shape[2] for request in requests]
+        longest = max(lengths)
+        layers = []
+        for layer in range(len(requests[0].past)):
+            keys, values = [], []
+            for request, length in zip(requests, lengths):
+                key, value = request.past[layer]
+                if length < longest:
+                    key = torch.cat([key.new_zeros(*key.shape[:2], longest - length, key.shape[3]), key], dim=2)
+                    value = torch.cat([value.new_zeros(*value.shape[:2], longest - length, value.shape[3]), value], dim=2)
+                keys.append(key)
+                values.append(value)
+            layers.append((torch.cat(keys, dim=0), torch.cat(values, dim=0)))
+        mask = torch.zeros(len(requests), longest, dtype=torch.long, device=self.device)
+        for index, length in enumerate(lengths):
+            mask[index, longest - length:] = 1
+        self._past = tuple(layers)
+        self._mask = mask
+        for request in requests:
+            request.past = None
+
+    def _sample(self, request, logits):
+        import torch
+        logits = logits.float()
+        if request.repetition_penalty > 1.0:
+            seen = torch.tensor(sorted(set(request.input_ids + request.output_ids)), device=logits.device)
+            score = logits[seen]
+            logits[seen] = torch.where(score < 0, score * request.repetition_penalty, score / request.repetition_penalty)
+        if request.temperature < 1e-5 or request.top_p < 1e-8:
+            return int(torch.argmax(logits))
+        probs = torch.softmax(logits / request.temperature, dim=-1)
+        if request.top_p < 1.0:
+            sorted_probs, indices = torch.sort(probs, descending=True)
+            sorted_probs[torch.cumsum(sorted_probs, dim=-1) - sorted_probs > request.top_p] = 0.0
+            return int(indices[torch.multinomial(sorted_probs, 1)])
+        return int(torch.multinomial(probs, 1))
+
+    def _append_token(self, request, logits):
+        """Muestrea el siguiente token, comprueba las condiciones de parada y publica la salida"""
+        token = self._sample(request, logits)
+        request.output_ids.append(token)
+        now = time.perf_counter()
+        if request.first_token_at is None:
+            request.first_token_at = now
+            with self._stats_lock:
+                self.ttfts.append(now - request.submitted_at)
+        with self._stats_lock:
+            self.tokens += 1
+
+        finish_reason = None
+        if token == self.tokenizer.eos_token_id or token in request.stop_token_ids:
+            finish_reason = "stop"
+        text = self.tokenizer.decode(
+            request.output_ids, skip_special_tokens=True,
+            spaces_between_special_tokens=False, clean_up_tokenization_spaces=True
+        )
+        for stop in request.stop_strings:
+            position = text.find(stop)
+            if position != -1:
+                text = text[:position]
+                finish_reason = "stop"
+        if finish_reason is None and len(request.output_ids) >= request.max_new_tokens:
+            finish_reason = "length"
+
+        if finish_reason or len(request.output_ids) % self.stream_interval == 0:
+            request.outputs.put({
+                "text": request.prompt + text if request.echo else text,
+                "usage": {
+                    "prompt_tokens": len(request.input_ids),
+                    "completion_tokens": len(request.output_ids),
+                    "total_tokens": len(request.input_ids) + len(request.output_ids),
+                },
+                "finish_reason": finish_reason,
+                "error_code": 0,
+            })
+        if finish_reason:
+            request.finished = True
+            request.outputs.put(None)
+            with self._stats_lock:
+                self.requests += 1
+
+    def _fail(self, requests, error):
+        """Notifica el error a las secuencias afectadas y vacía el lote"""
+        for request in requests:
+            if not request.done:
+                request.outputs.put({"text": f"Error en la generación: {error}", "error_code": 50001})
+                request.finished = True
+                request.outputs.put(None)
+        self._active = []
+        self._past = None
+        self._mask = None
+
+    def metrics(self):
+        """
+        Métricas agregadas del planificador
+
+        Returns:
+            dict: Peticiones, tokens/s mientras hay trabajo, tamaño medio de lote y TTFT
+        """
+        with self._stats_lock:
+            ttfts = sorted(self.ttfts)
+            metrics = {
+                "requests": self.requests,
+                "active": len(self._active),
+                "waiting": self._waiting.qsize(),
+                "tokens": self.tokens,
+                "tokens_per_s": self.tokens / self.busy_time if self.busy_time else 0.0,
+                "avg_batch_size": self.batched_tokens / self.steps if self.steps else 0.0,
+                "ttft_avg_s": sum(ttfts) / len(ttfts) if ttfts else 0.0,
+                "ttft_p95_s": ttfts[min(len(ttfts) - 1, int(len(ttfts) * 0.95))] if ttfts else 0.0,
+            }
+        if self.prefix_cache is not None:
+            metrics["prefix_cache"] = self.prefix_cache.metrics()
+        return metrics
+
+def enable_continuous_batching(worker, max_batch_size=8, stream_interval=2, prefixes=None):
+    """
+    Sustituye generate_stream_gate del trabajador por el planificador de batching continuo
+
+    Args:
+        worker: Instancia de ModelWorker de FastChat
+        max_batch_size (int): Secuencias que avanzan juntas en cada paso
+        stream_interval (int): Tokens entre actualizaciones enviadas al cliente
+        prefixes (list): Prefijos de prompt cuya caché KV se precalcula (None = sin caché)
+
+    Returns:
+        ContinuousBatchingScheduler: Planificador instalado en el trabajador
+    """
+    prefix_cache = None
+    if prefixes:
+        prefix_cache = PrefixCache(worker.model, worker.tokenizer, worker.device)
+        tokens = sum(prefix_cache.add(prefix) for prefix in prefixes)
+        print(f"✅ Caché de prefijos: {prefix_cache.metrics()['prefixes']} prefijos, {tokens} tokens precalculados")
+    scheduler = ContinuousBatchingScheduler(
+        worker.model, worker.tokenizer, worker.device,
+        max_batch_size=max_batch_size, context_len=worker.context_len, stream_interval=stream_interval,
+        prefix_cache=prefix_cache
+    )
+
+    def batched_stream(params):
+        try:
+            for output in scheduler.generate_stream(params):
+                yield json.dumps(output).encode() + b"\0"
+        except Exception as e:
+            yield json.dumps({"text": f"Error en la generación: {e}", "error_code": 50001}).encode() + b"\0"
+
+    worker.generate_stream_gate = batched_stream
+    worker.batching_scheduler = scheduler
+    return scheduler
+
+def use_mmap_weights(ModelWorker):
+    """
+    Hace que el ModelWorker de FastChat cargue los pesos mapeados desde los
+    archivos safetensors en lugar de copiarlos a la memoria del proceso
+
+    Los procesos que mapean los mismos archivos comparten las páginas de la
+    caché del sistema, así que N trabajadores en un equipo ocupan una sola
+    copia física de los pesos. Solo se aplica en CPU y sin cuantización; si
+    el modelo no está en safetensors se carga de la forma habitual.
+
+    Args:
+        ModelWorker: Clase ModelWorker de FastChat
+
+    Returns:
+        bool: True si la carga con mmap quedó instalada
+    """
+    module = sys.modules[ModelWorker.__module__]
+    original_load = getattr(module, "load_model", None)
+    if original_load is None:
+        print("⚠️ Esta versión de FastChat no permite compartir los pesos; se cargan de la forma habitual")
+        return False
+    if getattr(original_load, "mmap_weights", False):
+        return True
+    from src.utils.safetensors_io import load_model_mmap
+
+    def load_model(model_path, *args, **kwargs):
+        if kwargs.get("device", "cpu") != "cpu" or kwargs.get("load_8bit"):
+            print("⚠️ Los pesos compartidos solo se usan en CPU sin cuantización; se cargan de la forma habitual")
+            return original_load(model_path, *args, **kwargs)
+        try:
+            model, tokenizer = load_model_mmap(model_path)
+        except (FileNotFoundError, ValueError) as e:
+            print(f"⚠️ No se pueden compartir los pesos ({e}); se cargan de la forma habitual")
+            return original_load(model_path, *args, **kwargs)
+        if str(model.dtype) == "torch.float16":
+            # Los pesos conservan el dtype del archivo: convertirlos rompería el mapeo
+            print("⚠️ Los pesos están en float16, que en CPU es lento; guarda el modelo en bfloat16 para compartirlo")
+        load_model.used = True
+        return model, tokenizer
+
+    load_model.mmap_weights = True
+    load_model.used = False
+    module.load_model = load_model
+    return True
+
+def worker_configs():
+    """
+    Genera la configuración de cada trabajador del pool
+
+    Cada trabajador escucha en su propio puerto (port + i), tiene su propio
+    worker_id y recibe una GPU (si se indicaron varias en GPUS) o una parte
+    de los hilos de CPU.
+
+    Returns:
+        list: Un diccionario de configuración por trabajador
+    """
+    base = FASTCHAT_CONFIG["model_worker"]
+    num_workers = max(1, int(base.get("num_workers", 1)))
+    gpus = [gpu for gpu in str(base.get("gpus", "")).split(",") if gpu]
+    threads = base.get("threads_per_worker") or max(1, (os.cpu_count() or 1) // num_workers)
+
+    configs = []
+    for index in range(num_workers):
+        cfg = dict(base)
+        cfg["port"] = base.get("port", 21002) + index
+        if num_workers > 1:
+            cfg["worker_id"] = f"{base.get('worker_id', 'mental_health_worker')}_{index}"
+            if gpus:
+                # Una GPU por trabajador, en turno rotatorio
+                cfg["gpus"] = gpus[index % len(gpus)]
+                cfg["num_gpus"] = 1
+        cfg["num_threads"] = threads if cfg.get("device", "cpu") == "cpu" else 0
+        configs.append(cfg)
+    return configs
+
+def worker_address(cfg):
+    return f"http://{cfg.get('host', 'localhost')}:{cfg.get('port', 21002)}"
+
+def create_worker(cfg, register=True):
+    """
+    Carga el modelo y crea el trabajador de FastChat con las envolturas de la
+    aplicación (batching, caché de prefijos, métricas y revisión de la salida)
+
+    Args:
+        cfg (dict): Configuración del trabajador (ver worker_configs)
+        register (bool): Registrar el trabajador en el controlador (False en modo embebido)
+
+    Returns:
+        El trabajador de FastChat, listo para generar
+    
+    Raises:
+        ValueError: Si la configuración combina opciones incompatibles (antes de cargar el modelo)
+    """
+    validate_worker_config(cfg)
     
     # Configuración básica
     model_path = cfg.get("model_path", os.getenv("MODEL_PATH", "lmsys/vicuna-7b-v1.5"))
     device = cfg.get("device", os.getenv("DEVICE", "cpu"))
     controller_addr = f"http://{FASTCHAT_CONFIG['controller']['host']}:{FASTCHAT_CONFIG['controller']['port']}"
-    worker_addr = f"http://{cfg.get('host', 'localhost')}:{cfg.get('port', 21002)}"
+    worker_addr = worker_address(cfg)
     worker_id = cfg.get("worker_id", "mental_health_worker")
     
     # Configuración avanzada
     load_8bit = cfg.get("load_8bit", False)
     cpu_offloading = cfg.get("cpu_offloading", False)
-    gpus = os.getenv("GPUS", "")
+    gpus = cfg.get("gpus", "")
     num_gpus = int(cfg.get("num_gpus", os.getenv("NUM_GPUS", "1")))
     max_gpu_memory = cfg.get("max_gpu_memory", None)
     
@@ -49,36 +781,179 @@ def start_worker():
     if gpus:
         os.environ["CUDA_VISIBLE_DEVICES"] = gpus
     
+    cpu_profile = cfg.get("cpu_profile", {})
+    cpu_profile = cpu_profile if cpu_profile.get("enabled") and device == "cpu" else None
+
+    # Repartir los hilos de CPU entre los trabajadores del pool
+    if cpu_profile:
+        threads = configure_threads(cpu_profile.get("intra_op_threads", 0), cpu_profile.get("inter_op_threads", 1),
+                                    cpu_profile.get("pin_threads", True), limit=cfg.get("num_threads", 0))
+        pinned = f", fijados a las CPUs {threads['pinned_cpus']}" if threads["pinned_cpus"] else ""
+        print(f"🧵 Perfil de CPU: {threads['intra_op_threads']} hilos por operación, "
+              f"{threads['inter_op_threads']} entre operaciones{pinned}")
+    elif cfg.get("num_threads"):
+        import torch
+        torch.set_num_threads(cfg["num_threads"])
+
+    # Intentar obtener la clase ModelWorker
+    ModelWorker = get_model_worker_class()
+
+    extra_args = {}
+    if cpu_profile and profile_dtype(cpu_profile) == "bfloat16":
+        if "dtype" in inspect.signature(ModelWorker.__init__).parameters:
+            import torch
+            extra_args["dtype"] = torch.bfloat16
+            print("✅ La CPU admite bfloat16: el modelo se carga en bfloat16")
+        else:
+            print("⚠️ Esta versión de FastChat no permite elegir el dtype; el modelo se carga en float32")
+    if cpu_profile and cpu_profile.get("quantization", "none") != "none" and (load_8bit or cfg.get("shared_weights")):
+        # La compresión de FastChat ya cuantiza, y la cuantización copia los pesos fuera del mapeo compartido
+        print("⚠️ La cuantización del perfil de CPU no se combina con LOAD_8BIT ni con SHARED_WEIGHTS; se omite")
+        cpu_profile = dict(cpu_profile, quantization="none")
+
+    batching = cfg.get("batching", {})
+    concurrency = cfg.get("limit_worker_concurrency", 5)
+    if batching.get("enabled"):
+        # El semáforo de FastChat no debe dejar fuera peticiones que cabrían en el lote
+        concurrency = max(concurrency, batching.get("max_batch_size", 8))
+    
+    shared_weights = cfg.get("shared_weights", False) and use_mmap_weights(ModelWorker)
+    
+    print(f"🔄 Iniciando trabajador {worker_id} para el modelo: {model_path}...")
+    load_start = time.perf_counter()
+    worker = ModelWorker(
+        controller_addr=controller_addr,
+        worker_addr=worker_addr,
+        worker_id=worker_id,
+        model_path=model_path,
+        model_names=cfg.get("model_names", ["vicuna", "mental_health_assistant"]),
+        limit_worker_concurrency=concurrency,
+        no_register=not register,
+        device=device,
+        num_gpus=num_gpus,
+        max_gpu_memory=max_gpu_memory,
+        load_8bit=load_8bit,
+        cpu_offloading=cpu_offloading,
+        max_context_len=cfg.get("max_context_len", 2048),
+        **extra_args
+    )
+    if cpu_profile and cpu_profile.get("quantization", "none") != "none":
+        # Antes del batching y la caché de prefijos, que guardan referencias al modelo
+        worker.model = apply_cpu_profile(worker.model, cpu_profile)
+        memory = process_memory()
+        print(f"✅ Capas lineales cuantizadas a {cpu_profile['quantization']} (residente {memory['rss_mb'] or 0:.0f} MB)")
+    load_seconds = time.perf_counter() - load_start
+    shared_weights = shared_weights and sys.modules[ModelWorker.__module__].load_model.used
+    if shared_weights:
+        memory = process_memory()
+        print(f"✅ Pesos mapeados en memoria compartida en {load_seconds:.1f}s "
+              f"(residente {memory['rss_mb'] or 0:.0f} MB, compartida {memory['shared_mb'] or 0:.0f} MB)")
+    prefixes = None
+    if cfg.get("prefix_cache", False):
+        # Preámbulos tal como llegan en modo embebido y tal como los escribe la plantilla de FastChat (API)
+        preambles = get_prompt_prefixes()
+        prefixes = preambles + fastchat_prompt_prefixes(model_path, [preamble.strip() for preamble in preambles])
+    if batching.get("enabled") or prefixes:
+        # La caché de prefijos necesita controlar el prefill: sin batching se usa un lote de 1
+        max_batch_size = batching.get("max_batch_size", 8) if batching.get("enabled") else 1
+        enable_continuous_batching(worker, max_batch_size, batching.get("stream_interval", 2), prefixes)
+        if batching.get("enabled"):
+            print(f"✅ Batching continuo activado (hasta {max_batch_size} secuencias por paso)")
+    speculative = cfg.get("speculative", {})
+    if speculative.get("enabled"):
+        # validate_worker_config ya descartó el batching continuo y la caché de prefijos
+        from src.fastchat.speculative import enable_speculative_decoding
+        decoder = enable_speculative_decoding(worker, speculative, cpu_profile)
+        if decoder is not None:
+            print(f"✅ Decodificación especulativa activada ({speculative.get('draft_model')}, "
+                  f"{decoder.draft_length} tokens por propuesta)")
+    stats = track_worker_stats(worker, worker_id)
+    stats.scheduler = getattr(worker, "batching_scheduler", None)
+    stats.speculative = getattr(worker, "speculative_decoder", None)
+    stats.load_seconds = load_seconds
+    stats.shared_weights = shared_weights
+    if cfg.get("output_safety", True):
+        guard_generate_stream(worker)
+    return worker
+
+def start_worker(worker_index=0):
+    """
+    Inicia el trabajador del modelo de FastChat para Vicuna
+
+    Args:
+        worker_index (int): Posición del trabajador dentro del pool
+    """
+    # Obtener configuración desde settings
+    cfg = worker_configs()[worker_index]
+    
     try:
-        # Intentar obtener la clase ModelWorker
-        ModelWorker = get_model_worker_class()
+        worker = create_worker(cfg)
         
-        print(f"🔄 Iniciando trabajador para el modelo: {model_path}...")
-        worker = ModelWorker(
-            controller_addr=controller_addr,
-            worker_addr=worker_addr,
-            worker_id=worker_id,
-            model_path=model_path,
-            model_names=cfg.get("model_names", ["vicuna", "mental_health_assistant"]),
-            device=device,
-            num_gpus=num_gpus,
-            max_gpu_memory=max_gpu_memory,
-            load_8bit=load_8bit,
-            cpu_offloading=cpu_offloading,
-            max_context_len=2048
-        )
-        worker.start()
+        module = sys.modules[type(worker).__module__]
+        if hasattr(module, "app"):
+            # FastChat sirve el trabajador con la app FastAPI de su módulo
+            import uvicorn
+            module.worker = worker
+            module.app.add_api_route("/worker_get_stats", lambda: {k: v.snapshot() for k, v in WORKER_STATS.items()}, methods=["POST"])
+            uvicorn.run(module.app, host=cfg.get("host", "localhost"), port=cfg.get("port", 21002))
+        else:
+            worker.start()
         return worker
     except Exception as e:
         print(f"Error al iniciar el trabajador: {e}")
         return None
 
+def worker_ready(cfg):
+    """El trabajador responde a /worker_get_status (el modelo ya está cargado)"""
+    status, _ = request_json(f"{worker_address(cfg)}/worker_get_status", {})
+    return status == 200
+
 def launch_worker():
     """Lanza el trabajador del modelo como un proceso daemon"""
-    worker_thread = threading.Thread(target=start_worker)
-    worker_thread.daemon = True
-    worker_thread.start()
-    # Esperar a que el worker se inicie
-    time.sleep(8)  # Vicuna puede tardar un poco en cargar
-    print(f"✅ Trabajador del modelo iniciado en {FASTCHAT_CONFIG['model_worker'].get('host', 'localhost')}:{FASTCHAT_CONFIG['model_worker'].get('port', 21002)}")
-    return worker_thread
+    configs = worker_configs()
+    if len(configs) > 1:
+        # El módulo de FastChat solo puede servir un trabajador por proceso
+        print(f"⚠️ NUM_WORKERS={len(configs)} requiere RUN_MODE=processes; en modo hilos se inicia un solo trabajador")
+    print(f"🔄 Trabajador del modelo iniciándose en {FASTCHAT_CONFIG['model_worker'].get('host', 'localhost')}:{FASTCHAT_CONFIG['model_worker'].get('port', 21002)}")
+    # El trabajador solo está listo cuando el modelo se ha cargado y se ha registrado en el controlador
+    return launch_component("worker", start_worker, worker_registered)
+
+def report_worker_pool():
+    """
+    Consulta a cada trabajador del pool su cola y sus tokens/s
+
+    Returns:
+        list: Un diccionario de métricas por trabajador
+    """
+    report = []
+    for cfg in worker_configs():
+        entry = {"worker_id": cfg["worker_id"], "address": worker_address(cfg), "queue_length": None, "tokens_per_s": None}
+        try:
+            _, body = request_json(f"{entry['address']}/worker_get_status", {})
+            entry["queue_length"] = json.loads(body).get("queue_length")
+            _, body = request_json(f"{entry['address']}/worker_get_stats", {})
+            stats = json.loads(body).get(cfg["worker_id"], {})
+            entry["tokens_per_s"] = stats.get("tokens_per_s")
+            entry["active"] = stats.get("active")
+            entry["memory"] = stats.get("memory")
+            entry["load_seconds"] = stats.get("load_seconds")
+        except Exception as e:
+            entry["error"] = str(e)
+        report.append(entry)
+    return report
+
+def print_worker_pool_report():
+    """Imprime la cola y los tokens/s de cada trabajador"""
+    print("📊 Pool de trabajadores:")
+    for entry in report_worker_pool():
+        if "error" in entry:
+            print(f"   {entry['worker_id']:<36} {entry['address']}  ❌ {entry['error']}")
+        else:
+            tokens_per_s = entry["tokens_per_s"] or 0.0
+            line = f"   {entry['worker_id']:<36} {entry['address']}  cola={entry['queue_length']}  tokens/s={tokens_per_s:.1f}"
+            memory = entry.get("memory") or {}
+            if memory.get("rss_mb") is not None:
+                line += f"  residente={memory['rss_mb']:.0f}MB compartida={memory['shared_mb'] or 0:.0f}MB"
+            if entry.get("load_seconds") is not None:
+                line += f"  carga={entry['load_seconds']:.1f}s"
+            print(line)
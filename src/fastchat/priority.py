@@ -0,0 +1,187 @@
+import itertools
+import time
+from collections import OrderedDict, deque
+
+# Clases de prioridad, de mayor a menor
+CRISIS_LANE = "crisis"
+NORMAL_LANE = "normal"
+LANES = (CRISIS_LANE, NORMAL_LANE)
+
+class TokenBucket:
+    """Cubo de tokens: permite ráfagas de burst peticiones y rate peticiones por segundo de media"""
+
+    def __init__(self, rate, burst, now=None):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic() if now is None else now
+
+    def _refill(self, now):
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def ready(self, now):
+        self._refill(now)
+        return self.tokens >= 1.0
+
+    def take(self, now):
+        self._refill(now)
+        # Sin saldo negativo: las peticiones admitidas sin competencia no dejan deuda
+        self.tokens = max(0.0, self.tokens - 1.0)
+
+    def time_until_ready(self, now):
+        """Segundos hasta que haya un token disponible"""
+        self._refill(now)
+        if self.tokens >= 1.0:
+            return 0.0
+        return (1.0 - self.tokens) / self.rate if self.rate > 0 else float("inf")
+
+    def full(self, now):
+        self._refill(now)
+        return self.tokens >= self.burst
+
+class Ticket:
+    """Una petición esperando plaza de generación"""
+
+    _ids = itertools.count()
+
+    def __init__(self, session_id, lane, now=None):
+        self.id = next(self._ids)
+        # Las peticiones sin sesión se tratan como sesiones de una sola petición
+        self.session_id = session_id if session_id is not None else f"anonymous-{self.id}"
+        self.anonymous = session_id is None
+        self.lane = lane
+        self.enqueued_at = time.monotonic() if now is None else now
+
+class PriorityScheduler:
+    """
+    Orden de la cola de generación con clases de prioridad.
+
+    Las sesiones marcadas por el módulo de seguridad van al carril de crisis,
+    que se atiende siempre primero (por orden de llegada) y no tiene límite
+    de ritmo. El resto del tráfico se reparte por turnos entre sesiones, y
+    cada sesión tiene un cubo de tokens para que un usuario muy activo no
+    acapare el trabajador: si su cubo está vacío, sus peticiones esperan sin
+    bloquear a las demás. El cubo solo limita cuando hay competencia: con
+    plazas libres y nadie más esperando, la petición entra igualmente.
+    """
+
+    def __init__(self, rate=0.1, burst=3, flag_ttl=3600.0):
+        self.rate = rate
+        self.burst = burst
+        self.flag_ttl = flag_ttl
+        self._crisis = deque()
+        self._sessions = OrderedDict()  # sesión -> deque de tickets, en orden de turno
+        self._buckets = {}
+        self._flagged = {}  # sesión -> instante de caducidad de la marca
+
+    def __len__(self):
+        return len(self._crisis) + sum(len(tickets) for tickets in self._sessions.values())
+
+    def flag_session(self, session_id, now=None):
+        """Marca una sesión para que sus próximas peticiones vayan al carril de crisis"""
+        if session_id is not None:
+            now = time.monotonic() if now is None else now
+            self._flagged[session_id] = now + self.flag_ttl
+
+    def is_flagged(self, session_id, now=None):
+        expires = self._flagged.get(session_id)
+        if expires is None:
+            return False
+        if expires < (time.monotonic() if now is None else now):
+            del self._flagged[session_id]
+            return False
+        return True
+
+    def make_ticket(self, session_id, crisis=False, now=None):
+        """Crea el ticket de una petición, en el carril de crisis si la sesión está marcada"""
+        now = time.monotonic() if now is None else now
+        if crisis:
+            self.flag_session(session_id, now)
+        lane = CRISIS_LANE if crisis or self.is_flagged(session_id, now) else NORMAL_LANE
+        return Ticket(session_id, lane, now)
+
+    def _bucket(self, ticket, now):
+        if ticket.anonymous:
+            return None
+        bucket = self._buckets.get(ticket.session_id)
+        if bucket is None:
+            bucket = self._buckets[ticket.session_id] = TokenBucket(self.rate, self.burst, now)
+        return bucket
+
+    def ready(self, ticket, now):
+        """Indica si el ticket podría entrar ya según el límite de ritmo de su sesión"""
+        if ticket.lane == CRISIS_LANE:
+            return True
+        bucket = self._bucket(ticket, now)
+        return bucket is None or bucket.ready(now)
+
+    def time_until_ready(self, ticket, now):
+        if ticket.lane == CRISIS_LANE:
+            return 0.0
+        bucket = self._bucket(ticket, now)
+        return 0.0 if bucket is None else bucket.time_until_ready(now)
+
+    def push(self, ticket):
+        """Añade un ticket a la cola y devuelve su posición estimada (1 = el siguiente)"""
+        if ticket.lane == CRISIS_LANE:
+            self._crisis.append(ticket)
+            return len(self._crisis)
+        self._sessions.setdefault(ticket.session_id, deque()).append(ticket)
+        self._prune()
+        # Todos los de crisis van delante; de los normales, uno por sesión en cada vuelta
+        rounds = len(self._sessions[ticket.session_id])
+        ahead = sum(min(len(tickets), rounds) for session, tickets in self._sessions.items()
+                    if session != ticket.session_id)
+        return len(self._crisis) + ahead + rounds
+
+    def remove(self, ticket):
+        if ticket.lane == CRISIS_LANE:
+            self._crisis.remove(ticket)
+            return
+        tickets = self._sessions[ticket.session_id]
+        tickets.remove(ticket)
+        if not tickets:
+            del self._sessions[ticket.session_id]
+
+    def peek(self, now, idle=False):
+        """
+        Siguiente ticket que debe recibir plaza
+
+        Args:
+            now (float): Instante actual (time.monotonic)
+            idle (bool): Hay plazas libres; si ninguna sesión cumple su límite de ritmo,
+                entra igualmente la primera en turno en lugar de dejar el trabajador parado
+
+        Returns:
+            Ticket: Siguiente ticket, o None si ninguno puede entrar todavía
+        """
+        if self._crisis:
+            return self._crisis[0]
+        for tickets in self._sessions.values():
+            if self.ready(tickets[0], now):
+                return tickets[0]
+        if idle and self._sessions:
+            return next(iter(self._sessions.values()))[0]
+        return None
+
+    def pop(self, ticket, now):
+        """Saca el ticket admitido, consume un token de su sesión y pasa el turno a la siguiente"""
+        self.remove(ticket)
+        self.consume(ticket, now)
+        if ticket.session_id in self._sessions:
+            self._sessions.move_to_end(ticket.session_id)
+
+    def consume(self, ticket, now):
+        if ticket.lane != CRISIS_LANE:
+            bucket = self._bucket(ticket, now)
+            if bucket is not None:
+                bucket.take(now)
+
+    def _prune(self, now=None):
+        """Olvida los cubos llenos de sesiones sin peticiones (equivalen a uno nuevo)"""
+        if len(self._buckets) <= 10000:
+            return
+        now = time.monotonic() if now is None else now
+        for session_id in [s for s, bucket in self._buckets.items() if s not in self._sessions and bucket.full(now)]:
+            del self._buckets[session_id]
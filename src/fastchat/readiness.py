@@ -0,0 +1,185 @@
+import json
+import socket
+import threading
+import time
+from concurrent.futures import Future
+from src.config.settings import FASTCHAT_CONFIG
+from src.fastchat.http_client import INTERNAL_CLIENT
+
+class ComponentHandle:
+    """
+    Referencia a un componente lanzado en segundo plano. El atributo ready es
+    un Future que se resuelve cuando el componente responde de verdad (no
+    cuando se ha creado su hilo).
+    """
+
+    def __init__(self, name, thread, ready):
+        self.name = name
+        self.thread = thread
+        self.ready = ready
+        self.started_at = time.time()
+
+    @property
+    def ready_at(self):
+        """Momento en que el componente estuvo listo, o None si aún no lo está"""
+        if self.ready.done() and not self.ready.cancelled() and self.ready.exception() is None:
+            return self.ready.result()
+        return None
+
+    def wait(self, timeout=None):
+        """Bloquea hasta que el componente esté listo; lanza TimeoutError o RuntimeError si falla"""
+        return self.ready.result(timeout)
+
+    def is_alive(self):
+        return self.thread.is_alive()
+
+def poll_until_ready(name, probe, timeout=None, failed=None):
+    """
+    Comprueba periódicamente un componente con espera exponencial
+
+    Args:
+        name (str): Nombre del componente (clave en FASTCHAT_CONFIG["startup"]["timeouts"])
+        probe (callable): Función sin argumentos que devuelve True cuando está listo
+        timeout (float): Tiempo máximo de espera en segundos
+        failed (callable): Devuelve True si el componente ya ha fallado y no merece esperar
+
+    Returns:
+        Future: Se resuelve con el instante (time.time()) en que el componente está listo
+    """
+    cfg = FASTCHAT_CONFIG["startup"]
+    if timeout is None:
+        timeout = cfg["timeouts"].get(name, 60)
+    future = Future()
+
+    def run():
+        deadline = time.monotonic() + timeout
+        delay = cfg["initial_delay"]
+        while True:
+            try:
+                if probe():
+                    future.set_result(time.time())
+                    return
+            except Exception:
+                pass
+            if failed is not None and failed():
+                future.set_exception(RuntimeError(f"{name} terminó antes de estar listo"))
+                return
+            if time.monotonic() + delay > deadline:
+                future.set_exception(TimeoutError(f"{name} no respondió en {timeout:.0f}s"))
+                return
+            time.sleep(delay)
+            delay = min(delay * 2, cfg["max_delay"])
+
+    threading.Thread(target=run, name=f"{name}-readiness", daemon=True).start()
+    return future
+
+class HandleGroup:
+    """Varios componentes del mismo tipo (por ejemplo, un pool de trabajadores)"""
+
+    def __init__(self, handles):
+        self.handles = handles
+
+    def is_alive(self):
+        return any(handle.is_alive() for handle in self.handles)
+
+def combine_handles(name, handles):
+    """
+    Agrupa varios componentes en un único ComponentHandle que está listo en
+    cuanto lo está el primero, y falla solo si fallan todos
+
+    Args:
+        name (str): Nombre del grupo
+        handles (list): ComponentHandle de cada miembro
+
+    Returns:
+        ComponentHandle: Handle del grupo; sus miembros están en .thread.handles
+    """
+    if len(handles) == 1:
+        return handles[0]
+    future = Future()
+    lock = threading.Lock()
+    pending = [len(handles)]
+
+    def member_done(member_future):
+        with lock:
+            pending[0] -= 1
+            if future.done():
+                return
+            if member_future.exception() is None:
+                future.set_result(member_future.result())
+            elif pending[0] == 0:
+                future.set_exception(RuntimeError(f"ningún {name} está disponible"))
+
+    for handle in handles:
+        handle.ready.add_done_callback(member_done)
+    return ComponentHandle(name, HandleGroup(handles), future)
+
+def launch_component(name, target, probe):
+    """
+    Ejecuta target en un hilo daemon y devuelve su ComponentHandle
+
+    Las funciones start_* devuelven None cuando fallan, así que si el hilo
+    termina sin resultado se deja de esperar al componente.
+
+    Args:
+        name (str): Nombre del componente
+        target (callable): Función que inicia el componente
+        probe (callable): Comprobación de disponibilidad
+
+    Returns:
+        ComponentHandle: Componente lanzado
+    """
+    outcome = {}
+
+    def run():
+        outcome["result"] = target()
+
+    thread = threading.Thread(target=run, name=name, daemon=True)
+    thread.start()
+    failed = lambda: not thread.is_alive() and outcome.get("result") is None
+    return ComponentHandle(name, thread, poll_until_ready(name, probe, failed=failed))
+
+def request_json(url, payload=None, timeout=2.0, idempotent=True):
+    """
+    Hace una petición HTTP interna con el cliente compartido y devuelve (status, cuerpo)
+
+    Las sondas de estado son consultas aunque FastChat las exponga como POST,
+    así que por defecto se pueden reintentar; las que cambian estado (p. ej.
+    registrar un trabajador) pasan idempotent=False.
+    """
+    method = "POST" if payload is not None else "GET"
+    return INTERNAL_CLIENT.request(method, url, payload, timeout, idempotent=idempotent)
+
+def controller_address():
+    cfg = FASTCHAT_CONFIG["controller"]
+    return f"http://{cfg['host']}:{cfg['port']}"
+
+def controller_ready():
+    """El controlador responde a /list_models"""
+    status, _ = request_json(f"{controller_address()}/list_models", {})
+    return status == 200
+
+def worker_registered(model_name=None):
+    """El trabajador se ha registrado en el controlador (el modelo ya está cargado)"""
+    if model_name is None:
+        model_name = FASTCHAT_CONFIG["model_worker"].get("model_names", ["vicuna"])[0]
+    status, body = request_json(f"{controller_address()}/get_worker_address", {"model": model_name})
+    return status == 200 and bool(json.loads(body).get("address"))
+
+def api_ready():
+    """El servidor API responde a /v1/models"""
+    cfg = FASTCHAT_CONFIG["api_server"]
+    status, _ = request_json(f"http://{cfg['host']}:{cfg['port']}/v1/models")
+    return status == 200
+
+def port_open(host, port, timeout=1.0):
+    """El puerto acepta conexiones TCP"""
+    if host in ("0.0.0.0", ""):
+        host = "127.0.0.1"
+    with socket.create_connection((host, int(port)), timeout=timeout):
+        return True
+
+def web_ready():
+    """Gradio está escuchando en su puerto"""
+    cfg = FASTCHAT_CONFIG["web_server"]
+    return port_open(cfg.get("host", "0.0.0.0"), cfg.get("port", 7860))
@@ -0,0 +1,241 @@
+import json
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from src.config.settings import FASTCHAT_CONFIG
+from src.fastchat.safety_middleware import (
+    build_completion_payload, build_stream_events, read_body, replay_receive, send_bytes
+)
+
+# Solo se cachean respuestas de chat: los primeros turnos llegan por aquí
+CACHED_PATH = "/v1/chat/completions"
+
+class ResponseCache:
+    """
+    Caché de respuestas con expulsión LRU por tamaño y caducidad (TTL).
+    Es segura entre hilos y lleva la cuenta de aciertos y fallos.
+    """
+
+    def __init__(self, max_entries=512, ttl=3600.0):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()  # clave -> (instante de caducidad, valor)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.bypassed = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key):
+        """Devuelve el valor guardado para key, o None si no está o ha caducado"""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] < now:
+                del self._entries[key]
+                self.expirations += 1
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key, value):
+        """Guarda value y expulsa las entradas menos usadas si se supera el tamaño"""
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def record_bypass(self):
+        """Cuenta una petición que no podía usar la caché (no es primer turno o no es determinista)"""
+        with self._lock:
+            self.bypassed += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def snapshot(self):
+        """Devuelve las métricas actuales como diccionario"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "bypassed": self.bypassed,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+            }
+
+def normalize_prompt(text):
+    """Normaliza un mensaje para la clave de la caché: Unicode NFC, minúsculas y espacios simples"""
+    return " ".join(unicodedata.normalize("NFC", text).casefold().split())
+
+def _message_text(message):
+    content = message.get("content")
+    if isinstance(content, list):
+        return " ".join(part.get("text", "") for part in content if isinstance(part, dict))
+    return content or ""
+
+def cache_key(body, max_temperature):
+    """
+    Calcula la clave de caché de una petición de chat
+
+    Solo son cacheables los primeros turnos (un único mensaje del usuario,
+    con mensaje de sistema opcional) con temperatura baja y una sola respuesta.
+
+    Args:
+        body (dict): Cuerpo de la petición /v1/chat/completions
+        max_temperature (float): Temperatura máxima para considerarla determinista
+
+    Returns:
+        tuple: Clave (prompt normalizado, categoría, parámetros), o None si no es cacheable
+    """
+    if not isinstance(body, dict):
+        return None
+    messages = body.get("messages")
+    if not isinstance(messages, list) or body.get("n", 1) != 1:
+        return None
+    roles = [message.get("role") for message in messages if isinstance(message, dict)]
+    if len(roles) != len(messages) or roles.count("user") != 1 or any(role not in ("system", "user") for role in roles):
+        return None
+    # Los campos los controla el cliente: si no tienen la forma esperada, la petición no se cachea
+    # y FastChat responde con su propio error
+    try:
+        temperature = body.get("temperature", 1.0)
+        if temperature is None or float(temperature) > max_temperature:
+            return None
+        stop = body.get("stop")
+        key = (
+            body.get("model", ""),
+            body.get("category", "General"),
+            tuple(normalize_prompt(_message_text(message)) for message in messages),
+            round(float(temperature), 3),
+            body.get("top_p"),
+            body.get("max_tokens"),
+            body.get("presence_penalty"),
+            body.get("frequency_penalty"),
+            tuple(stop) if isinstance(stop, list) else stop,
+        )
+        hash(key)
+    except (TypeError, ValueError):
+        return None
+    return key
+
+def parse_completion(raw_body, stream):
+    """
+    Extrae el texto completo de una respuesta de chat de FastChat
+
+    Args:
+        raw_body (bytes): Cuerpo de la respuesta (JSON o eventos SSE)
+        stream (bool): Si la respuesta es en streaming
+
+    Returns:
+        tuple: (texto, usage) si la generación terminó correctamente, o None
+    """
+    try:
+        if not stream:
+            payload = json.loads(raw_body)
+            choice = payload["choices"][0]
+            if choice.get("finish_reason") not in ("stop", "length"):
+                return None
+            return choice["message"]["content"], payload.get("usage")
+        pieces = []
+        finish_reason = None
+        for event in raw_body.decode("utf-8").split("\n\n"):
+            if not event.startswith("data: ") or event == "data: [DONE]":
+                continue
+            choice = json.loads(event[len("data: "):])["choices"][0]
+            pieces.append(choice.get("delta", {}).get("content") or "")
+            finish_reason = choice.get("finish_reason") or finish_reason
+        if finish_reason not in ("stop", "length"):
+            return None
+        return "".join(pieces), None
+    except (ValueError, KeyError, IndexError, TypeError):
+        # Errores de FastChat u objetos inesperados: no se cachea
+        return None
+
+class ResponseCacheMiddleware:
+    """
+    Middleware ASGI que responde desde la caché los primeros turnos repetidos
+    (por ejemplo, los mensajes iniciales de cada categoría de la interfaz) y
+    guarda las respuestas nuevas que cumplen las condiciones.
+    """
+
+    def __init__(self, app, cache, max_temperature=0.3):
+        self.app = app
+        self.cache = cache
+        self.max_temperature = max_temperature
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope.get("method") != "POST" or scope.get("path") != CACHED_PATH:
+            await self.app(scope, receive, send)
+            return
+
+        raw_body, pending = await read_body(receive)
+        if pending is not None:
+            return
+        try:
+            body = json.loads(raw_body or b"{}")
+        except ValueError:
+            body = None
+        key = cache_key(body, self.max_temperature) if isinstance(body, dict) else None
+        if key is None:
+            self.cache.record_bypass()
+            await self.app(scope, replay_receive(raw_body, receive), send)
+            return
+
+        path = scope["path"]
+        stream = bool(body.get("stream"))
+        cached = self.cache.get(key)
+        if cached is not None:
+            text, usage = cached
+            if stream:
+                await send_bytes(send, 200, b"text/event-stream", build_stream_events(path, body, text))
+            else:
+                payload = build_completion_payload(path, body, text)
+                if usage:
+                    payload["usage"] = usage
+                await send_bytes(send, 200, b"application/json", json.dumps(payload, ensure_ascii=False).encode("utf-8"))
+            return
+
+        status = {}
+        chunks = []
+
+        async def capturing_send(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+            elif message["type"] == "http.response.body":
+                chunks.append(message.get("body", b""))
+                if not message.get("more_body", False) and status.get("code") == 200:
+                    completion = parse_completion(b"".join(chunks), stream)
+                    if completion is not None:
+                        self.cache.put(key, completion)
+            await send(message)
+
+        await self.app(scope, replay_receive(raw_body, receive), capturing_send)
+
+RESPONSE_CACHE = ResponseCache(
+    FASTCHAT_CONFIG["response_cache"]["max_entries"],
+    FASTCHAT_CONFIG["response_cache"]["ttl"],
+)
+
+def install_response_cache(app, cache=None):
+    """Añade la caché de respuestas y su endpoint de métricas a una app FastAPI"""
+    cfg = FASTCHAT_CONFIG["response_cache"]
+    if getattr(app.state, "response_cache", False):
+        return app
+    cache = cache or RESPONSE_CACHE
+    app.add_middleware(ResponseCacheMiddleware, cache=cache, max_temperature=cfg["max_temperature"])
+    app.add_api_route("/v1/cache/stats", cache.snapshot, methods=["GET"])
+    app.state.response_cache = True
+    return app
@@ -0,0 +1,229 @@
+import json
+import threading
+import time
+import uuid
+from src.utils.safety import detect_crisis, get_crisis_response
+
+# Rutas de generación que se revisan antes de llegar al modelo
+GENERATION_PATHS = ("/v1/chat/completions", "/v1/completions")
+
+class ShortCircuitStats:
+    """Contadores de las peticiones respondidas sin pasar por el modelo"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.short_circuited = 0
+        self.check_time = 0.0
+        self.checks = 0
+        self.generation_time = 0.0
+        self.generations = 0
+        self.time_saved = 0.0
+
+    def record_check(self, elapsed, crisis):
+        with self._lock:
+            self.checks += 1
+            self.check_time += elapsed
+            if crisis:
+                self.short_circuited += 1
+                # Cada atajo ahorra, en promedio, lo que tarda una generación normal
+                if self.generations:
+                    self.time_saved += self.generation_time / self.generations
+
+    def record_generation(self, elapsed):
+        with self._lock:
+            self.generations += 1
+            self.generation_time += elapsed
+
+    def snapshot(self):
+        """Devuelve las métricas actuales como diccionario"""
+        with self._lock:
+            return {
+                "short_circuited": self.short_circuited,
+                "checks": self.checks,
+                "avg_check_us": self.check_time / self.checks * 1e6 if self.checks else 0.0,
+                "avg_generation_s": self.generation_time / self.generations if self.generations else 0.0,
+                "estimated_time_saved_s": self.time_saved,
+            }
+
+SHORT_CIRCUIT_STATS = ShortCircuitStats()
+
+def screen_message(message):
+    """
+    Revisa un mensaje antes de enviarlo al modelo
+
+    Args:
+        message (str): Mensaje del usuario
+
+    Returns:
+        str: Respuesta del protocolo de crisis, o None si no se detecta crisis
+    """
+    start = time.perf_counter()
+    crisis_detected, keywords = detect_crisis(message or "")
+    SHORT_CIRCUIT_STATS.record_check(time.perf_counter() - start, crisis_detected)
+    return get_crisis_response(keywords) if crisis_detected else None
+
+def extract_user_message(path, body):
+    """
+    Obtiene el último mensaje del usuario de una petición compatible con OpenAI
+
+    El cuerpo lo controla el cliente: lo que no tenga la forma esperada no se
+    revisa (se devuelve "") y FastChat responde con su propio error 400.
+
+    Args:
+        path (str): Ruta de la petición
+        body (dict): Cuerpo JSON de la petición
+
+    Returns:
+        str: Texto del último mensaje del usuario, o "" si no hay ninguno revisable
+    """
+    if path.endswith("/chat/completions"):
+        messages = body.get("messages")
+        if isinstance(messages, str):
+            return messages
+        if not isinstance(messages, list):
+            return ""
+        for message in reversed(messages):
+            if not isinstance(message, dict) or message.get("role") != "user":
+                continue
+            content = message.get("content")
+            if isinstance(content, list):
+                # Contenido multimodal: solo las partes de texto
+                return " ".join(part["text"] for part in content
+                                if isinstance(part, dict) and isinstance(part.get("text"), str))
+            return content if isinstance(content, str) else ""
+        return ""
+    prompt = body.get("prompt", "")
+    if isinstance(prompt, list):
+        prompt = prompt[-1] if prompt else ""
+    return prompt if isinstance(prompt, str) else ""
+
+def build_completion_payload(path, body, text):
+    """Construye una respuesta con formato OpenAI para el texto indicado"""
+    created = int(time.time())
+    model = body.get("model", "")
+    if path.endswith("/chat/completions"):
+        return {
+            "id": f"chatcmpl-{uuid.uuid4().hex}",
+            "object": "chat.completion",
+            "created": created,
+            "model": model,
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": text}, "finish_reason": "stop"}],
+            "usage": {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0},
+        }
+    return {
+        "id": f"cmpl-{uuid.uuid4().hex}",
+        "object": "text_completion",
+        "created": created,
+        "model": model,
+        "choices": [{"index": 0, "text": text, "logprobs": None, "finish_reason": "stop"}],
+        "usage": {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0},
+    }
+
+def build_stream_events(path, body, text):
+    """Construye los eventos SSE equivalentes a una respuesta en streaming"""
+    created = int(time.time())
+    model = body.get("model", "")
+    if path.endswith("/chat/completions"):
+        chunk_id = f"chatcmpl-{uuid.uuid4().hex}"
+        deltas = [({"role": "assistant"}, None), ({"content": text}, None), ({}, "stop")]
+        chunks = [
+            {"id": chunk_id, "object": "chat.completion.chunk", "created": created, "model": model,
+             "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}]}
+            for delta, finish_reason in deltas
+        ]
+    else:
+        chunk_id = f"cmpl-{uuid.uuid4().hex}"
+        chunks = [
+            {"id": chunk_id, "object": "text_completion", "created": created, "model": model,
+             "choices": [{"index": 0, "text": piece, "logprobs": None, "finish_reason": finish_reason}]}
+            for piece, finish_reason in ((text, None), ("", "stop"))
+        ]
+    events = [f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n" for chunk in chunks]
+    events.append("data: [DONE]\n\n")
+    return "".join(events).encode("utf-8")
+
+async def read_body(receive):
+    """Lee el cuerpo completo de una petición ASGI"""
+    chunks = []
+    while True:
+        message = await receive()
+        if message["type"] != "http.request":
+            return b"".join(chunks), message
+        chunks.append(message.get("body", b""))
+        if not message.get("more_body", False):
+            return b"".join(chunks), None
+
+def replay_receive(body, receive):
+    """Crea un receive ASGI que devuelve primero el cuerpo ya leído"""
+    sent = False
+
+    async def replay():
+        nonlocal sent
+        if not sent:
+            sent = True
+            return {"type": "http.request", "body": body, "more_body": False}
+        return await receive()
+
+    return replay
+
+async def send_bytes(send, status, content_type, payload):
+    await send({
+        "type": "http.response.start",
+        "status": status,
+        "headers": [(b"content-type", content_type), (b"content-length", str(len(payload)).encode())],
+    })
+    await send({"type": "http.response.body", "body": payload})
+
+class CrisisShortCircuitMiddleware:
+    """
+    Middleware ASGI que revisa las peticiones de generación antes de que
+    lleguen al controlador. Si el mensaje del usuario indica una crisis,
+    responde directamente con el protocolo de crisis sin usar el modelo.
+    """
+
+    def __init__(self, app, stats=None):
+        self.app = app
+        self.stats = stats or SHORT_CIRCUIT_STATS
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope.get("method") != "POST" or scope.get("path") not in GENERATION_PATHS:
+            await self.app(scope, receive, send)
+            return
+
+        raw_body, pending = await read_body(receive)
+        if pending is not None:
+            # El cliente se desconectó antes de enviar el cuerpo completo
+            return
+        try:
+            body = json.loads(raw_body or b"{}")
+        except ValueError:
+            body = None
+
+        path = scope["path"]
+        if isinstance(body, dict):
+            crisis_response = screen_message(extract_user_message(path, body))
+            if crisis_response is not None:
+                if body.get("stream"):
+                    await send_bytes(send, 200, b"text/event-stream", build_stream_events(path, body, crisis_response))
+                else:
+                    payload = json.dumps(build_completion_payload(path, body, crisis_response), ensure_ascii=False)
+                    await send_bytes(send, 200, b"application/json", payload.encode("utf-8"))
+                return
+
+        start = time.perf_counter()
+
+        async def timed_send(message):
+            await send(message)
+            if message["type"] == "http.response.body" and not message.get("more_body", False):
+                self.stats.record_generation(time.perf_counter() - start)
+
+        await self.app(scope, replay_receive(raw_body, receive), timed_send)
+
+def install_safety_middleware(app):
+    """Añade el middleware de crisis y el endpoint de métricas a una app FastAPI"""
+    if getattr(app.state, "crisis_short_circuit", False):
+        return app
+    app.add_middleware(CrisisShortCircuitMiddleware)
+    app.add_api_route("/v1/safety/stats", SHORT_CIRCUIT_STATS.snapshot, methods=["GET"])
+    app.state.crisis_short_circuit = True
+    return app
@@ -0,0 +1,187 @@
+import asyncio
+import json
+import threading
+from src.config.settings import FASTCHAT_CONFIG
+from src.fastchat.safety_middleware import GENERATION_PATHS, read_body, replay_receive, send_bytes
+
+# Campos que no cambian la respuesta generada y no deben impedir agrupar peticiones
+IGNORED_FIELDS = ("user",)
+
+class SingleFlightStats:
+    """Contadores de generaciones compartidas entre peticiones idénticas"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.generations = 0
+        self.coalesced = 0
+        self.bypassed = 0
+        self.max_subscribers = 0
+
+    def record_generation(self):
+        with self._lock:
+            self.generations += 1
+
+    def record_coalesced(self, subscribers):
+        with self._lock:
+            self.coalesced += 1
+            self.max_subscribers = max(self.max_subscribers, subscribers)
+
+    def record_bypass(self):
+        with self._lock:
+            self.bypassed += 1
+
+    def snapshot(self):
+        """Devuelve las métricas actuales como diccionario"""
+        with self._lock:
+            return {
+                "generations": self.generations,
+                "avoided_generations": self.coalesced,
+                "bypassed": self.bypassed,
+                "max_subscribers": self.max_subscribers,
+            }
+
+SINGLE_FLIGHT_STATS = SingleFlightStats()
+
+def flight_key(path, body, max_temperature):
+    """
+    Clave de agrupación de una petición de generación
+
+    Args:
+        path (str): Ruta de la petición
+        body (dict): Cuerpo de la petición
+        max_temperature (float): Temperatura máxima para considerarla determinista
+
+    Returns:
+        str: Clave (ruta y cuerpo canónico), o None si la petición no es determinista
+    """
+    if not isinstance(body, dict):
+        return None
+    # Los campos los controla el cliente: si no tienen la forma esperada, la petición no se agrupa
+    # y FastChat responde con su propio error
+    try:
+        temperature = body.get("temperature", 1.0)
+        if temperature is None or float(temperature) > max_temperature or body.get("n", 1) != 1:
+            return None
+    except (TypeError, ValueError):
+        return None
+    canonical = {name: value for name, value in body.items() if name not in IGNORED_FIELDS}
+    return path + "\0" + json.dumps(canonical, sort_keys=True, ensure_ascii=False)
+
+class Flight:
+    """
+    Una generación en curso. Guarda los mensajes ASGI de la respuesta para
+    que cada suscriptor, llegue cuando llegue, reciba su propia copia completa.
+    """
+
+    def __init__(self):
+        self.messages = []
+        self.done = False
+        self.subscribers = 0
+        self.changed = asyncio.Condition()
+        self.abandoned = asyncio.Event()
+
+    async def publish(self, message):
+        async with self.changed:
+            self.messages.append(message)
+            self.changed.notify_all()
+
+    async def finish(self):
+        async with self.changed:
+            self.done = True
+            self.changed.notify_all()
+
+    async def receive_disconnect(self):
+        """receive ASGI de la generación: solo se desconecta cuando no queda ningún suscriptor"""
+        await self.abandoned.wait()
+        return {"type": "http.disconnect"}
+
+    async def stream_to(self, send):
+        """Envía al cliente todos los mensajes de la respuesta, los ya emitidos y los que vengan"""
+        index = 0
+        while True:
+            async with self.changed:
+                await self.changed.wait_for(lambda: len(self.messages) > index or self.done)
+                pending = self.messages[index:]
+                finished = self.done
+            for message in pending:
+                await send(message)
+            index += len(pending)
+            if finished and index == len(self.messages):
+                return index > 0
+
+class SingleFlightMiddleware:
+    """
+    Middleware ASGI que agrupa peticiones de generación idénticas y
+    deterministas: mientras una está generando, las siguientes se suscriben
+    a su respuesta en lugar de lanzar otra generación. Cada cliente recibe
+    su propia copia del stream, y la generación solo se cancela si se
+    desconectan todos.
+    """
+
+    def __init__(self, app, stats=None, max_temperature=0.3):
+        self.app = app
+        self.stats = stats or SINGLE_FLIGHT_STATS
+        self.max_temperature = max_temperature
+        self._flights = {}
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope.get("method") != "POST" or scope.get("path") not in GENERATION_PATHS:
+            await self.app(scope, receive, send)
+            return
+
+        raw_body, pending = await read_body(receive)
+        if pending is not None:
+            return
+        try:
+            body = json.loads(raw_body or b"{}")
+        except ValueError:
+            body = None
+        key = flight_key(scope["path"], body, self.max_temperature) if isinstance(body, dict) else None
+        if key is None:
+            self.stats.record_bypass()
+            await self.app(scope, replay_receive(raw_body, receive), send)
+            return
+
+        flight = self._flights.get(key)
+        if flight is None:
+            flight = Flight()
+            self._flights[key] = flight
+            self.stats.record_generation()
+            asyncio.get_running_loop().create_task(self._run(key, flight, scope, raw_body))
+        else:
+            self.stats.record_coalesced(flight.subscribers + 1)
+
+        flight.subscribers += 1
+        try:
+            if not await flight.stream_to(send):
+                # La generación falló antes de empezar la respuesta
+                await send_bytes(send, 500, b"application/json", b'{"object": "error", "message": "Internal Server Error"}')
+        finally:
+            flight.subscribers -= 1
+            if flight.subscribers == 0:
+                # Ningún cliente espera ya esta respuesta: dejar que la app cancele la generación
+                flight.abandoned.set()
+                if self._flights.get(key) is flight:
+                    del self._flights[key]
+
+    async def _run(self, key, flight, scope, raw_body):
+        """Ejecuta la generación una sola vez, desacoplada de los clientes que la esperan"""
+        try:
+            await self.app(scope, replay_receive(raw_body, flight.receive_disconnect), flight.publish)
+        except Exception as e:
+            print(f"⚠️ Error en una generación compartida: {e}")
+        finally:
+            if self._flights.get(key) is flight:
+                del self._flights[key]
+            await flight.finish()
+
+def install_single_flight(app, stats=None):
+    """Añade la agrupación de peticiones idénticas y su endpoint de métricas a una app FastAPI"""
+    if getattr(app.state, "single_flight", False):
+        return app
+    stats = stats or SINGLE_FLIGHT_STATS
+    cfg = FASTCHAT_CONFIG["single_flight"]
+    app.add_middleware(SingleFlightMiddleware, stats=stats, max_temperature=cfg["max_temperature"])
+    app.add_api_route("/v1/single_flight/stats", stats.snapshot, methods=["GET"])
+    app.state.single_flight = True
+    return app
@@ -0,0 +1,305 @@
+import json
+import time
+import threading
+from src.fastchat.model_worker import GenerationRequest
+
+def tokenizers_compatible(target_tokenizer, draft_tokenizer):
+    """
+    Comprueba que el modelo borrador y el principal usan el mismo vocabulario
+
+    La verificación compara las probabilidades de los dos modelos token a
+    token, así que los ids tienen que significar lo mismo en ambos.
+
+    Returns:
+        tuple: (True si son compatibles, motivo si no lo son)
+    """
+    if len(target_tokenizer) != len(draft_tokenizer):
+        return False, f"vocabularios de {len(target_tokenizer)} y {len(draft_tokenizer)} tokens"
+    if target_tokenizer.eos_token_id != draft_tokenizer.eos_token_id:
+        return False, "el token de fin de secuencia es distinto"
+    if target_tokenizer.get_vocab() != draft_tokenizer.get_vocab():
+        return False, "los tokens no coinciden"
+    return True, ""
+
+def _crop_cache(past, length):
+    """Descarta de la caché KV las posiciones a partir de length"""
+    if hasattr(past, "crop"):
+        past.crop(length)
+        return past
+    return tuple((key[:, :, :length], value[:, :, :length]) for key, value in past)
+
+class SpeculativeDecoder:
+    """
+    Decodificación especulativa: un modelo borrador pequeño propone
+    draft_length tokens y el modelo principal los verifica en una sola pasada.
+
+    Cada propuesta se acepta con probabilidad min(1, p/q) (p del modelo
+    principal, q del borrador); en el primer rechazo el token se muestrea de
+    max(0, p - q) normalizado y, si se aceptan todas, se añade uno más de la
+    última distribución del modelo principal. Así la salida sigue exactamente
+    la distribución del modelo principal, y cada pasada suya produce entre 1
+    y draft_length + 1 tokens. Con temperatura 0 equivale a aceptar mientras
+    el borrador coincide con el argmax del modelo principal.
+    """
+
+    def __init__(self, model, draft_model, tokenizer, device="cpu", draft_length=4, context_len=2048,
+                 log_interval=0):
+        self.model = model
+        self.draft_model = draft_model
+        self.tokenizer = tokenizer
+        self.device = device
+        self.draft_length = max(0, int(draft_length))
+        self.context_len = context_len
+        self.log_interval = int(log_interval)
+        self._vocab = len(tokenizer)
+        self._stats_lock = threading.Lock()
+        self.requests = 0
+        self.rounds = 0
+        self.proposed = 0
+        self.accepted = 0
+        self.tokens = 0
+        self.busy_time = 0.0
+
+    def generate_stream(self, params):
+        """
+        Genera una respuesta y devuelve sus salidas con el formato de FastChat
+
+        Args:
+            params (dict): Parámetros de generación de FastChat (prompt, temperature, ...)
+
+        Returns:
+            generator: Diccionarios con "text" acumulado, "usage" y "finish_reason"
+        """
+        import torch
+        max_new_tokens = int(params.get("max_new_tokens", 256))
+        input_ids = self.tokenizer(params["prompt"]).input_ids
+        # Igual que FastChat: recortar el prompt por la izquierda para que quepa la respuesta
+        max_src_len = max(1, self.context_len - max_new_tokens - 1)
+        request = GenerationRequest(params, params["prompt"], input_ids[-max_src_len:])
+        state = {"target": None, "target_len": 0, "draft": None, "draft_len": 0}
+        finish_reason = None
+        while finish_reason is None:
+            start = time.perf_counter()
+            with torch.inference_mode():
+                new_tokens = self._round(request, state)
+            with self._stats_lock:
+                self.busy_time += time.perf_counter() - start
+            finish_reason, text = self._append(request, new_tokens)
+            yield {
+                "text": request.prompt + text if request.echo else text,
+                "usage": {
+                    "prompt_tokens": len(request.input_ids),
+                    "completion_tokens": len(request.output_ids),
+                    "total_tokens": len(request.input_ids) + len(request.output_ids),
+                },
+                "finish_reason": finish_reason,
+                "error_code": 0,
+            }
+        with self._stats_lock:
+            self.requests += 1
+            log = self.log_interval and self.requests % self.log_interval == 0
+        if log:
+            metrics = self.metrics()
+            print(f"📈 Decodificación especulativa: {metrics['acceptance_rate']:.0%} de propuestas aceptadas, "
+                  f"{metrics['tokens_per_round']:.2f} tokens por pasada del modelo, {metrics['tokens_per_s']:.1f} tokens/s")
+
+    def _forward(self, model, state, key, input_ids):
+        """Pasada de uno de los modelos sobre los tokens que su caché aún no tiene"""
+        import torch
+        kwargs = {"input_ids": torch.tensor([input_ids], device=self.device), "use_cache": True}
+        if state[key] is not None:
+            kwargs["past_key_values"] = state[key]
+        out = model(**kwargs)
+        state[key] = out.past_key_values
+        state[key + "_len"] += len(input_ids)
+        # Los modelos suelen rellenar la matriz de salida más allá del vocabulario del tokenizador
+        return out.logits[0, :, :self._vocab]
+
+    def _distribution(self, request, logits, seen):
+        """Probabilidades del siguiente token con los parámetros de la petición"""
+        import torch
+        logits = logits.float()
+        if request.repetition_penalty > 1.0:
+            ids = torch.tensor(sorted(set(seen)), device=logits.device)
+            score = logits[ids]
+            logits[ids] = torch.where(score < 0, score * request.repetition_penalty, score / request.repetition_penalty)
+        if request.temperature < 1e-5 or request.top_p < 1e-8:
+            probs = torch.zeros_like(logits)
+            probs[torch.argmax(logits)] = 1.0
+            return probs
+        probs = torch.softmax(logits / request.temperature, dim=-1)
+        if request.top_p < 1.0:
+            sorted_probs, indices = torch.sort(probs, descending=True)
+            sorted_probs[torch.cumsum(sorted_probs, dim=-1) - sorted_probs > request.top_p] = 0.0
+            probs = torch.zeros_like(probs).scatter_(0, indices, sorted_probs)
+            probs = probs / probs.sum()
+        return probs
+
+    def _round(self, request, state):
+        """
+        Una ronda de propuesta y verificación
+
+        Returns:
+            list: Tokens nuevos (los aceptados más el de corrección o el adicional)
+        """
+        import torch
+        ids = request.input_ids + request.output_ids
+        remaining = request.max_new_tokens - len(request.output_ids)
+        draft_length = min(self.draft_length, remaining - 1, self.context_len - len(ids) - 1)
+
+        # Propuestas del borrador, una a una sobre su propia caché
+        drafts, draft_probs = [], []
+        if draft_length > 0:
+            pending = ids[state["draft_len"]:]
+            for _ in range(draft_length):
+                logits = self._forward(self.draft_model, state, "draft", pending)[-1]
+                probs = self._distribution(request, logits, ids + drafts)
+                token = int(torch.multinomial(probs, 1))
+                drafts.append(token)
+                draft_probs.append(probs)
+                pending = [token]
+
+        # Verificación: una pasada del modelo principal da las distribuciones de todas las posiciones
+        logits = self._forward(self.model, state, "target", ids[state["target_len"]:] + drafts)
+        logits = logits[-(len(drafts) + 1):]
+        accepted = []
+        for index, token in enumerate(drafts):
+            probs = self._distribution(request, logits[index], ids + accepted)
+            q = draft_probs[index]
+            if torch.rand(()) * q[token] < probs[token]:
+                accepted.append(token)
+                continue
+            residual = torch.clamp(probs - q, min=0.0)
+            total = residual.sum()
+            correction = int(torch.multinomial(residual / total, 1)) if total > 0 else int(torch.multinomial(probs, 1))
+            new_tokens = accepted + [correction]
+            break
+        else:
+            # Todas aceptadas: el modelo principal aporta un token más gratis
+            probs = self._distribution(request, logits[len(drafts)], ids + accepted)
+            new_tokens = accepted + [int(torch.multinomial(probs, 1))]
+
+        # Las cachés solo conservan los tokens confirmados; el último se procesa en la siguiente ronda
+        keep = len(ids) + len(accepted)
+        state["target"] = _crop_cache(state["target"], keep)
+        state["target_len"] = keep
+        if state["draft"] is not None and state["draft_len"] > keep:
+            state["draft"] = _crop_cache(state["draft"], keep)
+            state["draft_len"] = keep
+        with self._stats_lock:
+            self.rounds += 1
+            self.proposed += len(drafts)
+            self.accepted += len(accepted)
+        return new_tokens
+
+    def _append(self, request, new_tokens):
+        """
+        Añade los tokens nuevos y comprueba las condiciones de parada
+
+        Returns:
+            tuple: (finish_reason o None, texto generado)
+        """
+        finish_reason = None
+        for token in new_tokens:
+            request.output_ids.append(token)
+            if token == self.tokenizer.eos_token_id or token in request.stop_token_ids:
+                finish_reason = "stop"
+                break
+            if len(request.output_ids) >= request.max_new_tokens:
+                finish_reason = "length"
+                break
+        with self._stats_lock:
+            self.tokens += len(new_tokens)
+        text = self.tokenizer.decode(
+            request.output_ids, skip_special_tokens=True,
+            spaces_between_special_tokens=False, clean_up_tokenization_spaces=True
+        )
+        for stop in request.stop_strings:
+            position = text.find(stop)
+            if position != -1:
+                text = text[:position]
+                finish_reason = "stop"
+        return finish_reason, text
+
+    def metrics(self):
+        """
+        Estadísticas de aceptación y velocidad
+
+        Returns:
+            dict: Peticiones, tasa de aceptación, tokens por pasada del modelo principal y tokens/s
+        """
+        with self._stats_lock:
+            return {
+                "requests": self.requests,
+                "draft_length": self.draft_length,
+                "proposed": self.proposed,
+                "accepted": self.accepted,
+                "acceptance_rate": self.accepted / self.proposed if self.proposed else 0.0,
+                "tokens_per_round": self.tokens / self.rounds if self.rounds else 0.0,
+                "tokens_per_s": self.tokens / self.busy_time if self.busy_time else 0.0,
+            }
+
+def load_draft_model(draft_path, tokenizer, device="cpu", dtype=None):
+    """
+    Carga el modelo borrador y comprueba que su tokenizador es compatible
+
+    Args:
+        draft_path (str): Carpeta o nombre en Hugging Face Hub del modelo borrador
+        tokenizer: Tokenizador del modelo principal
+        device (str): Dispositivo del modelo principal
+        dtype: dtype del modelo principal
+
+    Returns:
+        El modelo borrador, o None si no se puede usar
+    """
+    from transformers import AutoModelForCausalLM, AutoTokenizer
+    from src.utils.safetensors_io import resolve_model_dir
+    draft_dir = resolve_model_dir(draft_path) or draft_path
+    try:
+        draft_tokenizer = AutoTokenizer.from_pretrained(draft_dir, use_fast=False)
+    except (OSError, ValueError) as e:
+        print(f"⚠️ No se pudo cargar el tokenizador del modelo borrador {draft_path}: {e}")
+        return None
+    compatible, reason = tokenizers_compatible(tokenizer, draft_tokenizer)
+    if not compatible:
+        print(f"⚠️ El modelo borrador {draft_path} no comparte el tokenizador del modelo principal ({reason}); "
+              "la decodificación especulativa queda desactivada")
+        return None
+    draft = AutoModelForCausalLM.from_pretrained(draft_dir, torch_dtype=dtype, low_cpu_mem_usage=True)
+    return draft.to(device).eval()
+
+def enable_speculative_decoding(worker, cfg, cpu_profile=None):
+    """
+    Sustituye generate_stream_gate del trabajador por la decodificación especulativa
+
+    Args:
+        worker: Instancia de ModelWorker de FastChat
+        cfg (dict): FASTCHAT_CONFIG["model_worker"]["speculative"]
+        cpu_profile (dict): Perfil de CPU activo, para cuantizar también el borrador
+
+    Returns:
+        SpeculativeDecoder: Decodificador instalado, o None si el borrador no es compatible
+    """
+    dtype = next(worker.model.parameters()).dtype
+    draft = load_draft_model(cfg["draft_model"], worker.tokenizer, worker.device, dtype)
+    if draft is None:
+        return None
+    if cpu_profile:
+        from src.fastchat.cpu_profile import apply_cpu_profile
+        draft = apply_cpu_profile(draft, cpu_profile)
+    decoder = SpeculativeDecoder(
+        worker.model, draft, worker.tokenizer, worker.device,
+        draft_length=cfg.get("draft_length", 4), context_len=worker.context_len,
+        log_interval=cfg.get("log_interval", 0)
+    )
+
+    def speculative_stream(params):
+        try:
+            for output in decoder.generate_stream(params):
+                yield json.dumps(output).encode() + b"\0"
+        except Exception as e:
+            yield json.dumps({"text": f"Error en la generación: {e}", "error_code": 50001}).encode() + b"\0"
+
+    worker.generate_stream_gate = speculative_stream
+    worker.speculative_decoder = decoder
+    return decoder
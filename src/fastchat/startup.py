@@ -0,0 +1,146 @@
+import threading
+import time
+from datetime import datetime
+
+# Dependencias de arranque: cada componente se lanza en cuanto las suyas están listas.
+# La interfaz web no depende de nadie: muestra "modelo preparándose" hasta que el
+# trabajador se registra y el servidor API (por el que pasan sus respuestas)
+# responde, así que puede servirse mientras se cargan los pesos. Quien lance la
+# interfaz en modo http tiene que lanzar también "api".
+STARTUP_DEPENDENCIES = {
+    "controller": (),
+    "worker": ("controller",),
+    "api": ("controller",),
+    "web": (),
+}
+
+COMPONENT_LABELS = {
+    "controller": "Controlador",
+    "worker": "Trabajador del modelo",
+    "api": "Servidor API",
+    "web": "Interfaz web",
+}
+
+class StartupPlan:
+    """
+    Arranque en paralelo guiado por un grafo de dependencias. Cada componente
+    se lanza en cuanto todas sus dependencias están listas; si una dependencia
+    falla, sus dependientes no se lanzan.
+    """
+
+    def __init__(self, launchers, dependencies=None):
+        dependencies = dependencies or STARTUP_DEPENDENCIES
+        self.launchers = launchers
+        # Solo se tienen en cuenta las dependencias que se van a lanzar
+        self.dependencies = {
+            name: tuple(dep for dep in dependencies.get(name, ()) if dep in launchers)
+            for name in launchers
+        }
+        self.handles = {}
+        self.failed = {}
+        self._settled_names = set()
+        self.started_at = None
+        self._lock = threading.Lock()
+        self._finished = threading.Condition(self._lock)
+
+    def start(self):
+        """Lanza los componentes sin dependencias; el resto se lanza al cumplirse las suyas"""
+        self.started_at = time.time()
+        self._launch_ready_components()
+        return self
+
+    def _launch_ready_components(self):
+        to_launch = []
+        with self._lock:
+            for name, deps in self.dependencies.items():
+                if name in self.handles or name in self.failed:
+                    continue
+                failed_deps = [dep for dep in deps if dep in self.failed]
+                if failed_deps:
+                    self.failed[name] = RuntimeError(f"dependencia no disponible: {', '.join(failed_deps)}")
+                    self._finished.notify_all()
+                elif all(self.handles.get(dep) is not None and self.handles[dep].ready_at for dep in deps):
+                    # Reservar el nombre antes de lanzar para no lanzarlo dos veces
+                    self.handles[name] = None
+                    to_launch.append(name)
+        for name in to_launch:
+            try:
+                handle = self.launchers[name]()
+            except Exception as e:
+                with self._lock:
+                    del self.handles[name]
+                    self.failed[name] = e
+                    self._finished.notify_all()
+                self._launch_ready_components()
+                continue
+            with self._lock:
+                self.handles[name] = handle
+            handle.ready.add_done_callback(lambda future, name=name: self._on_done(name, future))
+
+    def _on_done(self, name, future):
+        with self._lock:
+            if future.exception() is not None:
+                self.failed[name] = future.exception()
+        label = COMPONENT_LABELS.get(name, name)
+        if name in self.failed:
+            print(f"❌ {label} no está disponible: {self.failed[name]}")
+        else:
+            print(f"✅ {label} listo")
+        with self._lock:
+            self._settled_names.add(name)
+            self._finished.notify_all()
+        self._launch_ready_components()
+
+    def _settled(self, name):
+        return name in self.failed or name in self._settled_names
+
+    def wait(self, names=None, timeout=None):
+        """
+        Espera a que los componentes indicados estén listos o hayan fallado
+
+        Args:
+            names (list): Componentes a esperar (por defecto, todos)
+            timeout (float): Tiempo máximo de espera en segundos
+
+        Returns:
+            bool: True si todos los componentes indicados están listos
+        """
+        names = list(names or self.launchers)
+        with self._finished:
+            self._finished.wait_for(lambda: all(self._settled(name) for name in names), timeout)
+        return all(self.is_ready(name) for name in names)
+
+    def is_ready(self, name):
+        handle = self.handles.get(name)
+        return name not in self.failed and handle is not None and handle.ready_at is not None
+
+    def report(self):
+        """Imprime el instante de lanzamiento y de disponibilidad de cada componente"""
+        print("⏱️  Informe de arranque:")
+        for name in self.launchers:
+            label = COMPONENT_LABELS.get(name, name)
+            handle = self.handles.get(name)
+            if handle is None:
+                print(f"   {label:<22} no lanzado ({self.failed.get(name, 'pendiente')})")
+                continue
+            start = datetime.fromtimestamp(handle.started_at).strftime("%H:%M:%S.%f")[:-3]
+            line = f"   {label:<22} lanzado {start} (+{handle.started_at - self.started_at:.1f}s)"
+            if handle.ready_at:
+                ready = datetime.fromtimestamp(handle.ready_at).strftime("%H:%M:%S.%f")[:-3]
+                line += f", listo {ready} (+{handle.ready_at - self.started_at:.1f}s)"
+            else:
+                line += f", no listo ({self.failed.get(name, 'pendiente')})"
+            print(line)
+
+def start_components(launchers, dependencies=None):
+    """
+    Arranca los componentes en paralelo respetando sus dependencias
+
+    Args:
+        launchers (dict): Nombre del componente -> función launch_* que devuelve un ComponentHandle
+        dependencies (dict): Grafo de dependencias (por defecto STARTUP_DEPENDENCIES)
+
+    Returns:
+        StartupPlan: Plan en marcha, para esperar componentes e imprimir el informe
+    """
+    return StartupPlan(launchers, dependencies).start()
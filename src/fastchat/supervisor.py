@@ -0,0 +1,241 @@
+import importlib
+import multiprocessing
+import os
+import signal
+import threading
+import time
+from src.config.settings import FASTCHAT_CONFIG
+from src.fastchat.readiness import (
+    ComponentHandle, poll_until_ready, combine_handles,
+    controller_ready, api_ready, web_ready
+)
+from src.fastchat.model_worker import worker_configs, worker_ready
+
+# Función que arranca cada componente (se importa dentro del proceso hijo)
+COMPONENT_TARGETS = {
+    "controller": ("src.fastchat.controller", "start_controller"),
+    "worker": ("src.fastchat.model_worker", "start_worker"),
+    "api": ("src.fastchat.api_server", "start_api_server"),
+    "web": ("src.fastchat.web_ui", "start_web_server"),
+}
+
+COMPONENT_PROBES = {
+    "controller": controller_ready,
+    "api": api_ready,
+    "web": web_ready,
+}
+
+def parse_cpu_list(spec):
+    """
+    Convierte una lista de CPUs en formato "0-3,6" en un conjunto
+
+    Args:
+        spec (str): Lista de CPUs
+
+    Returns:
+        set: Índices de CPU
+    """
+    cpus = set()
+    for part in spec.replace(" ", "").split(","):
+        if not part:
+            continue
+        if "-" in part:
+            first, last = part.split("-")
+            cpus.update(range(int(first), int(last) + 1))
+        else:
+            cpus.add(int(part))
+    return cpus
+
+def default_cpu_affinity(cpus):
+    """
+    Reparte las CPUs disponibles: los servicios HTTP comparten las primeras y
+    el trabajador, que es quien hace el cálculo pesado, se queda con el resto
+
+    Args:
+        cpus (list): CPUs disponibles para el proceso
+
+    Returns:
+        dict: Componente -> conjunto de CPUs
+    """
+    cpus = sorted(cpus)
+    if len(cpus) < 4:
+        # Con pocas CPUs no compensa separar: todos las comparten
+        return {name: set(cpus) for name in COMPONENT_TARGETS}
+    service_cpus = set(cpus[:2])
+    return {
+        "controller": {cpus[0]},
+        "api": service_cpus,
+        "web": service_cpus,
+        "worker": set(cpus[2:]),
+    }
+
+def split_cpus(cpus, parts):
+    """Divide un conjunto de CPUs en parts bloques contiguos (compartidos si no hay suficientes)"""
+    cpus = sorted(cpus or [])
+    if not cpus:
+        return [None] * parts
+    if len(cpus) < parts:
+        return [{cpus[index % len(cpus)]} for index in range(parts)]
+    size = len(cpus) // parts
+    return [set(cpus[index * size:(index + 1) * size if index < parts - 1 else len(cpus)]) for index in range(parts)]
+
+def resolve_cpu_affinity():
+    """Combina la afinidad configurada con el reparto automático"""
+    if not hasattr(os, "sched_getaffinity"):
+        return {}
+    affinity = default_cpu_affinity(os.sched_getaffinity(0))
+    for name, spec in FASTCHAT_CONFIG["supervisor"]["cpu_affinity"].items():
+        if spec:
+            affinity[name] = parse_cpu_list(spec)
+    return affinity
+
+def _run_component(kind, cpus, args=()):
+    """Punto de entrada de cada proceso hijo"""
+    # El supervisor decide cuándo parar: Ctrl+C no debe llegar directamente a los hijos
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    if cpus and hasattr(os, "sched_setaffinity"):
+        os.sched_setaffinity(0, cpus)
+    module_name, function_name = COMPONENT_TARGETS[kind]
+    result = getattr(importlib.import_module(module_name), function_name)(*args)
+    if result is None:
+        # Las funciones start_* devuelven None cuando fallan
+        os._exit(1)
+    # El componente sigue atendiendo en sus propios hilos
+    threading.Event().wait()
+
+class SupervisedComponent:
+    """Estado de un componente ejecutado en su propio proceso"""
+
+    def __init__(self, name, cpus, kind=None, args=(), probe=None):
+        self.name = name
+        self.cpus = cpus
+        self.kind = kind or name
+        self.args = args
+        self.probe = probe or COMPONENT_PROBES.get(self.kind)
+        self.process = None
+        self.started_at = None
+        self.restarts = 0
+        self.restart_delay = FASTCHAT_CONFIG["supervisor"]["restart_initial_delay"]
+        self.next_start = None
+
+    def is_alive(self):
+        return self.process is not None and self.process.is_alive()
+
+class Supervisor:
+    """
+    Ejecuta cada componente en su propio proceso del sistema operativo, con su
+    afinidad de CPU, lo reinicia con espera exponencial si termina y detiene
+    todos los procesos de forma ordenada al salir.
+    """
+
+    def __init__(self, names=None):
+        self.cfg = FASTCHAT_CONFIG["supervisor"]
+        affinity = resolve_cpu_affinity()
+        self.components = {}
+        for kind in (names or COMPONENT_TARGETS):
+            if kind == "worker":
+                # Un proceso por trabajador del pool, cada uno con su parte de las CPUs
+                configs = worker_configs()
+                for index, (cfg, cpus) in enumerate(zip(configs, split_cpus(affinity.get(kind), len(configs)))):
+                    name = kind if len(configs) == 1 else f"{kind}-{index}"
+                    probe = lambda cfg=cfg: worker_ready(cfg)
+                    self.components[name] = SupervisedComponent(name, cpus, kind, (index,), probe)
+            else:
+                self.components[kind] = SupervisedComponent(kind, affinity.get(kind))
+        # spawn evita heredar hilos y estado de CUDA del proceso padre
+        self._context = multiprocessing.get_context("spawn")
+        self._lock = threading.Lock()
+        self._stopping = threading.Event()
+        self._watcher = None
+
+    def _spawn(self, component):
+        process = self._context.Process(
+            target=_run_component,
+            args=(component.kind, component.cpus, component.args),
+            name=f"mental-health-{component.name}",
+            daemon=False
+        )
+        process.start()
+        component.process = process
+        component.started_at = time.monotonic()
+        component.next_start = None
+        cpus = f" en CPUs {sorted(component.cpus)}" if component.cpus else ""
+        print(f"🔄 {component.name} iniciado en el proceso {process.pid}{cpus}")
+
+    def launch(self, kind):
+        """
+        Lanza un componente (o todos los procesos de un pool) y devuelve su ComponentHandle
+
+        Args:
+            kind (str): Tipo de componente ("controller", "worker", "api" o "web")
+
+        Returns:
+            ComponentHandle: El componente y su futuro de disponibilidad
+        """
+        members = [component for component in self.components.values() if component.kind == kind]
+        with self._lock:
+            for component in members:
+                self._spawn(component)
+        self._ensure_watcher()
+        handles = [
+            ComponentHandle(component.name, component, poll_until_ready(kind, component.probe))
+            for component in members
+        ]
+        return combine_handles(kind, handles)
+
+    def launchers(self):
+        """Funciones de lanzamiento para start_components"""
+        kinds = dict.fromkeys(component.kind for component in self.components.values())
+        return {kind: (lambda kind=kind: self.launch(kind)) for kind in kinds}
+
+    def _ensure_watcher(self):
+        if self._watcher is None:
+            self._watcher = threading.Thread(target=self._watch, name="supervisor", daemon=True)
+            self._watcher.start()
+
+    def _watch(self):
+        """Reinicia con espera exponencial los componentes que terminan"""
+        while not self._stopping.wait(0.5):
+            with self._lock:
+                for component in self.components.values():
+                    if component.process is None or component.is_alive():
+                        continue
+                    now = time.monotonic()
+                    if component.next_start is None:
+                        uptime = now - component.started_at
+                        if uptime > self.cfg["stable_after"]:
+                            component.restart_delay = self.cfg["restart_initial_delay"]
+                        component.next_start = now + component.restart_delay
+                        print(f"⚠️ {component.name} terminó (código {component.process.exitcode}); "
+                              f"reiniciando en {component.restart_delay:.1f}s")
+                        component.restart_delay = min(component.restart_delay * 2, self.cfg["restart_max_delay"])
+                    elif now >= component.next_start and not self._stopping.is_set():
+                        component.restarts += 1
+                        self._spawn(component)
+
+    def stop(self):
+        """Detiene todos los componentes: primero SIGTERM y, si no terminan a tiempo, SIGKILL"""
+        self._stopping.set()
+        with self._lock:
+            running = [c for c in self.components.values() if c.is_alive()]
+            for component in running:
+                component.process.terminate()
+            deadline = time.monotonic() + self.cfg["shutdown_timeout"]
+            for component in running:
+                component.process.join(max(0.0, deadline - time.monotonic()))
+                if component.process.is_alive():
+                    print(f"⚠️ {component.name} no respondió; forzando la parada")
+                    component.process.kill()
+                    component.process.join()
+
+    def status(self):
+        """Estado de cada componente: pid, si está vivo y número de reinicios"""
+        return {
+            name: {
+                "pid": component.process.pid if component.process else None,
+                "alive": component.is_alive(),
+                "restarts": component.restarts,
+                "cpus": sorted(component.cpus) if component.cpus else None,
+            }
+            for name, component in self.components.items()
+        }
@@ -1,126 +1,347 @@
 import threading
 import time
-import importlib
+import json
 import os
-import gradio as gr
-from src.config.settings import MENTAL_HEALTH_CATEGORIES, FASTCHAT_CONFIG
-
-def get_gradio_app_and_blocks():
-    """Obtiene las funciones y clases necesarias de gradio y fastchat de manera dinámica"""
-    # Intentar diferentes rutas de importación para compatibilidad con versiones
-    possible_paths = [
-        "fastchat.serve.gradio_web_server", 
-        "fastchat.gradio_web_server",
-        "fschat.serve.gradio_web_server",
-        "fschat.gradio_web_server"
-    ]
+from collections import deque, OrderedDict
+from src.config.settings import MENTAL_HEALTH_CATEGORIES, FASTCHAT_CONFIG, VICUNA_GENERATION_CONFIG
+from src.fastchat.safety_middleware import screen_message
+from src.fastchat.readiness import launch_component, web_ready, worker_registered, api_ready
+from src.fastchat.http_client import INTERNAL_CLIENT
+from src.fastchat.admission import AdmissionRejected, busy_message, create_admission_controller
+from src.fastchat.embedded import ENGINE, embedded_mode
+from src.utils.prompts import ConversationBuilder, approximate_token_count, token_counter
+
+WARMING_UP_STATUS = "⏳ **El modelo se está preparando.** La primera carga puede tardar unos minutos."
+READY_STATUS = "✅ El modelo está listo."
+WARMING_UP_REPLY = "⏳ El modelo todavía se está cargando. Inténtalo de nuevo en unos instantes."
+
+# Una vez registrado el trabajador no hace falta volver a preguntar al controlador
+_MODEL_READY = threading.Event()
+
+# Generaciones simultáneas de la interfaz, ajustadas a la carga
+ADMISSION = create_admission_controller()
+
+def model_warming_up():
+    """
+    Indica si el modelo todavía no puede responder: el trabajador no se ha
+    registrado o el servidor API, por el que pasan las respuestas, aún no escucha
+    """
+    if _MODEL_READY.is_set():
+        return False
+    if embedded_mode():
+        # El modelo se carga en este proceso: no hay controlador al que preguntar
+        return not ENGINE.ready()
+    try:
+        if worker_registered() and api_ready():
+            _MODEL_READY.set()
+            return False
+    except Exception:
+        pass
+    return True
+
+def model_status():
+    """Texto de estado del modelo para la interfaz"""
+    if model_warming_up():
+        return WARMING_UP_STATUS
+    waiting = ADMISSION.snapshot()["waiting"]
+    if waiting:
+        return f"{READY_STATUS} Hay {waiting} persona(s) esperando turno."
+    return READY_STATUS
+
+def session_of(request):
+    """Identificador de la sesión de Gradio de una petición (None si no se conoce)"""
+    return getattr(request, "session_hash", None)
+
+# Conversación de cada sesión de Gradio: cada mensaje solo tokeniza y revisa el turno nuevo
+MAX_SESSION_CONVERSATIONS = 1024
+_CONVERSATIONS = OrderedDict()
+_CONVERSATIONS_LOCK = threading.Lock()
+
+def session_conversation(session_id, history, category="General", count_tokens=None):
+    """
+    Devuelve el constructor de la conversación de una sesión, al día con su historial
+
+    Args:
+        session_id (str): Sesión de Gradio (None = sin reutilizar nada)
+        history (list): Pares (mensaje, respuesta) del chat
+        category (str): Categoría de salud mental
+        count_tokens (callable): Contador de tokens
+
+    Returns:
+        ConversationBuilder: Constructor con todos los turnos del historial
+    """
+    if session_id is None:
+        return ConversationBuilder.from_history(history, category, count_tokens)
+    with _CONVERSATIONS_LOCK:
+        builder = _CONVERSATIONS.pop(session_id, None)
+    if builder is None or builder.category != category or not builder.sync(history):
+        builder = ConversationBuilder.from_history(history, category, count_tokens)
+    with _CONVERSATIONS_LOCK:
+        _CONVERSATIONS[session_id] = builder
+        # Olvidar las sesiones menos recientes
+        while len(_CONVERSATIONS) > MAX_SESSION_CONVERSATIONS:
+            _CONVERSATIONS.popitem(last=False)
+    return builder
+
+class StreamStats:
+    """Tiempos de las respuestas en streaming de la interfaz"""
     
-    for path in possible_paths:
-        try:
-            module = importlib.import_module(path)
-            
-            # Buscar la función build_single_model_ui o app
-            if hasattr(module, "build_single_model_ui"):
-                return module.build_single_model_ui, None
-            elif hasattr(module, "app"):
-                return None, module.app
-        except (ImportError, AttributeError):
+    def __init__(self, window=1000):
+        self._lock = threading.Lock()
+        self.first_visible = deque(maxlen=window)
+        self.totals = deque(maxlen=window)
+        self.frames = 0
+        self.tokens = 0
+    
+    def record(self, first_visible, total, frames, tokens):
+        with self._lock:
+            if first_visible is not None:
+                self.first_visible.append(first_visible)
+            self.totals.append(total)
+            self.frames += frames
+            self.tokens += tokens
+    
+    def snapshot(self):
+        """Devuelve las métricas actuales como diccionario"""
+        with self._lock:
+            first_visible = sorted(self.first_visible)
+            return {
+                "responses": len(self.totals),
+                "first_visible_p50_s": first_visible[len(first_visible) // 2] if first_visible else 0.0,
+                "first_visible_p95_s": first_visible[min(len(first_visible) - 1, int(len(first_visible) * 0.95))] if first_visible else 0.0,
+                "tokens_per_frame": self.tokens / self.frames if self.frames else 0.0,
+            }
+
+UI_STREAM_STATS = StreamStats()
+
+def api_chat_url():
+    cfg = FASTCHAT_CONFIG["api_server"]
+    return f"http://{cfg['host']}:{cfg['port']}/v1/chat/completions"
+
+def stream_chat_completion(messages, category="General", generation=None, timeout=None, usage=None):
+    """
+    Pide una respuesta en streaming al servidor API local compatible con OpenAI
+    
+    Args:
+        messages (list): Mensajes de chat en formato OpenAI
+        category (str): Categoría de salud mental (la usa la caché de respuestas)
+        generation (dict): Parámetros de generación (por defecto VICUNA_GENERATION_CONFIG)
+        timeout (float): Tiempo máximo sin recibir datos (por defecto, el del salto "api")
+        usage (dict): Si se indica, se actualiza con el campo "usage" de los fragmentos que lo traigan
+    
+    Yields:
+        str: Fragmentos de texto según llegan
+    """
+    generation = generation or VICUNA_GENERATION_CONFIG
+    payload = {
+        "model": FASTCHAT_CONFIG["model_worker"]["model_names"][0],
+        "messages": messages,
+        "stream": True,
+        "temperature": generation["temperature"],
+        "top_p": generation["top_p"],
+        "max_tokens": generation["max_new_tokens"],
+        "category": category,
+    }
+    # Eventos SSE: una línea "data: {...}" por fragmento
+    for line in INTERNAL_CLIENT.stream_lines(api_chat_url(), payload, timeout=timeout):
+        line = line.strip()
+        if not line.startswith("data: "):
             continue
+        data = line[len("data: "):]
+        if data == "[DONE]":
+            return
+        chunk = json.loads(data)
+        if "choices" not in chunk:
+            raise RuntimeError(chunk.get("message", "respuesta inesperada del servidor"))
+        if usage is not None and chunk.get("usage"):
+            usage.update(chunk["usage"])
+        content = chunk["choices"][0].get("delta", {}).get("content")
+        if content:
+            yield content
+
+def stream_reply(message, history, category="General", session_id=None, frame_rate=None):
+    """
+    Responde a un mensaje en streaming a través del servidor API (o del
+    modelo embebido en modo "embedded")
+    
+    Las actualizaciones se agrupan para no superar frame_rate por segundo,
+    salvo el primer fragmento, que se muestra en cuanto llega.
     
-    raise ImportError("No se pudieron encontrar los componentes necesarios de FastChat para la interfaz web.")
+    Args:
+        message (str): Mensaje del usuario
+        history (list): Pares (mensaje, respuesta) anteriores de la conversación
+        category (str): Categoría de salud mental
+        session_id (str): Sesión del usuario
+        frame_rate (float): Actualizaciones por segundo (por defecto, la de settings; 0 = sin agrupar)
+    
+    Yields:
+        str: Respuesta acumulada hasta el momento
+    """
+    crisis_response = screen_session_message(message, session_id)
+    if crisis_response is not None:
+        yield crisis_response
+        return
+    if model_warming_up():
+        yield WARMING_UP_REPLY
+        return
+    if frame_rate is None:
+        frame_rate = FASTCHAT_CONFIG["web_server"]["frame_rate"]
+    interval = 1.0 / frame_rate if frame_rate else 0.0
+    
+    start = time.perf_counter()
+    text = ""
+    try:
+        with ADMISSION.admit(session_id) as slot:
+            usage = {}
+            if embedded_mode():
+                # El prompt de Vicuna se construye aquí y se genera en el proceso, sin saltos HTTP
+                counter = token_counter(getattr(ENGINE.worker, "tokenizer", None))
+                prompt = session_conversation(session_id, history, category, counter).build(message)
+                pieces = ENGINE.stream_text(prompt, VICUNA_GENERATION_CONFIG, usage)
+            else:
+                messages = session_conversation(session_id, history, category).messages(message)
+                pieces = stream_chat_completion(messages, category, usage=usage)
+            first_visible = None
+            last_frame = None
+            shown = 0
+            frames = 0
+            try:
+                for piece in pieces:
+                    if slot.first_token_at is None:
+                        slot.first_token_at = time.monotonic()
+                    text += piece
+                    now = time.perf_counter()
+                    if last_frame is None or now - last_frame >= interval:
+                        if first_visible is None:
+                            first_visible = now - start
+                        last_frame = now
+                        shown = len(text)
+                        frames += 1
+                        yield text
+            finally:
+                # El control de admisión necesita tokens, no fragmentos: el recuento del
+                # trabajador si llega en el stream y, si no, una estimación a partir del texto
+                slot.tokens = usage.get("completion_tokens") or (approximate_token_count(text) if text else 0)
+            if shown != len(text) or not text:
+                frames += 1
+                yield text
+            UI_STREAM_STATS.record(first_visible, time.perf_counter() - start, frames, slot.tokens)
+    except AdmissionRejected as e:
+        yield busy_message(e)
+    except Exception as e:
+        yield f"{text}\n\n⚠️ No se pudo obtener respuesta del modelo ({e})".strip()
+
+def screen_session_message(message, session_id):
+    """
+    Revisa un mensaje y, si indica una crisis, marca la sesión para que sus
+    siguientes mensajes tengan prioridad en la cola de generación
+    
+    Args:
+        message (str): Mensaje del usuario
+        session_id (str): Sesión del usuario
+    
+    Returns:
+        str: Respuesta del protocolo de crisis, o None si no se detecta crisis
+    """
+    crisis_response = screen_message(message)
+    if crisis_response is not None:
+        ADMISSION.flag_session(session_id)
+    return crisis_response
+
+def configure_queue(ui):
+    """Activa la cola de Gradio con la concurrencia máxima del control de admisión"""
+    cfg = FASTCHAT_CONFIG["web_server"]["admission"]
+    max_size = cfg["max_concurrency"] + cfg["max_queue"]
+    try:
+        # Gradio 3
+        return ui.queue(concurrency_count=cfg["max_concurrency"], max_size=max_size)
+    except TypeError:
+        # Gradio 4 cambió el nombre del parámetro
+        return ui.queue(default_concurrency_limit=cfg["max_concurrency"], max_size=max_size)
 
 def custom_mental_health_ui():
-    """Crea una interfaz de usuario personalizada para el asistente de salud mental"""
-    # Obtener la función para construir la interfaz
-    build_ui_func, app = get_gradio_app_and_blocks()
+    """
+    Crea una interfaz de usuario personalizada para el asistente de salud mental
     
-    if build_ui_func:
-        # Podemos construir una interfaz personalizada
-        with gr.Blocks(title="Asistente de Salud Mental") as demo:
-            with gr.Row():
-                with gr.Column(scale=3):
-                    gr.Markdown(
-                        """# Asistente Virtual de Salud Mental
-                        
-                        Este chatbot está diseñado para proporcionar soporte emocional y psicoeducación.
-                        No reemplaza a profesionales de salud mental. Si experimentas una crisis o emergencia,
-                        contacta con servicios de emergencia locales o líneas de crisis.
-                        
-                        **Recursos de emergencia:**
-                        - Línea de Prevención del Suicidio: 024
-                        - Emergencias: 112
-                        """
-                    )
+    Todos los mensajes pasan por stream_reply: la detección de crisis, el
+    carril prioritario y el control de admisión se aplican siempre. Por eso
+    no se usa la interfaz de FastChat, que enviaría los mensajes al
+    trabajador sin revisarlos.
+    """
+    import gradio as gr
+    
+    with gr.Blocks(title="Asistente de Salud Mental") as demo:
+        with gr.Row():
+            with gr.Column(scale=3):
+                gr.Markdown(
+                    """# Asistente Virtual de Salud Mental
                     
-                with gr.Column(scale=1):
-                    # Aquí podrías añadir un logo si lo tienes
-                    pass
-            
-            # Intenta obtener categorías de entorno o usa valores predeterminados
-            categories = MENTAL_HEALTH_CATEGORIES if MENTAL_HEALTH_CATEGORIES else ["General", "Ansiedad", "Depresión", "Estrés", "Relaciones"]
-            
-            with gr.Row():
-                topic = gr.Radio(
-                    categories,
-                    label="Selecciona un tema",
-                    info="Esto ayuda al asistente a contextualizar mejor tu consulta",
-                    value="General"
+                    Este chatbot está diseñado para proporcionar soporte emocional y psicoeducación.
+                    No reemplaza a profesionales de salud mental. Si experimentas una crisis o emergencia,
+                    contacta con servicios de emergencia locales o líneas de crisis.
+                    
+                    **Recursos de emergencia:**
+                    - Línea de Prevención del Suicidio: 024
+                    - Emergencias: 112
+                    """
                 )
                 
-            # Construir la interfaz de chat
-            chat_interface = build_ui_func()
-            
-            with gr.Accordion("Parámetros", open=False):
-                temperature = gr.Slider(0.1, 1.5, 0.7, 
-                                       label="Temperatura", 
-                                       info="Controla la creatividad de las respuestas")
-                max_new_tokens = gr.Slider(64, 4096, 512, 
-                                          label="Longitud máxima", 
-                                          step=64)
-                
-            # Eventos
-            def update_prompt(category):
-                if category == "General":
-                    return "Hola, me gustaría conversar contigo."
-                
-                prompts = {
-                    "Ansiedad": "Últimamente me siento ansioso. ¿Podrías ayudarme?",
-                    "Depresión": "He estado sintiéndome sin energía y con poco interés en las cosas.",
-                    "Estrés": "El estrés me está afectando mucho últimamente.",
-                    "Relaciones": "Estoy teniendo dificultades en mis relaciones personales.",
-                    "Autoestima": "He notado que tengo pensamientos muy negativos sobre mí mismo.",
-                    "Técnicas de relajación": "Me gustaría aprender algunas técnicas para relajarme."
-                }
-                
-                return prompts.get(category, f"Me gustaría hablar sobre {category.lower()}.")
+            with gr.Column(scale=1):
+                # Aquí podrías añadir un logo si lo tienes
+                pass
+        
+        # Estado del modelo mientras se cargan los pesos
+        status = gr.Markdown(model_status())
+        demo.load(model_status, None, status, every=2)
+        
+        # Intenta obtener categorías de entorno o usa valores predeterminados
+        categories = MENTAL_HEALTH_CATEGORIES if MENTAL_HEALTH_CATEGORIES else ["General", "Ansiedad", "Depresión", "Estrés", "Relaciones"]
+        
+        with gr.Row():
+            topic = gr.Radio(
+                categories,
+                label="Selecciona un tema",
+                info="Esto ayuda al asistente a contextualizar mejor tu consulta",
+                value="General"
+            )
             
-            if hasattr(chat_interface, "textbox"):
-                topic.change(update_prompt, inputs=topic, outputs=chat_interface.textbox)
-            
-        return demo
-    elif app:
-        # Si solo tenemos acceso a la app predefinida, usamos esa
-        return app
-    else:
-        # Fallback: crear una interfaz muy básica
-        with gr.Blocks(title="Asistente de Salud Mental") as demo:
-            gr.Markdown("# Asistente de Salud Mental")
-            chatbot = gr.Chatbot()
-            msg = gr.Textbox()
-            clear = gr.Button("Limpiar")
+        # Interfaz de chat
+        chatbot = gr.Chatbot()
+        msg = gr.Textbox()
+        clear = gr.Button("Limpiar")
             
-            def respond(message, chat_history):
-                bot_message = f"Echo: {message}"
-                chat_history.append((message, bot_message))
-                return "", chat_history
+        # Eventos
+        def update_prompt(category):
+            if category == "General":
+                return "Hola, me gustaría conversar contigo."
             
-            msg.submit(respond, [msg, chatbot], [msg, chatbot])
-            clear.click(lambda: None, None, chatbot, queue=False)
+            prompts = {
+                "Ansiedad": "Últimamente me siento ansioso. ¿Podrías ayudarme?",
+                "Depresión": "He estado sintiéndome sin energía y con poco interés en las cosas.",
+                "Estrés": "El estrés me está afectando mucho últimamente.",
+                "Relaciones": "Estoy teniendo dificultades en mis relaciones personales.",
+                "Autoestima": "He notado que tengo pensamientos muy negativos sobre mí mismo.",
+                "Técnicas de relajación": "Me gustaría aprender algunas técnicas para relajarme."
+            }
             
-        return demo
+            return prompts.get(category, f"Me gustaría hablar sobre {category.lower()}.")
+        
+        # Gradio identifica el parámetro de la petición por su anotación de tipo
+        def respond(message, chat_history, category, request: gr.Request):
+            chat_history = chat_history or []
+            for partial in stream_reply(message, chat_history, category or "General", session_id=session_of(request)):
+                yield "", chat_history + [(message, partial)]
+        
+        topic.change(update_prompt, inputs=topic, outputs=msg)
+        msg.submit(respond, [msg, chatbot, topic], [msg, chatbot])
+        clear.click(lambda: None, None, chatbot, queue=False)
+        
+    return demo
 
 def start_web_server():
     """Inicia el servidor web de Gradio"""
+    import gradio as gr
+    
     cfg = FASTCHAT_CONFIG["web_server"]
     host = cfg.get("host", "0.0.0.0")
     port = int(cfg.get("port", "7860"))
@@ -128,7 +349,8 @@ def start_web_server():
     
     try:
         ui = custom_mental_health_ui()
-        ui.queue(concurrency_count=5)
+        # La concurrencia real la decide ADMISSION; la cola de Gradio solo fija el máximo
+        configure_queue(ui)
         ui.launch(
             server_name=host,
             server_port=port,
@@ -145,20 +367,20 @@ def start_web_server():
             msg = gr.Textbox()
             clear = gr.Button("Limpiar")
             
-            def respond(message, chat_history):
-                bot_message = "Lo siento, el modelo no está disponible en este momento."
-                chat_history.append((message, bot_message))
-                return "", chat_history
+            def respond(message, chat_history, request: gr.Request):
+                chat_history = chat_history or []
+                for partial in stream_reply(message, chat_history, session_id=session_of(request)):
+                    yield "", chat_history + [(message, partial)]
             
             msg.submit(respond, [msg, chatbot], [msg, chatbot])
             clear.click(lambda: None, None, chatbot, queue=False)
             
+        # Las respuestas en streaming necesitan la cola de Gradio
+        configure_queue(demo)
         demo.launch(server_name=host, server_port=port, share=share)
 
 def launch_web_server():
     """Lanza el servidor web como un proceso daemon"""
-    web_thread = threading.Thread(target=start_web_server)
-    web_thread.daemon = True
-    web_thread.start()
-    print(f"✅ Interfaz web iniciándose en http://localhost:{FASTCHAT_CONFIG['web_server'].get('port', 7860)}")
-    return web_thread
+    print(f"🔄 Interfaz web iniciándose en http://localhost:{FASTCHAT_CONFIG['web_server'].get('port', 7860)}")
+    return launch_component("web", start_web_server, web_ready)
+
@@ -10,11 +10,8 @@ sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 # Cargar variables de entorno
 load_dotenv()
 
-from src.config.settings import OPENAI_API_KEY, FASTCHAT_CONFIG
-from src.fastchat.controller import launch_controller
-from src.fastchat.model_worker import launch_worker
-from src.fastchat.api_server import launch_api_server
-from src.fastchat.web_ui import launch_web_server
+from src.config.settings import OPENAI_API_KEY, FASTCHAT_CONFIG, validate_worker_config
+from src.utils.environment import package_version, report_versions
 
 def import_module_safely(name):
     """Importa un módulo de forma segura, mostrando un error claro si falla"""
@@ -35,25 +32,30 @@ def check_api_keys():
     return True
 
 def initialize_fastchat():
-    """Inicializa todos los componentes de FastChat"""
-    # 1. Iniciar controlador
-    controller_thread = launch_controller()
+    """Inicializa todos los componentes de FastChat en paralelo según sus dependencias"""
+    from src.fastchat.controller import launch_controller
+    from src.fastchat.model_worker import launch_worker
+    from src.fastchat.api_server import launch_api_server
+    from src.fastchat.web_ui import launch_web_server
+    from src.fastchat.startup import start_components
+    from src.fastchat.embedded import embedded_mode, launch_embedded_worker
     
-    # 2. Iniciar trabajador del modelo
-    worker_thread = launch_worker()
-    
-    # 3. Iniciar servidor API
-    api_thread = launch_api_server()
-    
-    # 4. Iniciar interfaz web
-    web_thread = launch_web_server()
-    
-    return {
-        "controller": controller_thread,
-        "worker": worker_thread,
-        "api": api_thread,
-        "web": web_thread
-    }
+    # Antes de arrancar nada: un error de configuración no debe dejar componentes a medias
+    validate_worker_config()
+    if embedded_mode():
+        # El modelo se carga en este proceso: no hacen falta el controlador ni el trabajador HTTP
+        launchers = {"worker": launch_embedded_worker, "api": launch_api_server, "web": launch_web_server}
+    else:
+        launchers = {
+            "controller": launch_controller,
+            "worker": launch_worker,
+            "api": launch_api_server,
+            "web": launch_web_server
+        }
+    plan = start_components(launchers)
+    plan.wait()
+    plan.report()
+    return plan.handles
 
 def main():
     """Función principal para ejecutar el asistente"""
@@ -84,19 +86,19 @@ def main():
         except ImportError:
             print("⚠️ No se pudo verificar el modelo. Asegúrate de tener el módulo download_model.py")
         
-        # Verificar dependencias
-        try:
-            import fastchat
-            print(f"✅ FastChat instalado (versión: {getattr(fastchat, '__version__', 'desconocida')})")
-        except ImportError:
+        # Verificar dependencias (sin importarlas: solo leemos sus metadatos)
+        fastchat_version = package_version("fastchat")
+        if fastchat_version:
+            print(f"✅ FastChat instalado (versión: {fastchat_version})")
+        else:
             print("❌ FastChat no está instalado correctamente.")
             print("   Ejecuta: pip install 'fschat[model_worker,webui]'")
             return False
         
-        try:
-            import gradio
-            print(f"✅ Gradio instalado (versión: {getattr(gradio, '__version__', 'desconocida')})")
-        except ImportError:
+        gradio_version = package_version("gradio")
+        if gradio_version:
+            print(f"✅ Gradio instalado (versión: {gradio_version})")
+        else:
             print("❌ Gradio no está instalado correctamente.")
             print("   Ejecuta: pip install gradio")
             return False
@@ -114,28 +116,61 @@ def main():
             
         # Inicializar componentes
         print("🚀 Iniciando componentes...")
-        controller_thread = controller_module.launch_controller()
-        time.sleep(2)  # Esperar a que el controlador se inicie
-        
-        worker_thread = model_worker_module.launch_worker()
-        time.sleep(5)  # Esperar a que el worker se inicie
-        
-        api_thread = api_server_module.launch_api_server()
-        time.sleep(1)  # Esperar a que el API se inicie
-        
-        web_thread = web_ui_module.launch_web_server()
+        try:
+            validate_worker_config()
+        except ValueError as e:
+            print(f"❌ Configuración no válida: {e}")
+            return False
+        # La interfaz web arranca mientras el modelo se carga
+        from src.fastchat.startup import start_components
+        from src.fastchat.embedded import embedded_mode, launch_embedded_worker
         
-        print("✨ ¡Asistente iniciado correctamente!")
-        print("💬 Interfaz web disponible en http://localhost:7860")
-        print("🔌 API REST disponible en http://localhost:8000")
-        print("💡 Presiona Ctrl+C para detener el asistente")
+        supervisor = None
+        if embedded_mode():
+            # La API y la interfaz llaman al modelo en el proceso: todo tiene que compartir proceso
+            if FASTCHAT_CONFIG["supervisor"]["mode"] == "processes":
+                print("⚠️ SERVING_MODE=embedded necesita un solo proceso; se ignora RUN_MODE=processes")
+            launchers = {
+                "worker": launch_embedded_worker,
+                "api": api_server_module.launch_api_server,
+                "web": web_ui_module.launch_web_server
+            }
+        elif FASTCHAT_CONFIG["supervisor"]["mode"] == "processes":
+            # Cada componente en su propio proceso, vigilado por el supervisor
+            from src.fastchat.supervisor import Supervisor
+            supervisor = Supervisor()
+            launchers = supervisor.launchers()
+        else:
+            launchers = {
+                "controller": controller_module.launch_controller,
+                "worker": model_worker_module.launch_worker,
+                "api": api_server_module.launch_api_server,
+                "web": web_ui_module.launch_web_server
+            }
         
-        # Mantener el programa en ejecución
+        # Los procesos del supervisor se detienen pase lo que pase (también con Ctrl+C durante el arranque)
         try:
+            plan = start_components(launchers)
+            if not plan.wait(["web"]):
+                plan.report()
+                return False
+            
+            print("✨ ¡Asistente iniciado correctamente!")
+            print("💬 Interfaz web disponible en http://localhost:7860")
+            print("🔌 API REST disponible en http://localhost:8000")
+            print("💡 Presiona Ctrl+C para detener el asistente")
+            
+            # Mantener el programa en ejecución
+            if not plan.wait():
+                print("⚠️ Algunos componentes no están disponibles. El asistente podría no funcionar correctamente.")
+            plan.report()
             while True:
                 time.sleep(1)
         except KeyboardInterrupt:
             print("\n👋 Deteniendo el asistente...")
+        finally:
+            if supervisor:
+                supervisor.stop()
             
     except Exception as e:
         print(f"❌ Error al iniciar: {e}")
@@ -144,4 +179,25 @@ def main():
         return False
 
 if __name__ == "__main__":
+    import argparse
+    
+    parser = argparse.ArgumentParser(description="Asistente de salud mental con FastChat")
+    parser.add_argument("--check-env", action="store_true", help="Solo verificar las dependencias y salir")
+    parser.add_argument("--check-model", action="store_true", help="Solo verificar si el modelo está descargado y salir")
+    args = parser.parse_args()
+    
+    # Comandos rápidos: no importan gradio, torch ni FastChat
+    if args.check_env or args.check_model:
+        ok = True
+        if args.check_env:
+            ok = report_versions()
+        if args.check_model:
+            from src.utils.download_model import is_model_downloaded
+            
+            model_path = os.getenv("MODEL_PATH", "lmsys/vicuna-7b-v1.5")
+            downloaded = is_model_downloaded(model_path)
+            print(f"✅ Modelo encontrado: {model_path}" if downloaded else f"❌ El modelo {model_path} no está descargado")
+            ok = ok and downloaded
+        sys.exit(0 if ok else 1)
+    
     main()
@@ -1,21 +1,243 @@
 import os
+import re
+import sys
+import json
+import hashlib
 import argparse
-from huggingface_hub import snapshot_download, login
-import torch
-from transformers import AutoTokenizer, AutoModelForCausalLM
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
 
+# Añadir el directorio raíz al path para importaciones relativas (se ejecuta también como script)
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from src.utils.safetensors_io import read_header, model_shards, resolve_model_dir, SAFETENSORS_DTYPES, INDEX_FILE
+from src.utils.model_fetch import fetch_model, manifest_complete, model_dir_name
+
 # Cargar variables de entorno
 load_dotenv()
 
-def download_vicuna(model_name=None, output_dir=None, use_auth_token=None):
+# Tamaño de los bloques al calcular el hash de un shard (memoria constante)
+HASH_CHUNK_BYTES = 8 * 1024 * 1024
+
+# Índice de la capa en el nombre de un tensor (model.layers.3..., transformer.h.3..., ...)
+_LAYER_PATTERN = re.compile(r"\.(?:layers|h|layer|blocks)\.(\d+)\.")
+
+# Tensores de embeddings cuya primera dimensión es el vocabulario
+_EMBEDDING_SUFFIXES = ("embed_tokens.weight", "wte.weight", "word_embeddings.weight", "embed_in.weight")
+
+# Formas esperadas por capa en los modelos tipo LLaMA (Vicuna), a partir de config.json
+LLAMA_LAYER_SHAPES = {
+    "self_attn.q_proj.weight": lambda c: [c["hidden_size"], c["hidden_size"]],
+    "self_attn.k_proj.weight": lambda c: [c.get("num_key_value_heads", c["num_attention_heads"]) * c["hidden_size"] // c["num_attention_heads"], c["hidden_size"]],
+    "self_attn.v_proj.weight": lambda c: [c.get("num_key_value_heads", c["num_attention_heads"]) * c["hidden_size"] // c["num_attention_heads"], c["hidden_size"]],
+    "self_attn.o_proj.weight": lambda c: [c["hidden_size"], c["hidden_size"]],
+    "mlp.gate_proj.weight": lambda c: [c["intermediate_size"], c["hidden_size"]],
+    "mlp.up_proj.weight": lambda c: [c["intermediate_size"], c["hidden_size"]],
+    "mlp.down_proj.weight": lambda c: [c["hidden_size"], c["intermediate_size"]],
+}
+
+def check_shard(path):
+    """
+    Comprueba un shard safetensors leyendo solo su encabezado
+
+    Args:
+        path (str): Ruta del shard
+
+    Returns:
+        tuple: (encabezado, lista de problemas encontrados)
+    """
+    try:
+        header, data_start, _ = read_header(path)
+    except (OSError, ValueError) as e:
+        return {}, [str(e)]
+    problems = []
+    name = os.path.basename(path)
+    expected_end = 0
+    for tensor, info in sorted(header.items(), key=lambda item: item[1]["data_offsets"][0]):
+        begin, end = info["data_offsets"]
+        if info["dtype"] not in SAFETENSORS_DTYPES:
+            # Sin el tamaño del dtype no se puede comprobar la forma, pero sí la posición
+            problems.append(f"{name}: {tensor} tiene un dtype desconocido ({info['dtype']})")
+        else:
+            elements = 1
+            for dim in info["shape"]:
+                elements *= dim
+            if end - begin != elements * SAFETENSORS_DTYPES[info["dtype"]][1]:
+                problems.append(f"{name}: {tensor} ocupa {end - begin} bytes y su forma {info['shape']} pide otro tamaño")
+        if begin != expected_end:
+            problems.append(f"{name}: {tensor} no empieza donde termina el anterior (byte {begin})")
+        expected_end = max(expected_end, end)
+    size = os.path.getsize(path)
+    if size != data_start + expected_end:
+        problems.append(f"{name}: el archivo mide {size} bytes y el encabezado indica {data_start + expected_end} (descarga incompleta)")
+    return header, problems
+
+def check_shapes(tensors, config):
+    """
+    Compara las formas de los tensores con config.json
+
+    Args:
+        tensors (dict): Nombre -> información del encabezado (dtype, shape)
+        config (dict): Contenido de config.json
+
+    Returns:
+        list: Problemas encontrados
+    """
+    problems = []
+    layers = config.get("num_hidden_layers", config.get("n_layer"))
+    if layers is not None:
+        found = {int(match.group(1)) for match in map(_LAYER_PATTERN.search, tensors) if match}
+        if found != set(range(layers)):
+            problems.append(f"config.json indica {layers} capas y los pesos tienen {len(found)}")
+    vocab_size = config.get("vocab_size")
+    if vocab_size is not None:
+        for tensor, info in tensors.items():
+            if (tensor.endswith(_EMBEDDING_SUFFIXES) or tensor == "lm_head.weight") and info["shape"][0] != vocab_size:
+                problems.append(f"{tensor} tiene forma {info['shape']} y el vocabulario es de {vocab_size}")
+    if config.get("model_type") == "llama" and layers is not None:
+        for layer in range(layers):
+            for suffix, expected in LLAMA_LAYER_SHAPES.items():
+                tensor = f"model.layers.{layer}.{suffix}"
+                if tensor not in tensors:
+                    problems.append(f"falta {tensor}")
+                elif tensors[tensor]["shape"] != expected(config):
+                    problems.append(f"{tensor} tiene forma {tensors[tensor]['shape']} y se esperaba {expected(config)}")
+    return problems
+
+def hash_file(path):
+    """SHA-256 de un archivo leído por bloques"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_BYTES), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def hash_files(paths, workers=None):
+    """
+    SHA-256 de varios archivos en paralelo (hashlib libera el GIL en bloques grandes)
+
+    Args:
+        paths (list): Rutas de los archivos
+        workers (int): Hilos (por defecto, uno por archivo hasta el número de CPUs)
+
+    Returns:
+        dict: Ruta -> hash en hexadecimal
     """
-    Descarga el modelo Vicuna desde Hugging Face Hub
+    workers = workers or max(1, min(len(paths), os.cpu_count() or 1))
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        return dict(zip(paths, pool.map(hash_file, paths)))
+
+def hub_file_hashes(model_name, token=None):
+    """
+    SHA-256 de los archivos LFS de un repositorio de Hugging Face Hub
+
+    Returns:
+        dict: Nombre del archivo en el repositorio -> hash (vacío si no se pueden consultar)
+    """
+    try:
+        from huggingface_hub import HfApi
+        info = HfApi().model_info(model_name, files_metadata=True, token=token)
+    except Exception as e:
+        print(f"⚠️ No se pudieron consultar los hashes del repositorio: {e}")
+        return {}
+    hashes = {}
+    for sibling in info.siblings or []:
+        lfs = sibling.lfs
+        if lfs:
+            hashes[sibling.rfilename] = lfs.get("sha256") if isinstance(lfs, dict) else lfs.sha256
+    return hashes
+
+def verify_model(model_dir, hash_shards=False, expected_hashes=None):
+    """
+    Verifica un modelo descargado sin cargarlo en memoria
+
+    Lee el índice y los encabezados de los shards safetensors, comprueba que
+    el tamaño de cada archivo coincide con su encabezado y que las formas de
+    los tensores cuadran con config.json. Opcionalmente calcula el SHA-256 de
+    cada shard en paralelo y lo compara con los hashes esperados.
+
+    Args:
+        model_dir (str): Directorio del modelo
+        hash_shards (bool): Calcular también el hash de los shards
+        expected_hashes (dict): Nombre del archivo -> SHA-256 esperado (opcional)
+
+    Returns:
+        list: Problemas encontrados (vacía si el modelo está completo)
+    """
+    problems = []
+    config_path = os.path.join(model_dir, "config.json")
+    if not os.path.exists(config_path):
+        return [f"falta config.json en {model_dir}"]
+    with open(config_path) as f:
+        config = json.load(f)
+    
+    shards = model_shards(model_dir)
+    if not shards:
+        # Pesos en formato .bin: sin encabezado que leer, solo se comprueba que estén
+        bin_index = os.path.join(model_dir, "pytorch_model.bin.index.json")
+        if os.path.exists(bin_index):
+            with open(bin_index) as f:
+                files = sorted(set(json.load(f)["weight_map"].values()))
+        else:
+            files = ["pytorch_model.bin"]
+        missing = [name for name in files if not os.path.exists(os.path.join(model_dir, name))]
+        if missing:
+            return [f"faltan archivos de pesos: {', '.join(missing)}"]
+        print("ℹ️ El modelo no está en safetensors: solo se comprueba que los archivos existan")
+        shards = [os.path.join(model_dir, name) for name in files]
+        tensors = None
+    else:
+        missing = [path for path in shards if not os.path.exists(path)]
+        if missing:
+            return [f"faltan shards: {', '.join(os.path.basename(path) for path in missing)}"]
+        tensors = {}
+        for path in shards:
+            header, shard_problems = check_shard(path)
+            problems.extend(shard_problems)
+            for tensor, info in header.items():
+                tensors[tensor] = dict(info, shard=os.path.basename(path))
+        index_path = os.path.join(model_dir, INDEX_FILE)
+        if os.path.exists(index_path):
+            with open(index_path) as f:
+                weight_map = json.load(f)["weight_map"]
+            for tensor, shard in weight_map.items():
+                if tensors.get(tensor, {}).get("shard") != shard:
+                    problems.append(f"el índice sitúa {tensor} en {shard}, pero no está allí")
+        problems.extend(check_shapes(tensors, config))
+    
+    if hash_shards:
+        print(f"🔍 Calculando el hash de {len(shards)} archivo(s)...")
+        for path, digest in hash_files(shards).items():
+            name = os.path.basename(path)
+            expected = (expected_hashes or {}).get(name)
+            if expected and expected != digest:
+                problems.append(f"{name}: el hash no coincide ({digest[:12]}... frente a {expected[:12]}...)")
+            elif not expected:
+                print(f"   {name}: {digest}")
+    return problems
+
+def report_verification(model_dir, problems):
+    """Imprime el resultado de verify_model y devuelve True si el modelo está completo"""
+    if not problems:
+        print(f"✅ Modelo verificado: {model_dir}")
+        return True
+    print(f"❌ El modelo en {model_dir} está incompleto o dañado:")
+    for problem in problems[:20]:
+        print(f"   - {problem}")
+    if len(problems) > 20:
+        print(f"   ... y {len(problems) - 20} problema(s) más")
+    return False
+
+def download_vicuna(model_name=None, output_dir=None, use_auth_token=None, verify_hashes=False, mirror=None):
+    """
+    Descarga el modelo Vicuna desde Hugging Face Hub (o desde un espejo)
     
     Args:
         model_name (str): Nombre del modelo en Hugging Face Hub
         output_dir (str): Directorio de salida donde se guardará el modelo
         use_auth_token (str): Token de autenticación de Hugging Face Hub
+        verify_hashes (bool): Comparar el SHA-256 de los shards con el del repositorio
+        mirror (str): Espejo local o HTTP (por defecto, la variable MODEL_MIRROR)
     
     Returns:
         str: Ruta donde se guardó el modelo
@@ -29,34 +251,24 @@ def download_vicuna(model_name=None, output_dir=None, use_auth_token=None):
         print(f"✅ Modelo encontrado localmente en: {model_name}")
         return model_name
     
-    print(f"🔄 Descargando modelo {model_name}...")
+    # Importaciones pesadas solo cuando realmente hay que descargar
+    from transformers import AutoTokenizer
     
     if output_dir is None:
         # Si no se especifica un directorio, usamos uno predeterminado
-        output_dir = os.path.join("models", model_name.split("/")[-1])
-    
-    # Crear el directorio si no existe
-    os.makedirs(output_dir, exist_ok=True)
+        output_dir = os.path.join("models", model_dir_name(model_name))
     
     # Si el token no se proporciona, intentar obtenerlo del entorno
     if use_auth_token is None:
         use_auth_token = os.getenv("HUGGINGFACE_TOKEN")
     
-    # Si el token está disponible, hacer login
-    if use_auth_token:
-        login(use_auth_token)
-    
     try:
-        # Descargar el modelo usando snapshot_download
-        snapshot_download(
-            repo_id=model_name,
-            local_dir=output_dir,
-            token=use_auth_token,
-            ignore_patterns=["*.msgpack", "*.h5", "*.ot", "*.md"]
-        )
+        # Descarga en paralelo y reanudable; no hace nada si el manifiesto ya está completo
+        if fetch_model(model_name, output_dir, use_auth_token, mirror) is None:
+            return None
         print(f"✅ Modelo descargado exitosamente en: {output_dir}")
         
-        # Verificar si el modelo se puede cargar correctamente
+        # Verificar el modelo sin materializar los parámetros
         print("🔍 Verificando modelo...")
         
         # Intentar cargar el tokenizer
@@ -66,22 +278,10 @@ def download_vicuna(model_name=None, output_dir=None, use_auth_token=None):
         except Exception as e:
             print(f"⚠️ Error al cargar el tokenizer: {e}")
         
-        # Intentar cargar el modelo con bajo uso de memoria
-        try:
-            dtype = torch.float16 if torch.cuda.is_available() else torch.float32
-            model = AutoModelForCausalLM.from_pretrained(
-                output_dir,
-                torch_dtype=dtype,
-                low_cpu_mem_usage=True,
-                device_map="auto"
-            )
-            print("✅ Modelo cargado correctamente")
-            # Liberar memoria
-            del model
-            torch.cuda.empty_cache()
-        except Exception as e:
-            print(f"⚠️ Error al cargar el modelo: {e}")
-            print("🔔 Esto podría ser normal si no hay suficiente memoria. FastChat lo cargará después con configuraciones optimizadas.")
+        # Comprobar los pesos sin cargarlos: encabezados, tamaños y formas
+        expected_hashes = hub_file_hashes(model_name, use_auth_token) if verify_hashes else None
+        if not report_verification(output_dir, verify_model(output_dir, verify_hashes, expected_hashes)):
+            return None
         
         return output_dir
         
@@ -100,9 +300,13 @@ def is_model_downloaded(model_name=None):
     if os.path.exists(model_name) and not model_name.startswith(('lmsys/', 'meta-llama/')):
         return True
     
-    # Si es un modelo de Hugging Face
-    default_path = os.path.join("models", model_name.split("/")[-1])
-    return os.path.exists(default_path)
+    # Si es un modelo de Hugging Face: completo según su manifiesto (sin leer los pesos)
+    default_path = os.path.join("models", model_dir_name(model_name))
+    complete = manifest_complete(default_path)
+    if complete is not None:
+        return complete
+    # Descargas anteriores sin manifiesto: comprobar los encabezados de los pesos
+    return os.path.isdir(default_path) and not verify_model(default_path)
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Descargar modelo Vicuna")
@@ -110,13 +314,25 @@ if __name__ == "__main__":
     parser.add_argument("--output", type=str, default=None, help="Directorio de salida")
     parser.add_argument("--token", type=str, default=None, help="Token de Hugging Face (si es necesario)")
     parser.add_argument("--check", action="store_true", help="Solo verificar si el modelo está descargado")
+    parser.add_argument("--verify", action="store_true", help="Verificar los pesos de un modelo ya descargado sin cargarlo")
+    parser.add_argument("--hash", action="store_true", help="Calcular también el SHA-256 de los shards")
+    parser.add_argument("--mirror", type=str, default=None, help="Espejo local o URL http(s) (por defecto MODEL_MIRROR)")
     
     args = parser.parse_args()
     
-    if args.check:
+    if args.verify:
+        model_name = args.model or os.getenv("MODEL_PATH", "lmsys/vicuna-7b-v1.5")
+        model_dir = args.output or resolve_model_dir(model_name) or os.path.join("models", model_name.split("/")[-1])
+        expected_hashes = None
+        if args.hash and not os.path.isdir(model_name):
+            # Nombre de un repositorio: comparar con los hashes publicados
+            expected_hashes = hub_file_hashes(model_name, args.token or os.getenv("HUGGINGFACE_TOKEN"))
+        ok = report_verification(model_dir, verify_model(model_dir, args.hash, expected_hashes))
+        raise SystemExit(0 if ok else 1)
+    elif args.check:
         if is_model_downloaded(args.model):
             print("✅ El modelo ya está descargado")
         else:
             print("❌ El modelo no está descargado")
     else:
-        download_vicuna(args.model, args.output, args.token)
\ No newline at end of file
+        download_vicuna(args.model, args.output, args.token, args.hash, args.mirror)
\ No newline at end of file
@@ -0,0 +1,79 @@
+# Módulo importable -> nombre de la distribución instalada con pip
+DEPENDENCIES = {
+    "fastchat": "fschat",
+    "gradio": "gradio",
+    "transformers": "transformers",
+    "torch": "torch",
+    "huggingface_hub": "huggingface_hub",
+}
+
+def package_version(module_name):
+    """
+    Obtiene la versión instalada de una dependencia sin importarla
+
+    Leer los metadatos del paquete es inmediato, mientras que importar torch o
+    gradio solo para mostrar su versión cuesta varios segundos.
+
+    Args:
+        module_name (str): Nombre del módulo (por ejemplo "fastchat")
+
+    Returns:
+        str: Versión instalada, o None si el paquete no está instalado
+    """
+    from importlib import metadata
+    
+    try:
+        return metadata.version(DEPENDENCIES.get(module_name, module_name))
+    except metadata.PackageNotFoundError:
+        return None
+
+def report_versions():
+    """
+    Muestra la versión de cada dependencia principal
+
+    Returns:
+        bool: True si todas están instaladas
+    """
+    all_installed = True
+    for dep in DEPENDENCIES:
+        version = package_version(dep)
+        if version:
+            print(f"✅ {dep}: {version}")
+        else:
+            print(f"❌ {dep} no está instalado")
+            all_installed = False
+    return all_installed
+
+def process_memory(pid="self"):
+    """
+    Memoria de un proceso según /proc (solo Linux)
+
+    rss es la memoria residente total; shared, la parte compartida con otros
+    procesos (por ejemplo, pesos mapeados desde el mismo archivo), y pss la
+    parte proporcional: las páginas compartidas se reparten entre los
+    procesos que las usan, así que la suma de pss es la memoria física real.
+
+    Args:
+        pid (int): Proceso a consultar (por defecto, el actual)
+
+    Returns:
+        dict: rss_mb, shared_mb, anon_mb y pss_mb (None si no se pueden leer)
+    """
+    report = {"rss_mb": None, "shared_mb": None, "anon_mb": None, "pss_mb": None}
+    fields = {}
+    for name in ("smaps_rollup", "status"):
+        try:
+            with open(f"/proc/{pid}/{name}") as f:
+                for line in f:
+                    key, _, value = line.partition(":")
+                    parts = value.split()
+                    if len(parts) == 2 and parts[1] == "kB":
+                        fields.setdefault(key, int(parts[0]) / 1024)
+        except OSError:
+            continue
+    report["rss_mb"] = fields.get("Rss", fields.get("VmRSS"))
+    report["pss_mb"] = fields.get("Pss")
+    if "Shared_Clean" in fields:
+        report["shared_mb"] = fields["Shared_Clean"] + fields.get("Shared_Dirty", 0.0)
+    report["anon_mb"] = fields.get("Anonymous", fields.get("RssAnon"))
+    return report
@@ -0,0 +1,317 @@
+import os
+import json
+import time
+import fnmatch
+import hashlib
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+# Manifiesto que se escribe al terminar una descarga completa y verificada
+MANIFEST_FILE = "fetch_manifest.json"
+
+# Archivos del repositorio que el asistente no necesita
+IGNORE_PATTERNS = ["*.msgpack", "*.h5", "*.ot", "*.md", ".git*"]
+
+CHUNK_BYTES = 1024 * 1024
+
+def model_dir_name(model_name):
+    """Carpeta del modelo dentro de models/ (y dentro de un espejo)"""
+    return model_name.rstrip("/").split("/")[-1]
+
+def select_files(entries):
+    """
+    Descarta los archivos que no hacen falta
+
+    Si el repositorio tiene los pesos en safetensors y en .bin, solo se
+    descargan los safetensors (transformers los prefiere).
+
+    Args:
+        entries (list): Diccionarios con name, size y sha256
+
+    Returns:
+        list: Entradas a descargar
+    """
+    entries = [e for e in entries if not any(fnmatch.fnmatch(e["name"], p) for p in IGNORE_PATTERNS)]
+    if any(e["name"].endswith(".safetensors") for e in entries):
+        entries = [e for e in entries if not e["name"].startswith("pytorch_model") and not e["name"].endswith(".bin")]
+    return entries
+
+def _http_chunks(client, url, offset, headers=None):
+    """
+    Pide un archivo por HTTP a partir de offset
+
+    Returns:
+        tuple: (True si el servidor respetó el Range, iterador de bloques)
+    """
+    headers = dict(headers or {})
+    if offset:
+        headers["Range"] = f"bytes={offset}-"
+    response = client.send(client.build_request("GET", url, headers=headers), stream=True)
+    if response.status_code == 416:
+        # Ya no queda nada por descargar a partir de offset
+        response.close()
+        return True, iter(())
+    if response.status_code not in (200, 206):
+        response.close()
+        raise IOError(f"HTTP {response.status_code} al descargar {url}")
+
+    def chunks():
+        try:
+            for chunk in response.iter_bytes(CHUNK_BYTES):
+                yield chunk
+        finally:
+            response.close()
+
+    # Un 200 a una petición con Range significa que el servidor no admite reanudar
+    return response.status_code == 206 or not offset, chunks()
+
+class _HTTPSource:
+    def __init__(self):
+        # Importación diferida: httpx solo hace falta al descargar. El cliente se comparte entre hilos
+        import httpx
+        self._client = httpx.Client(follow_redirects=True, timeout=httpx.Timeout(60.0, connect=10.0))
+
+    def client(self):
+        return self._client
+
+class HubSource(_HTTPSource):
+    """Archivos de un repositorio de Hugging Face Hub"""
+
+    def __init__(self, repo_id, token=None, revision="main"):
+        super().__init__()
+        self.repo_id = repo_id
+        self.token = token
+        self.revision = revision
+
+    def describe(self):
+        return f"Hugging Face Hub ({self.repo_id})"
+
+    def files(self):
+        from huggingface_hub import HfApi
+        info = HfApi().model_info(self.repo_id, revision=self.revision, files_metadata=True, token=self.token)
+        entries = []
+        for sibling in info.siblings or []:
+            lfs = sibling.lfs
+            sha256 = (lfs.get("sha256") if isinstance(lfs, dict) else lfs.sha256) if lfs else None
+            entries.append({"name": sibling.rfilename, "size": sibling.size, "sha256": sha256})
+        return entries
+
+    def chunks(self, name, offset):
+        from huggingface_hub import hf_hub_url
+        headers = {"Authorization": f"Bearer {self.token}"} if self.token else {}
+        return _http_chunks(self.client(), hf_hub_url(self.repo_id, name, revision=self.revision), offset, headers)
+
+class HTTPMirrorSource(_HTTPSource):
+    """
+    Espejo HTTP con la misma estructura que models/: <url>/<modelo>/<archivo>
+
+    La lista de archivos se lee del manifiesto del modelo en el espejo, así
+    que basta con servir una carpeta models/ descargada con este módulo (por
+    ejemplo con python -m http.server).
+    """
+
+    def __init__(self, base_url, model_name):
+        super().__init__()
+        self.base_url = f"{base_url.rstrip('/')}/{model_dir_name(model_name)}"
+
+    def describe(self):
+        return f"espejo HTTP ({self.base_url})"
+
+    def files(self):
+        response = self.client().get(f"{self.base_url}/{MANIFEST_FILE}")
+        if response.status_code != 200:
+            raise IOError(f"el espejo no tiene {MANIFEST_FILE} (HTTP {response.status_code})")
+        return manifest_entries(response.json())
+
+    def chunks(self, name, offset):
+        return _http_chunks(self.client(), f"{self.base_url}/{name}", offset)
+
+class LocalMirrorSource:
+    """Espejo en el sistema de archivos (disco compartido, NFS...): <ruta>/<modelo>/<archivo>"""
+
+    def __init__(self, root, model_name):
+        self.root = os.path.join(root, model_dir_name(model_name))
+
+    def describe(self):
+        return f"espejo local ({self.root})"
+
+    def files(self):
+        manifest = read_manifest(self.root)
+        if manifest is not None:
+            return manifest_entries(manifest)
+        # Sin manifiesto: todos los archivos de la carpeta, sin hash conocido
+        entries = []
+        for folder, dirs, names in os.walk(self.root):
+            dirs[:] = [d for d in dirs if not d.startswith(".")]
+            for name in names:
+                if not name.startswith(".") and not name.endswith(".part"):
+                    path = os.path.join(folder, name)
+                    entries.append({"name": os.path.relpath(path, self.root).replace(os.sep, "/"),
+                                    "size": os.path.getsize(path), "sha256": None})
+        if not entries:
+            raise IOError(f"{self.root} no existe o está vacío")
+        return entries
+
+    def chunks(self, name, offset):
+        def read():
+            with open(os.path.join(self.root, name), "rb") as f:
+                f.seek(offset)
+                for chunk in iter(lambda: f.read(CHUNK_BYTES), b""):
+                    yield chunk
+        return True, read()
+
+def model_source(model_name, token=None, mirror=None):
+    """
+    Origen de la descarga según MODEL_MIRROR: vacío = Hugging Face Hub,
+    una URL http(s) = espejo HTTP y cualquier otra cosa = carpeta local
+    """
+    mirror = os.getenv("MODEL_MIRROR", "") if mirror is None else mirror
+    if not mirror:
+        return HubSource(model_name, token)
+    if mirror.startswith(("http://", "https://")):
+        return HTTPMirrorSource(mirror, model_name)
+    return LocalMirrorSource(mirror, model_name)
+
+def read_manifest(model_dir):
+    """Manifiesto de un modelo descargado, o None si no tiene"""
+    try:
+        with open(os.path.join(model_dir, MANIFEST_FILE)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def manifest_entries(manifest):
+    return [{"name": name, "size": info["size"], "sha256": info.get("sha256")}
+            for name, info in manifest["files"].items()]
+
+def manifest_complete(model_dir):
+    """
+    Comprueba un modelo contra su manifiesto sin leer los pesos (solo stat)
+
+    Returns:
+        bool: True si todos los archivos están con su tamaño; None si no hay manifiesto
+    """
+    manifest = read_manifest(model_dir)
+    if manifest is None:
+        return None
+    if not manifest.get("complete"):
+        return False
+    for name, info in manifest["files"].items():
+        path = os.path.join(model_dir, name)
+        if not os.path.isfile(path) or os.path.getsize(path) != info["size"]:
+            return False
+    return True
+
+def fetch_file(source, entry, output_dir):
+    """
+    Descarga un archivo reanudando el .part que haya quedado de un intento anterior
+
+    El hash se calcula mientras se escribe; el archivo solo toma su nombre
+    definitivo cuando el tamaño y el hash coinciden.
+
+    Returns:
+        tuple: (sha256, bytes descargados en esta ejecución)
+    """
+    path = os.path.join(output_dir, entry["name"])
+    size = entry.get("size")
+    if os.path.isfile(path) and size is not None and os.path.getsize(path) == size:
+        # Ya descargado en un intento anterior (solo se renombra tras verificarlo)
+        return entry.get("sha256") or hash_path(path), 0
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    part = path + ".part"
+    offset = os.path.getsize(part) if os.path.exists(part) else 0
+    if size is not None and offset > size:
+        offset = 0
+    digest = hashlib.sha256()
+    resumed, chunks = source.chunks(entry["name"], offset)
+    if offset and resumed:
+        # Continuar el hash con lo que ya estaba escrito
+        with open(part, "rb") as f:
+            for chunk in iter(lambda: f.read(CHUNK_BYTES), b""):
+                digest.update(chunk)
+    else:
+        # El servidor no admite Range: se empieza de cero
+        offset = 0
+    received = 0
+    with open(part, "ab" if offset else "wb") as f:
+        for chunk in chunks:
+            f.write(chunk)
+            digest.update(chunk)
+            received += len(chunk)
+    written = os.path.getsize(part)
+    sha256 = digest.hexdigest()
+    if size is not None and written != size:
+        if written > size:
+            os.remove(part)
+        raise IOError(f"{entry['name']}: {written} de {size} bytes")
+    if entry.get("sha256") and entry["sha256"] != sha256:
+        os.remove(part)
+        raise IOError(f"{entry['name']}: el hash no coincide")
+    os.replace(part, path)
+    return sha256, received
+
+def hash_path(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(CHUNK_BYTES), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def fetch_model(model_name, output_dir=None, token=None, mirror=None, workers=None):
+    """
+    Descarga un modelo en paralelo, con reanudación y verificación
+
+    Los archivos se descargan a la vez (FETCH_WORKERS, 4 por defecto). Cada
+    uno se escribe en un .part que se reanuda con peticiones Range si la
+    descarga se interrumpe, y al terminar se escribe un manifiesto con el
+    tamaño y el SHA-256 de cada archivo. Si el modelo ya está completo según
+    su manifiesto no se hace ninguna petición.
+
+    Args:
+        model_name (str): Nombre del modelo en Hugging Face Hub
+        output_dir (str): Carpeta de destino (por defecto models/<modelo>)
+        token (str): Token de Hugging Face Hub
+        mirror (str): Espejo (por defecto MODEL_MIRROR): URL http(s) o carpeta local
+        workers (int): Descargas simultáneas
+
+    Returns:
+        str: Carpeta del modelo, o None si la descarga falló
+    """
+    output_dir = output_dir or os.path.join("models", model_dir_name(model_name))
+    if manifest_complete(output_dir):
+        print(f"✅ Modelo completo según su manifiesto: {output_dir}")
+        return output_dir
+    workers = workers or int(os.getenv("FETCH_WORKERS", "4"))
+    source = model_source(model_name, token, mirror)
+    print(f"🔄 Descargando {model_name} desde {source.describe()}...")
+    entries = select_files(source.files())
+    os.makedirs(output_dir, exist_ok=True)
+
+    start = time.perf_counter()
+    files, errors, received = {}, [], 0
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = {pool.submit(fetch_file, source, entry, output_dir): entry for entry in entries}
+        for future in as_completed(futures):
+            entry = futures[future]
+            try:
+                sha256, downloaded = future.result()
+            except Exception as e:
+                errors.append(f"{entry['name']}: {e}")
+                continue
+            received += downloaded
+            files[entry["name"]] = {"size": os.path.getsize(os.path.join(output_dir, entry["name"])), "sha256": sha256}
+            print(f"   ✅ {entry['name']} ({files[entry['name']]['size'] / 1e6:.1f} MB)")
+    elapsed = time.perf_counter() - start
+    if errors:
+        print(f"❌ No se pudieron descargar {len(errors)} archivo(s); al repetir se reanudará donde se quedó:")
+        for error in errors:
+            print(f"   - {error}")
+        return None
+
+    manifest = {"model": model_name, "source": source.describe(), "complete": True, "files": files}
+    tmp = os.path.join(output_dir, MANIFEST_FILE + ".tmp")
+    with open(tmp, "w") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp, os.path.join(output_dir, MANIFEST_FILE))
+    print(f"✅ {len(files)} archivo(s), {received / 1e6:.1f} MB descargados en {elapsed:.1f}s "
+          f"({received / 1e6 / max(elapsed, 1e-6):.1f} MB/s)")
+    return output_dir
@@ -1,4 +1,22 @@
-from src.config.settings import VICUNA_PROMPT_TEMPLATE, MENTAL_HEALTH_CATEGORIES
+import re
+from src.config.settings import VICUNA_PROMPT_TEMPLATE, MENTAL_HEALTH_CATEGORIES, VICUNA_GENERATION_CONFIG, FASTCHAT_CONFIG
+from src.utils.safety import detect_crisis
+
+# El preámbulo termina justo antes del turno del usuario, en un salto de línea,
+# para que sus tokens coincidan con el principio de los del prompt completo
+SYSTEM_PREAMBLE, _user_turn = VICUNA_PROMPT_TEMPLATE.split("USER: {message}")
+USER_TURN_TEMPLATE = "USER: {message}" + _user_turn
+
+# Turno ya respondido dentro de una conversación de varios turnos
+PAST_TURN_TEMPLATE = "USER: {user}\nASSISTANT: {assistant}\n"
+# Línea que sustituye a los turnos antiguos que no caben en el contexto
+SUMMARY_TEMPLATE = "(Resumen de la conversación anterior: el usuario habló de {topics})\n"
+SUMMARY_MAX_TOPICS = 5
+SUMMARY_TOPIC_CHARS = 80
+# Tokens de margen al calcular el presupuesto de una conversación
+CONTEXT_MARGIN_TOKENS = 16
+
+_TOKEN_PATTERN = re.compile(r"\w+|[^\w\s]", re.UNICODE)
 
 def format_prompt_for_vicuna(message, category="General"):
     """
@@ -18,7 +36,27 @@ def format_prompt_for_vicuna(message, category="General"):
     else:
         context_message = message
     
-    return VICUNA_PROMPT_TEMPLATE.format(message=context_message)
+    return get_prompt_prefix(category) + USER_TURN_TEMPLATE.format(message=context_message)
+
+def get_prompt_prefix(category="General"):
+    """
+    Devuelve la parte fija del prompt (el preámbulo del sistema), que es igual
+    en todas las peticiones de una categoría y el trabajador puede precalcular
+    
+    Args:
+        category (str): Categoría de salud mental
+    
+    Returns:
+        str: Preámbulo, con las instrucciones de la categoría si las tiene
+    """
+    instructions = " ".join(get_category_specific_instructions(category).split())
+    if not instructions:
+        return SYSTEM_PREAMBLE
+    return SYSTEM_PREAMBLE.rstrip("\n") + " " + instructions + "\n\n"
+
+def get_prompt_prefixes():
+    """Preámbulos de todas las categorías, sin repetidos"""
+    return list(dict.fromkeys(get_prompt_prefix(category) for category in MENTAL_HEALTH_CATEGORIES))
 
 def get_category_specific_instructions(category):
     """
@@ -60,4 +98,229 @@ def get_category_specific_instructions(category):
         """
     }
     
-    return instructions.get(category, "")
\ No newline at end of file
+    return instructions.get(category, "")
+def approximate_token_count(text):
+    """Estimación del número de tokens cuando no hay tokenizador (palabras y signos sueltos)"""
+    return len(_TOKEN_PATTERN.findall(text)) + 1
+
+def token_counter(tokenizer=None):
+    """
+    Devuelve una función que cuenta los tokens de un texto
+    
+    Args:
+        tokenizer: Tokenizador de transformers (opcional)
+    
+    Returns:
+        callable: Función texto -> número de tokens
+    """
+    if tokenizer is None:
+        return approximate_token_count
+    return lambda text: len(tokenizer(text, add_special_tokens=False).input_ids)
+
+class ConversationTurn:
+    """Un intercambio usuario/asistente con su texto renderizado y su número de tokens"""
+    
+    def __init__(self, user, assistant, tokens, crisis=False):
+        self.user = user
+        self.assistant = assistant
+        self.text = PAST_TURN_TEMPLATE.format(user=user, assistant=assistant)
+        self.tokens = tokens
+        self.crisis = crisis
+
+class ConversationBuilder:
+    """
+    Construye el prompt de Vicuna de una conversación de varios turnos sin
+    pasarse del contexto del modelo.
+    
+    Cada turno se tokeniza una sola vez al añadirlo, así que construir el
+    prompt de un mensaje nuevo solo suma recuentos ya calculados. Si la
+    conversación no cabe en el presupuesto se descartan los turnos más
+    antiguos (o se resumen en una línea), conservando siempre el preámbulo
+    y los turnos en los que se detectó una crisis.
+    """
+    
+    def __init__(self, category="General", count_tokens=None, budget=None, summarize=True):
+        self.category = category
+        self.count_tokens = count_tokens or approximate_token_count
+        if budget is None:
+            # Lo que queda del contexto tras reservar la respuesta y un margen por
+            # la diferencia entre contar los trozos por separado y el prompt completo
+            budget = (FASTCHAT_CONFIG["model_worker"]["max_context_len"]
+                      - VICUNA_GENERATION_CONFIG["max_new_tokens"] - CONTEXT_MARGIN_TOKENS)
+        self.budget = budget
+        self.summarize = summarize
+        self.preamble = get_prompt_prefix(category)
+        self.preamble_tokens = self.count_tokens(self.preamble)
+        self.turns = []
+        self._pending = None  # (mensaje, texto del turno, tokens) del último build
+        self._summary = None  # (turnos resumidos, texto, tokens)
+        self.last_stats = {}
+    
+    @classmethod
+    def from_history(cls, history, category="General", count_tokens=None, budget=None, summarize=True):
+        """
+        Crea un constructor a partir del historial de un chat de Gradio
+        
+        Args:
+            history (list): Pares (mensaje del usuario, respuesta del asistente)
+            category (str): Categoría de salud mental
+        
+        Returns:
+            ConversationBuilder: Constructor con los turnos ya añadidos
+        """
+        builder = cls(category, count_tokens, budget, summarize)
+        builder.sync(history)
+        return builder
+    
+    def sync(self, history):
+        """
+        Añade solo los turnos del historial que el constructor todavía no tiene
+        
+        Args:
+            history (list): Pares (mensaje del usuario, respuesta del asistente) del chat
+        
+        Returns:
+            bool: False si el historial ya no continúa los turnos del constructor
+                (por ejemplo, se ha borrado el chat) y hay que crear otro
+        """
+        complete = [(user, assistant) for user, assistant in history if user is not None and assistant is not None]
+        if len(complete) < len(self.turns):
+            return False
+        if self.turns:
+            last = self.turns[-1]
+            if (last.user, last.assistant) != complete[len(self.turns) - 1]:
+                return False
+        for user, assistant in complete[len(self.turns):]:
+            self.add_turn(user, assistant)
+        return True
+    
+    def add_turn(self, user, assistant):
+        """
+        Añade un intercambio terminado a la conversación
+        
+        Args:
+            user (str): Mensaje del usuario
+            assistant (str): Respuesta del asistente
+        
+        Returns:
+            ConversationTurn: Turno añadido
+        """
+        text = PAST_TURN_TEMPLATE.format(user=user, assistant=assistant)
+        turn = ConversationTurn(user, assistant, self.count_tokens(text), detect_crisis(user)[0])
+        self.turns.append(turn)
+        return turn
+    
+    def _pending_turn(self, message):
+        if self._pending is None or self._pending[0] != message:
+            text = USER_TURN_TEMPLATE.format(message=message)
+            self._pending = (message, text, self.count_tokens(text))
+        return self._pending
+    
+    def _summary_turn(self, dropped):
+        """Resume en una línea los mensajes de los turnos descartados (se recalcula solo si cambian)"""
+        recent = dropped[-SUMMARY_MAX_TOPICS:]
+        key = tuple(id(turn) for turn in recent)
+        if self._summary is None or self._summary[0] != key:
+            topics = []
+            for turn in recent:
+                topic = turn.user.strip().split("\n")[0].split(". ")[0]
+                topics.append(topic if len(topic) <= SUMMARY_TOPIC_CHARS else topic[:SUMMARY_TOPIC_CHARS].rstrip() + "...")
+            text = SUMMARY_TEMPLATE.format(topics="; ".join(topics))
+            self._summary = (key, text, self.count_tokens(text))
+        return self._summary
+    
+    def select(self, message):
+        """
+        Elige los turnos que caben en el presupuesto junto con un mensaje nuevo
+        
+        Args:
+            message (str): Mensaje del usuario
+        
+        Returns:
+            tuple: (turnos conservados en orden, texto del resumen o None, texto del turno pendiente)
+        """
+        _, pending_text, pending_tokens = self._pending_turn(message)
+        available = self.budget - self.preamble_tokens - pending_tokens
+        
+        # Primero los turnos de crisis (los más recientes primero), después el resto
+        # desde el final hasta que no quepa uno más
+        kept = set()
+        for index in range(len(self.turns) - 1, -1, -1):
+            turn = self.turns[index]
+            if turn.crisis and turn.tokens <= available:
+                kept.add(index)
+                available -= turn.tokens
+        for index in range(len(self.turns) - 1, -1, -1):
+            turn = self.turns[index]
+            if turn.crisis:
+                continue
+            if turn.tokens > available:
+                break
+            kept.add(index)
+            available -= turn.tokens
+        dropped = [turn for index, turn in enumerate(self.turns) if index not in kept]
+        
+        summary = None
+        if dropped and self.summarize:
+            _, summary_text, summary_tokens = self._summary_turn(dropped)
+            # Si el resumen no cabe, se cede el turno normal más antiguo que se conservaba
+            while summary_tokens > available:
+                oldest = min((index for index in kept if not self.turns[index].crisis), default=None)
+                if oldest is None:
+                    break
+                kept.discard(oldest)
+                available += self.turns[oldest].tokens
+                dropped = [turn for index, turn in enumerate(self.turns) if index not in kept]
+                _, summary_text, summary_tokens = self._summary_turn(dropped)
+            if summary_tokens <= available:
+                summary = summary_text
+                available -= summary_tokens
+        
+        self.last_stats = {
+            "turns": len(self.turns),
+            "kept_turns": len(kept),
+            "dropped_turns": len(dropped),
+            "summarized": summary is not None,
+            "tokens": self.budget - available,
+            "budget": self.budget,
+        }
+        return [self.turns[index] for index in sorted(kept)], summary, pending_text
+    
+    def build(self, message):
+        """
+        Construye el prompt para un mensaje nuevo del usuario
+        
+        Args:
+            message (str): Mensaje del usuario
+        
+        Returns:
+            str: Prompt completo, dentro del presupuesto de tokens si es posible
+        """
+        turns, summary, pending_text = self.select(message)
+        parts = [self.preamble]
+        if summary:
+            parts.append(summary)
+        parts.extend(turn.text for turn in turns)
+        parts.append(pending_text)
+        return "".join(parts)
+    
+    def messages(self, message):
+        """
+        Construye la lista de mensajes de chat (formato OpenAI) para un mensaje nuevo
+        
+        Args:
+            message (str): Mensaje del usuario
+        
+        Returns:
+            list: Mensajes system/user/assistant, dentro del presupuesto de tokens si es posible
+        """
+        turns, summary, _ = self.select(message)
+        system = self.preamble.strip()
+        if summary:
+            system += "\n" + summary.strip()
+        messages = [{"role": "system", "content": system}]
+        for turn in turns:
+            messages.append({"role": "user", "content": turn.user})
+            messages.append({"role": "assistant", "content": turn.assistant})
+        messages.append({"role": "user", "content": message})
+        return messages
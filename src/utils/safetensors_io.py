@@ -0,0 +1,184 @@
+import json
+import mmap
+import os
+import struct
+
+# Tipos de safetensors -> (nombre del dtype de torch, bytes por elemento)
+SAFETENSORS_DTYPES = {
+    "F64": ("float64", 8),
+    "F32": ("float32", 4),
+    "F16": ("float16", 2),
+    "BF16": ("bfloat16", 2),
+    "I64": ("int64", 8),
+    "I32": ("int32", 4),
+    "I16": ("int16", 2),
+    "I8": ("int8", 1),
+    "U8": ("uint8", 1),
+    "BOOL": ("bool", 1),
+}
+
+INDEX_FILE = "model.safetensors.index.json"
+SINGLE_FILE = "model.safetensors"
+
+# Un encabezado mayor que esto indica un archivo corrupto (el formato limita a 100 MB)
+MAX_HEADER_BYTES = 100 * 1024 * 1024
+
+def read_header(path):
+    """
+    Lee el encabezado de un archivo safetensors sin leer los tensores
+
+    El formato empieza con la longitud del encabezado (u64 little-endian)
+    seguida de un JSON con el dtype, la forma y los desplazamientos de cada
+    tensor, relativos al final del encabezado.
+
+    Args:
+        path (str): Ruta del archivo .safetensors
+
+    Returns:
+        tuple: (encabezado sin "__metadata__", byte donde empiezan los datos, metadatos)
+
+    Raises:
+        ValueError: Si el encabezado no es válido
+    """
+    with open(path, "rb") as f:
+        prefix = f.read(8)
+        if len(prefix) != 8:
+            raise ValueError(f"{path}: archivo demasiado corto")
+        (length,) = struct.unpack("<Q", prefix)
+        if length > MAX_HEADER_BYTES:
+            raise ValueError(f"{path}: encabezado de {length} bytes")
+        raw = f.read(length)
+    if len(raw) != length:
+        raise ValueError(f"{path}: encabezado incompleto")
+    try:
+        header = json.loads(raw)
+    except ValueError as e:
+        raise ValueError(f"{path}: encabezado JSON no válido ({e})")
+    metadata = header.pop("__metadata__", None) or {}
+    return header, 8 + length, metadata
+
+def model_shards(model_dir):
+    """
+    Archivos safetensors de un modelo, según su índice si lo tiene
+
+    Args:
+        model_dir (str): Directorio del modelo
+
+    Returns:
+        list: Rutas de los shards (vacía si el modelo no está en safetensors)
+    """
+    index_path = os.path.join(model_dir, INDEX_FILE)
+    if os.path.exists(index_path):
+        with open(index_path) as f:
+            weight_map = json.load(f)["weight_map"]
+        return [os.path.join(model_dir, name) for name in sorted(set(weight_map.values()))]
+    single = os.path.join(model_dir, SINGLE_FILE)
+    return [single] if os.path.exists(single) else []
+
+def resolve_model_dir(model_path):
+    """
+    Directorio local de un modelo: la propia ruta, la carpeta de descarga de
+    download_model o la caché de Hugging Face (sin conectarse a la red)
+
+    Args:
+        model_path (str): Ruta local o nombre del modelo en Hugging Face Hub
+
+    Returns:
+        str: Directorio del modelo, o None si no está en disco
+    """
+    if os.path.isdir(model_path):
+        return model_path
+    default_path = os.path.join("models", model_path.split("/")[-1])
+    if os.path.isdir(default_path):
+        return default_path
+    try:
+        from huggingface_hub import snapshot_download
+        return snapshot_download(model_path, local_files_only=True)
+    except Exception:
+        return None
+
+def mmap_tensors(path):
+    """
+    Tensores de un shard como vistas de solo lectura sobre el archivo mapeado
+
+    El mapeo es copy-on-write (MAP_PRIVATE): las páginas vienen de la caché
+    de páginas del sistema, de modo que todos los procesos que mapean el
+    mismo archivo comparten una única copia física mientras nadie escriba.
+
+    Args:
+        path (str): Ruta del archivo .safetensors
+
+    Returns:
+        dict: Nombre -> tensor de torch (sin copiar los datos)
+    """
+    import torch
+    header, data_start, _ = read_header(path)
+    with open(path, "rb") as f:
+        mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_COPY)
+    tensors = {}
+    for name, info in header.items():
+        dtype_name, item_size = SAFETENSORS_DTYPES[info["dtype"]]
+        dtype = getattr(torch, dtype_name)
+        begin, end = info["data_offsets"]
+        count = (end - begin) // item_size
+        if count == 0:
+            tensors[name] = torch.empty(info["shape"], dtype=dtype)
+            continue
+        # frombuffer guarda una referencia al mapeo: sigue abierto mientras viva el tensor
+        tensor = torch.frombuffer(mapped, dtype=dtype, count=count, offset=data_start + begin)
+        tensors[name] = tensor.reshape(info["shape"])
+    return tensors
+
+def load_state_dict_mmap(model_dir):
+    """
+    state_dict de todos los shards de un modelo, mapeados en memoria
+
+    Args:
+        model_dir (str): Directorio del modelo
+
+    Returns:
+        dict: Nombre -> tensor
+    """
+    state = {}
+    for path in model_shards(model_dir):
+        state.update(mmap_tensors(path))
+    return state
+
+def load_model_mmap(model_path):
+    """
+    Carga un modelo causal de transformers con los pesos mapeados desde los
+    archivos safetensors, sin copiarlos a memoria anónima
+
+    El esqueleto del modelo se crea sin pesos (init_empty_weights) y los
+    tensores mapeados se asignan directamente a los parámetros
+    (load_state_dict con assign=True), así que los pesos conservan el dtype
+    del archivo.
+
+    Args:
+        model_path (str): Ruta local o nombre del modelo en Hugging Face Hub
+
+    Returns:
+        tuple: (modelo, tokenizador)
+
+    Raises:
+        FileNotFoundError: Si el modelo no está en disco en formato safetensors
+    """
+    from accelerate import init_empty_weights
+    from transformers import AutoConfig, AutoModelForCausalLM, AutoTokenizer
+
+    model_dir = resolve_model_dir(model_path)
+    if model_dir is None or not model_shards(model_dir):
+        raise FileNotFoundError(f"no hay pesos safetensors de {model_path} en disco")
+    state = load_state_dict_mmap(model_dir)
+    config = AutoConfig.from_pretrained(model_dir)
+    dtype = next(tensor.dtype for tensor in state.values() if tensor.is_floating_point())
+    with init_empty_weights():
+        model = AutoModelForCausalLM.from_config(config, torch_dtype=dtype)
+    model.load_state_dict(state, strict=False, assign=True)
+    model.tie_weights()
+    missing = [name for name, param in model.named_parameters() if param.is_meta]
+    if missing:
+        raise ValueError(f"faltan pesos en los archivos safetensors: {', '.join(missing[:5])}")
+    model.eval()
+    tokenizer = AutoTokenizer.from_pretrained(model_dir, use_fast=False)
+    return model, tokenizer
@@ -1,20 +1,472 @@
-from src.config.settings import CRISIS_KEYWORDS, EMERGENCY_NUMBERS
+import re
+import time
+import unicodedata
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from itertools import islice
+from src.config.settings import (
+    CRISIS_KEYWORDS, EMERGENCY_NUMBERS,
+    CRISIS_FUZZY_MATCHING, CRISIS_FUZZY_MAX_EDITS, CRISIS_FUZZY_BUDGET_MS
+)
 
-def detect_crisis(message):
+_WORD_RE = re.compile(r"\w+")
+_REPEATED_RE = re.compile(r"(\w)\1+")
+
+# Palabras corrientes a una o dos letras de una palabra clave ("contarme" de
+# "cortarme", "hacerle" de "hacerme"): la búsqueda aproximada no las corrige
+_PRONOUNS = ("me", "te", "le", "lo", "la", "se", "nos", "os", "les", "los", "las")
+COMMON_WORDS = frozenset(
+    verb + pronoun
+    for verb in ("matar", "cortar", "quitar", "hacer", "contar", "cantar", "tratar", "montar")
+    for pronoun in _PRONOUNS
+)
+
+def fold_case(text):
+    """
+    Pasa un texto a minúsculas sin cambiar su longitud
+
+    str.lower() puede alargar el texto ("İ" da dos caracteres), y las
+    posiciones de las apariciones tienen que valer también sobre el original.
+
+    Args:
+        text (str): Texto original
+
+    Returns:
+        str: Texto en minúsculas, carácter a carácter con el original
+    """
+    lowered = text.lower()
+    if len(lowered) == len(text):
+        return lowered
+    return "".join(char.lower()[0] for char in text)
+
+class CrisisMatcher:
+    """
+    Autómata Aho-Corasick construido una sola vez a partir de una lista de
+    palabras clave. Encuentra todas las apariciones en una única pasada sobre
+    el mensaje, sin importar cuántas palabras clave haya.
+
+    El recorrido carácter a carácter en Python solo compensa con listas
+    largas: con las 10 palabras clave de settings, buscar cada una con
+    str.find es unas 6 veces más rápido, y el autómata no gana hasta unas
+    150-1000 palabras según la máquina (benchmarks/bench_crisis_matcher.py).
+    Por debajo de SCAN_THRESHOLD palabras, find_all usa la búsqueda simple;
+    el detector en streaming usa siempre el autómata, porque necesita
+    conservar el estado entre fragmentos.
+    """
+
+    SCAN_THRESHOLD = 200
+
+    def __init__(self, keywords):
+        # Conservamos el orden original y eliminamos duplicados
+        self.keywords = list(dict.fromkeys(fold_case(k) for k in keywords if k))
+        self.max_length = max(map(len, self.keywords), default=0)
+        goto = [{}]            # Transiciones del trie por estado
+        fail = [0]             # Enlace de fallo por estado
+        self._output = [()]    # Índices de palabras clave que terminan en cada estado
+        self._depth = [0]      # Longitud del prefijo reconocido en cada estado
+
+        for index, keyword in enumerate(self.keywords):
+            state = 0
+            for char in keyword:
+                next_state = goto[state].get(char)
+                if next_state is None:
+                    next_state = len(goto)
+                    goto.append({})
+                    fail.append(0)
+                    self._output.append(())
+                    self._depth.append(self._depth[state] + 1)
+                    goto[state][char] = next_state
+                state = next_state
+            self._output[state] += (index,)
+
+        # Calcular enlaces de fallo en anchura
+        order = []
+        queue = deque(goto[0].values())
+        while queue:
+            state = queue.popleft()
+            order.append(state)
+            for char, next_state in goto[state].items():
+                queue.append(next_state)
+                fallback = fail[state]
+                while fallback and char not in goto[fallback]:
+                    fallback = fail[fallback]
+                fail[next_state] = goto[fallback].get(char, 0)
+                self._output[next_state] += self._output[fail[next_state]]
+
+        # Resolver los enlaces de fallo de antemano (autómata determinista): cada
+        # carácter es una sola consulta a diccionario durante el recorrido
+        self._delta = [dict(goto[0])]
+        self._delta.extend({} for _ in order)
+        for state in order:
+            transitions = dict(self._delta[fail[state]])
+            transitions.update(goto[state])
+            self._delta[state] = transitions
+
+    def scan(self, text, state=0, offset=0):
+        """
+        Recorre el texto desde un estado dado del autómata
+
+        Args:
+            text (str): Texto ya convertido a minúsculas
+            state (int): Estado inicial (0 para empezar desde cero)
+            offset (int): Posición absoluta del primer carácter de text
+
+        Returns:
+            tuple: (matches, state) donde matches es una lista de
+                (inicio, fin, palabra_clave) y state el estado final
+        """
+        delta, output, keywords = self._delta, self._output, self.keywords
+        matches = []
+        for position, char in enumerate(text, offset):
+            state = delta[state].get(char, 0)
+            if output[state]:
+                for index in output[state]:
+                    keyword = keywords[index]
+                    matches.append((position + 1 - len(keyword), position + 1, keyword))
+        return matches, state
+
+    def pending_length(self, state):
+        """Número de caracteres finales que podrían ser el inicio de una palabra clave"""
+        return self._depth[state]
+
+    def find_all(self, message):
+        """
+        Devuelve todas las apariciones de palabras clave en el mensaje
+
+        Args:
+            message (str): Mensaje del usuario
+
+        Returns:
+            list: Tuplas (inicio, fin, palabra_clave) con posiciones sobre el
+                mensaje
+        """
+        text = fold_case(message)
+        if len(self.keywords) < self.SCAN_THRESHOLD:
+            return self._find_each(text)
+        matches, _ = self.scan(text)
+        return matches
+
+    def _find_each(self, text):
+        """Búsqueda simple, palabra clave a palabra clave, con el mismo resultado que scan"""
+        matches = []
+        for keyword in self.keywords:
+            if keyword not in text:
+                continue
+            start = text.find(keyword)
+            while start != -1:
+                matches.append((start, start + len(keyword), keyword))
+                start = text.find(keyword, start + 1)
+        if len(matches) > 1:
+            # Mismo orden que el autómata: por posición final y, a igualdad, la más larga primero
+            matches.sort(key=lambda match: (match[1], match[0]))
+        return matches
+
+    def keywords_in(self, matches):
+        """Devuelve las palabras clave encontradas, sin duplicados y en el orden de la lista original"""
+        found = {keyword for _, _, keyword in matches}
+        return [keyword for keyword in self.keywords if keyword in found]
+
+def normalize_text(text):
+    """
+    Normaliza un texto para la búsqueda tolerante: minúsculas, sin acentos y
+    con las letras repetidas reducidas a una ("matarmeee" -> "matarme")
+
+    Args:
+        text (str): Texto original
+
+    Returns:
+        str: Texto normalizado
+    """
+    decomposed = unicodedata.normalize("NFKD", text.lower())
+    folded = "".join(char for char in decomposed if not unicodedata.combining(char))
+    return _REPEATED_RE.sub(r"\1", folded)
+
+class FuzzyCrisisIndex:
+    """
+    Índice de palabras clave para la búsqueda aproximada. Las palabras de
+    las frases clave se guardan normalizadas en un trie, que se recorre con
+    una fila de Levenshtein acotada, de modo que cada palabra del mensaje se
+    compara con todo el vocabulario a la vez en lugar de una a una.
+    """
+
+    def __init__(self, keywords, max_edits=CRISIS_FUZZY_MAX_EDITS, budget_ms=CRISIS_FUZZY_BUDGET_MS):
+        self.keywords = list(dict.fromkeys(k.lower() for k in keywords if k))
+        self.max_edits = max_edits
+        self.budget_ms = budget_ms
+        self._trie = {}
+        self._phrases = {}  # primera palabra -> [(índice, palabras de la frase)]
+
+        for index, keyword in enumerate(self.keywords):
+            words = tuple(_WORD_RE.findall(normalize_text(keyword)))
+            if not words:
+                continue
+            self._phrases.setdefault(words[0], []).append((index, words))
+            for word in words:
+                node = self._trie
+                for char in word:
+                    node = node.setdefault(char, {})
+                node[None] = word
+        self._vocabulary = frozenset(word for _, words in sum(self._phrases.values(), []) for word in words)
+
+        # Los mensajes repiten mucho vocabulario: cacheamos cada búsqueda
+        self._lookup = lru_cache(maxsize=4096)(self._search)
+
+    def allowed_edits(self, keyword_word):
+        """Distancia máxima admitida según la longitud de la palabra clave (no la del mensaje)"""
+        if len(keyword_word) <= 5:
+            return 0
+        if len(keyword_word) <= 8:
+            return min(1, self.max_edits)
+        return self.max_edits
+
+    def _search(self, word):
+        """Devuelve las palabras del vocabulario a distancia admisible de word"""
+        if word in COMMON_WORDS:
+            # Una palabra corriente solo cuenta si es exactamente una del vocabulario
+            return frozenset([word]) & self._vocabulary
+        limit = self.max_edits
+        found = set()
+        first_row = list(range(len(word) + 1))
+        # Recorrido en profundidad del trie calculando una fila de Levenshtein por nodo
+        stack = [(self._trie, first_row)]
+        while stack:
+            node, previous_row = stack.pop()
+            if None in node and previous_row[-1] <= self.allowed_edits(node[None]):
+                found.add(node[None])
+            for char, child in node.items():
+                if char is None:
+                    continue
+                row = [previous_row[0] + 1]
+                for column in range(1, len(word) + 1):
+                    cost = 0 if word[column - 1] == char else 1
+                    row.append(min(row[column - 1] + 1, previous_row[column] + 1, previous_row[column - 1] + cost))
+                if min(row) <= limit:
+                    stack.append((child, row))
+        return frozenset(found)
+
+    def find(self, message):
+        """
+        Busca las frases clave en el mensaje tolerando acentos, letras
+        repetidas y errores tipográficos, dentro del presupuesto de tiempo
+
+        Args:
+            message (str): Mensaje del usuario
+
+        Returns:
+            list: Palabras clave encontradas, en el orden de la lista original
+        """
+        deadline = time.perf_counter() + self.budget_ms / 1000
+        words = _WORD_RE.findall(normalize_text(message))
+        found = set()
+        for position, word in enumerate(words):
+            if time.perf_counter() > deadline:
+                break
+            for candidate in self._lookup(word):
+                for index, phrase in self._phrases.get(candidate, ()):
+                    following = words[position + 1:position + len(phrase)]
+                    if len(following) == len(phrase) - 1 and all(
+                        expected in self._lookup(actual) for expected, actual in zip(phrase[1:], following)
+                    ):
+                        found.add(index)
+        return [self.keywords[index] for index in sorted(found)]
+
+# Índices precompilados a partir de las palabras clave configuradas
+_CRISIS_MATCHER = CrisisMatcher(CRISIS_KEYWORDS)
+_FUZZY_INDEX = FuzzyCrisisIndex(CRISIS_KEYWORDS)
+
+def rebuild_crisis_index(keywords=None):
+    """
+    Reconstruye los índices de palabras clave, por ejemplo tras actualizar la lista
+
+    Args:
+        keywords (list): Nueva lista de palabras clave (por defecto CRISIS_KEYWORDS)
+    """
+    global _CRISIS_MATCHER, _FUZZY_INDEX
+    keywords = CRISIS_KEYWORDS if keywords is None else keywords
+    _CRISIS_MATCHER, _FUZZY_INDEX = CrisisMatcher(keywords), FuzzyCrisisIndex(keywords)
+
+def find_crisis_matches(message):
+    """
+    Localiza las palabras clave de crisis en el mensaje del usuario
+
+    Args:
+        message (str): Mensaje del usuario
+
+    Returns:
+        list: Tuplas (inicio, fin, palabra_clave) para cada aparición
+    """
+    return _CRISIS_MATCHER.find_all(message)
+
+def detect_crisis(message, fuzzy=CRISIS_FUZZY_MATCHING):
     """
     Detecta palabras clave de crisis en el mensaje del usuario
-    
+
     Args:
         message (str): Mensaje del usuario
-    
+        fuzzy (bool): Tolerar acentos, letras repetidas y errores tipográficos
+
     Returns:
         tuple: (crisis_detected, keywords_found)
     """
-    message_lower = message.lower()
-    keywords_found = [word for word in CRISIS_KEYWORDS if word in message_lower]
-    
+    keywords_found = _CRISIS_MATCHER.keywords_in(_CRISIS_MATCHER.find_all(message))
+    if fuzzy:
+        fuzzy_found = set(_FUZZY_INDEX.find(message)) - set(keywords_found)
+        if fuzzy_found:
+            keywords_found = [k for k in _CRISIS_MATCHER.keywords if k in keywords_found or k in fuzzy_found]
+
     return bool(keywords_found), keywords_found
 
+def _screen_chunk(messages, fuzzy):
+    """Revisa un bloque de mensajes dentro de un proceso del pool"""
+    return [detect_crisis(message, fuzzy) for message in messages]
+
+def detect_crisis_batch(messages, workers=1, chunk_size=1000, fuzzy=CRISIS_FUZZY_MATCHING):
+    """
+    Revisa muchos mensajes de una vez (por ejemplo, conversaciones guardadas o
+    ficheros JSONL importados) y devuelve los resultados a medida que se obtienen
+
+    Args:
+        messages (iterable): Mensajes a revisar; puede ser un generador
+        workers (int): Procesos a utilizar; con 1 todo se hace en este proceso
+        chunk_size (int): Mensajes que se envían juntos a cada proceso
+        fuzzy (bool): Tolerar acentos, letras repetidas y errores tipográficos
+
+    Yields:
+        tuple: (crisis_detected, keywords_found) para cada mensaje, en el mismo orden
+    """
+    if workers <= 1:
+        for message in messages:
+            yield detect_crisis(message, fuzzy)
+        return
+
+    iterator = iter(messages)
+    # Cada proceso reconstruye los índices con las palabras clave vigentes una sola vez
+    with ProcessPoolExecutor(workers, initializer=rebuild_crisis_index, initargs=(_CRISIS_MATCHER.keywords,)) as pool:
+        pending = deque()
+        while True:
+            chunk = list(islice(iterator, chunk_size))
+            if chunk:
+                pending.append(pool.submit(_screen_chunk, chunk, fuzzy))
+            # Limitar los bloques en vuelo para que la memoria no crezca con la entrada
+            while pending and (len(pending) >= workers * 2 or not chunk):
+                yield from pending.popleft().result()
+            if not chunk:
+                break
+
+class StreamingCrisisDetector:
+    """
+    Detector incremental para texto que llega por fragmentos (por ejemplo, los
+    tokens que devuelve el modelo). Conserva el estado del autómata entre
+    fragmentos, de modo que una frase partida en dos fragmentos también se detecta.
+    """
+
+    def __init__(self, matcher=None):
+        self._matcher = matcher or _CRISIS_MATCHER
+        self.reset()
+
+    def reset(self):
+        """Reinicia el detector para una nueva respuesta"""
+        self._state = 0
+        self._position = 0
+        self.matches = []
+
+    def feed(self, chunk):
+        """
+        Procesa un nuevo fragmento de texto
+
+        Args:
+            chunk (str): Fragmento recibido
+
+        Returns:
+            list: Apariciones nuevas (inicio, fin, palabra_clave) con posiciones
+                absolutas dentro del flujo
+        """
+        chunk = fold_case(chunk)
+        matches, self._state = self._matcher.scan(chunk, self._state, self._position)
+        self._position += len(chunk)
+        self.matches.extend(matches)
+        return matches
+
+    def rewind(self, position):
+        """
+        Vuelve a revisar el flujo desde position (por ejemplo, si el texto
+        acumulado cambió a partir de ahí): se descartan el estado del autómata
+        y las apariciones que terminan después
+
+        Args:
+            position (int): Posición absoluta desde la que se volverá a llamar a feed
+        """
+        self._state = 0
+        self._position = min(self._position, max(0, position))
+        self.matches = [match for match in self.matches if match[1] <= self._position]
+
+    @property
+    def position(self):
+        """Caracteres del flujo revisados hasta ahora"""
+        return self._position
+
+    @property
+    def overlap(self):
+        """Caracteres que hay que volver a revisar antes de un cambio para no perder una palabra clave que lo cruce"""
+        return self._matcher.max_length
+
+    @property
+    def triggered(self):
+        """Indica si ya se ha detectado alguna palabra clave"""
+        return bool(self.matches)
+
+    @property
+    def keywords_found(self):
+        """Palabras clave detectadas hasta ahora"""
+        return self._matcher.keywords_in(self.matches)
+
+    @property
+    def safe_length(self):
+        """
+        Número de caracteres del flujo que ya no pueden formar parte de una
+        palabra clave y, por tanto, pueden mostrarse al usuario
+        """
+        return self._position - self._matcher.pending_length(self._state)
+
+def guard_stream(chunks, detector=None):
+    """
+    Filtra un flujo de fragmentos de texto deteniéndolo al detectar una crisis
+
+    Solo retiene los últimos caracteres que podrían ser el comienzo de una
+    palabra clave; el resto se entrega en cuanto llega. Si se detecta una
+    crisis se cierra el flujo de origen (deteniendo la generación) y se
+    entrega la respuesta del protocolo de crisis.
+
+    Args:
+        chunks (iterable): Fragmentos de texto generados
+        detector (StreamingCrisisDetector): Detector a utilizar (opcional)
+
+    Yields:
+        str: Fragmentos seguros para mostrar al usuario
+    """
+    detector = detector or StreamingCrisisDetector()
+    pending = ""
+    emitted = 0
+    try:
+        for chunk in chunks:
+            detector.feed(chunk)
+            if detector.triggered:
+                yield get_crisis_response(detector.keywords_found)
+                return
+            pending += chunk
+            ready = detector.safe_length - emitted
+            if ready > 0:
+                yield pending[:ready]
+                pending = pending[ready:]
+                emitted += ready
+        if pending:
+            yield pending
+    finally:
+        close = getattr(chunks, "close", None)
+        if close:
+            close()
+
 def get_crisis_response(keywords):
     """
     Genera una respuesta de protocolo de crisis basada en las palabras clave detectadas
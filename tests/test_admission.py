@@ -0,0 +1,110 @@
+import pytest
+from src.fastchat.admission import AdmissionController, AdmissionRejected
+from src.fastchat.priority import CRISIS_LANE
+
+class FakeClock:
+    """Reloj controlado por la prueba"""
+
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self):
+        return self.now
+
+    def advance(self, seconds):
+        self.now += seconds
+
+def make_controller(clock, **options):
+    settings = {"min_limit": 1, "max_limit": 8, "initial_limit": 2, "target_token_latency": 0.2, "clock": clock}
+    settings.update(options)
+    return AdmissionController(**settings)
+
+def generate(controller, clock, tokens, seconds_per_token, prefill=0.0, session_id="s"):
+    """Simula una generación: prefill, primer token y el resto a seconds_per_token"""
+    slot = controller.acquire(session_id)
+    clock.advance(prefill)
+    slot.first_token_at = clock()
+    clock.advance(seconds_per_token * (tokens - 1))
+    slot.tokens = tokens
+    controller.release(slot)
+
+def test_fast_generations_raise_the_limit_additively():
+    clock = FakeClock()
+    controller = make_controller(clock)
+    generate(controller, clock, 20, 0.05)
+    assert controller._limit == 2.5
+    generate(controller, clock, 20, 0.05)
+    generate(controller, clock, 20, 0.05)
+    assert controller.limit == 3
+
+def test_slow_generations_cut_the_limit_once_per_round():
+    clock = FakeClock()
+    controller = make_controller(clock, initial_limit=4, decrease_factor=0.5)
+    first = controller.acquire("a")
+    second = controller.acquire("b")
+    for slot in (first, second):
+        slot.first_token_at = clock()
+        slot.tokens = 11
+    clock.advance(5.0)
+    controller.release(first)
+    controller.release(second)
+    # La segunda empezó antes de la reducción: no vuelve a reducir
+    assert controller.limit == 2
+    generate(controller, clock, 11, 0.5)
+    assert controller.limit == 1
+
+def test_queueing_and_prefill_do_not_count_as_token_latency():
+    clock = FakeClock()
+    controller = make_controller(clock)
+    generate(controller, clock, 11, 0.1, prefill=30.0)
+    assert abs(controller.token_latency - 0.1) < 1e-9
+    assert controller._limit > 2
+
+def test_replies_without_two_tokens_do_not_move_the_limit():
+    clock = FakeClock()
+    controller = make_controller(clock)
+    generate(controller, clock, 1, 0.0, prefill=10.0)
+    slot = controller.acquire("s")
+    clock.advance(10.0)
+    controller.release(slot)
+    assert controller._limit == 2
+    assert controller.token_latency is None
+
+def test_idle_server_does_not_rate_limit_a_session():
+    clock = FakeClock()
+    controller = make_controller(clock, initial_limit=8, max_wait=0.0)
+    controller.scheduler.burst = 1
+    for _ in range(5):
+        slot = controller.acquire("rápido")
+        assert slot.waited == 0.0
+        controller.release(slot)
+        clock.advance(0.1)
+
+def test_full_queue_is_rejected_with_a_retry_time():
+    clock = FakeClock()
+    controller = make_controller(clock, initial_limit=1, max_limit=1, max_queue=0)
+    generate(controller, clock, 11, 0.1)
+    controller.acquire("a")
+    with pytest.raises(AdmissionRejected) as rejected:
+        controller.acquire("b")
+    assert rejected.value.position == 1
+    assert rejected.value.retry_after >= 1
+    assert len(controller.scheduler) == 0
+
+def test_queue_timeout_rejects_and_leaves_the_queue():
+    clock = FakeClock()
+    controller = make_controller(clock, initial_limit=1, max_limit=1, max_wait=0.0)
+    controller.acquire("a")
+    with pytest.raises(AdmissionRejected):
+        controller.acquire("b")
+    assert len(controller.scheduler) == 0
+    assert controller.rejected == 1
+
+def test_crisis_lane_uses_the_extra_slot_when_full():
+    clock = FakeClock()
+    controller = make_controller(clock, initial_limit=1, max_limit=1, max_wait=0.0, crisis_extra_slots=1)
+    controller.acquire("a")
+    controller.flag_session("crisis")
+    slot = controller.acquire("crisis")
+    assert slot.lane == CRISIS_LANE
+    assert slot.waited == 0.0
@@ -0,0 +1,51 @@
+from src.fastchat.priority import PriorityScheduler, CRISIS_LANE, NORMAL_LANE
+
+def drain(scheduler, now):
+    """Saca los tickets en el orden en que recibirían plaza"""
+    order = []
+    while len(scheduler):
+        ticket = scheduler.peek(now)
+        if ticket is None:
+            break
+        scheduler.pop(ticket, now)
+        order.append(ticket)
+    return order
+
+def test_sessions_take_turns():
+    scheduler = PriorityScheduler(rate=0.0, burst=10)
+    tickets = [scheduler.make_ticket(session, now=0.0) for session in ("a", "a", "a", "b", "c")]
+    positions = [scheduler.push(ticket) for ticket in tickets]
+    # b y c no esperan a que a vacíe su cola
+    assert positions == [1, 2, 3, 2, 3]
+    assert [ticket.session_id for ticket in drain(scheduler, 0.0)] == ["a", "b", "c", "a", "a"]
+
+def test_crisis_lane_goes_first():
+    scheduler = PriorityScheduler()
+    normal = scheduler.make_ticket("a", now=0.0)
+    scheduler.push(normal)
+    scheduler.flag_session("b", now=0.0)
+    crisis = scheduler.make_ticket("b", now=1.0)
+    assert crisis.lane == CRISIS_LANE
+    assert scheduler.push(crisis) == 1
+    assert drain(scheduler, 1.0) == [crisis, normal]
+
+def test_crisis_flag_expires():
+    scheduler = PriorityScheduler(flag_ttl=60.0)
+    scheduler.flag_session("b", now=0.0)
+    assert scheduler.make_ticket("b", now=30.0).lane == CRISIS_LANE
+    assert scheduler.make_ticket("b", now=61.0).lane == NORMAL_LANE
+
+def test_rate_limited_session_does_not_block_others():
+    scheduler = PriorityScheduler(rate=0.1, burst=1)
+    spent = scheduler.make_ticket("a", now=0.0)
+    scheduler.consume(spent, 0.0)
+    waiting = scheduler.make_ticket("a", now=0.0)
+    other = scheduler.make_ticket("b", now=0.0)
+    scheduler.push(waiting)
+    scheduler.push(other)
+    assert scheduler.peek(1.0) is other
+    scheduler.pop(other, 1.0)
+    # Solo queda a: sin plazas libres espera a su cubo, con plazas libres entra
+    assert scheduler.peek(1.0) is None
+    assert scheduler.peek(1.0, idle=True) is waiting
+    assert scheduler.peek(10.0) is waiting
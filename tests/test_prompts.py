@@ -0,0 +1,16 @@
+from src.utils.prompts import ConversationBuilder
+
+def test_sync_only_adds_new_turns():
+    history = [["hola", "¿qué tal estás?"]]
+    builder = ConversationBuilder.from_history(history)
+    first_turn = builder.turns[0]
+    history.append(["un poco cansado", "¿quieres contarme más?"])
+    assert builder.sync(history)
+    assert [turn.user for turn in builder.turns] == ["hola", "un poco cansado"]
+    # El turno ya añadido no se vuelve a tokenizar ni a revisar
+    assert builder.turns[0] is first_turn
+
+def test_sync_rejects_a_different_history():
+    builder = ConversationBuilder.from_history([["hola", "¿qué tal estás?"]])
+    assert not builder.sync([])
+    assert not builder.sync([["otro", "chat"], ["distinto", "historial"]])
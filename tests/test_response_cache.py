@@ -0,0 +1,26 @@
+import pytest
+from src.fastchat.response_cache import cache_key
+
+def chat(**fields):
+    body = {"model": "vicuna", "messages": [{"role": "user", "content": "Hola"}], "temperature": 0.0}
+    body.update(fields)
+    return body
+
+def test_equivalent_first_turns_share_a_key():
+    assert cache_key(chat(), 0.3) == cache_key(chat(messages=[{"role": "user", "content": "  hola "}]), 0.3)
+
+def test_high_temperature_is_not_cached():
+    assert cache_key(chat(temperature=0.7), 0.3) is None
+
+# Cuerpos que controla el cliente: la petición pasa sin caché en lugar de fallar con un 500
+@pytest.mark.parametrize("body", [
+    ["no", "es", "un", "objeto"],
+    chat(temperature="hot"),
+    chat(temperature=[0.1]),
+    chat(stop=[{"a": 1}]),
+    chat(top_p={"x": 1}),
+    chat(messages=[{"role": "user", "content": 5}]),
+    chat(messages=[{"role": "user", "content": [{"type": "text", "text": 3}]}]),
+])
+def test_malformed_bodies_bypass_the_cache(body):
+    assert cache_key(body, 0.3) is None
@@ -0,0 +1,56 @@
+import pytest
+from src.utils.safety import CrisisMatcher, StreamingCrisisDetector, detect_crisis, fold_case, guard_stream
+
+# Mensajes corrientes que la búsqueda aproximada confundía con palabras clave de crisis
+FALSE_POSITIVES = [
+    ("¿Puedes contarme técnicas de relajación?", "cortarme"),
+    ("quiero contarte algo", "cortarme"),
+    ("no quiero hacerle daño a nadie", "hacerme daño"),
+    ("me gusta matarte a cosquillas", "matarme"),
+    ("quiero cortarle el pelo", "cortarme"),
+]
+
+@pytest.mark.parametrize("fuzzy", [False, True])
+@pytest.mark.parametrize("message, keyword", FALSE_POSITIVES)
+def test_common_words_are_not_crisis(message, keyword, fuzzy):
+    detected, keywords = detect_crisis(message, fuzzy=fuzzy)
+    assert not detected, f"{message!r} se detectó como {keywords}"
+    assert keyword not in keywords
+
+@pytest.mark.parametrize("message, keyword", [
+    ("pienso en el suicdio", "suicidio"),
+    ("quiero matarmeee", "matarme"),
+    ("a veces pienso en la autolesion", "autolesión"),
+    ("quiero hacerme dano", "hacerme daño"),
+])
+def test_fuzzy_still_catches_typos(message, keyword):
+    detected, keywords = detect_crisis(message, fuzzy=True)
+    assert detected and keyword in keywords
+
+def test_exact_keywords_are_detected():
+    assert detect_crisis("no quiero vivir así") == (True, ["no quiero vivir"])
+
+def test_fold_case_keeps_positions():
+    text = "İstanbul: no quiero vivir"
+    assert len(fold_case(text)) == len(text)
+    (start, end, keyword), = CrisisMatcher(["no quiero vivir"]).find_all(text)
+    assert text[start:end].lower() == keyword
+
+def test_guard_stream_keeps_text_with_expanding_lowercase():
+    chunks = ["İİİ hola, ", "İ", "qué tal ", "estás İ"]
+    assert "".join(guard_stream(iter(chunks))) == "".join(chunks)
+
+def test_rewind_rescans_rewritten_text():
+    detector = StreamingCrisisDetector(CrisisMatcher(["suicidio"]))
+    detector.feed("pienso en el sui")
+    detector.feed("xx")
+    assert not detector.triggered
+    # El texto acumulado cambia a partir de la posición 16: "pienso en el sui" + "cidio"
+    detector.rewind(16 - detector.overlap)
+    detector.feed("pienso en el sui"[detector.position:] + "cidio")
+    assert detector.keywords_found == ["suicidio"]
+
+def test_simple_search_matches_the_automaton():
+    matcher = CrisisMatcher(["he", "she", "hers", "his", "no quiero vivir"])
+    for text in ("ushers she his hers", "no quiero vivir, no quiero vivir", "nada"):
+        assert matcher._find_each(text) == matcher.scan(text)[0]
@@ -0,0 +1,33 @@
+import pytest
+from src.fastchat.safety_middleware import extract_user_message
+
+CHAT = "/v1/chat/completions"
+COMPLETIONS = "/v1/completions"
+
+def test_last_user_message():
+    body = {"messages": [{"role": "user", "content": "hola"}, {"role": "assistant", "content": "¿qué tal?"},
+                         {"role": "user", "content": "quiero hablar"}]}
+    assert extract_user_message(CHAT, body) == "quiero hablar"
+
+def test_multimodal_content_keeps_only_text_parts():
+    content = [{"type": "text", "text": "quiero"}, {"type": "image_url", "image_url": {"url": "x"}},
+               {"type": "text", "text": 3}, "suelto", {"type": "text", "text": "morir"}]
+    assert extract_user_message(CHAT, {"messages": [{"role": "user", "content": content}]}) == "quiero morir"
+
+# Cuerpos mal formados: no se revisan y FastChat responde con su propio error
+@pytest.mark.parametrize("path, body", [
+    (CHAT, {"messages": ["hola", 3, None]}),
+    (CHAT, {"messages": {"role": "user", "content": "hola"}}),
+    (CHAT, {"messages": 5}),
+    (CHAT, {"messages": [{"role": "user", "content": {"text": "hola"}}]}),
+    (CHAT, {"messages": [{"role": "user", "content": 7}]}),
+    (COMPLETIONS, {"prompt": 42}),
+    (COMPLETIONS, {"prompt": {"text": "hola"}}),
+    (COMPLETIONS, {"prompt": [1, 2, 3]}),
+])
+def test_malformed_bodies_are_not_screened(path, body):
+    assert extract_user_message(path, body) == ""
+
+def test_non_dict_items_are_skipped():
+    body = {"messages": [{"role": "user", "content": "hola"}, "basura"]}
+    assert extract_user_message(CHAT, body) == "hola"
@@ -0,0 +1,19 @@
+import pytest
+from src.fastchat.single_flight import flight_key
+
+PATH = "/v1/chat/completions"
+
+def test_identical_requests_share_a_key():
+    body = {"messages": [{"role": "user", "content": "hola"}], "temperature": 0.0}
+    assert flight_key(PATH, body, 0.3) == flight_key(PATH, dict(body, user="otra"), 0.3)
+
+def test_sampled_requests_are_not_grouped():
+    assert flight_key(PATH, {"messages": [], "temperature": 0.7}, 0.3) is None
+
+@pytest.mark.parametrize("body", [
+    ["no", "es", "un", "objeto"],
+    {"messages": [], "temperature": "hot"},
+    {"messages": [], "temperature": {"valor": 0}},
+])
+def test_malformed_bodies_are_not_grouped(body):
+    assert flight_key(PATH, body, 0.3) is None